@@ -0,0 +1,144 @@
+"""
+A local cache of the files collected from remote hosts, so that contents are
+only transferred again when a file changes between runs.
+
+Each host (and container, if any) gets its own JSON file in the directory
+configured with ``collection_cache`` in the ``[global]`` section of the
+ceph-medic configuration file. Caching is disabled when that value is not
+set. For every file the cache stores the state (inode, modification time and
+size) along with its contents::
+
+    {
+        '/etc/ceph/ceph.conf': {
+            'state': [100704475, 1492721506.1060133, 650],
+            'contents': '[global]\\nfsid = ...',
+        }
+    }
+
+The remote end compares the state of each file with the one in the cache and
+only reads (and sends back) the contents of files that have changed.
+"""
+import json
+import logging
+import os
+import tempfile
+from ceph_medic import config
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir():
+    """
+    Return the configured cache directory, or ``None`` when caching is
+    disabled or no configuration was loaded
+    """
+    try:
+        cache_dir = config.file.get_safe('global', 'collection_cache', None)
+    except RuntimeError:
+        return None
+    if not cache_dir:
+        return None
+    return os.path.abspath(os.path.expanduser(cache_dir))
+
+
+def file_state(stat_metadata):
+    """
+    The subset of the ``stat`` metadata of a file that identifies whether it
+    changed since it was last read
+    """
+    return [
+        stat_metadata.get('st_ino'),
+        stat_metadata.get('st_mtime'),
+        stat_metadata.get('st_size'),
+    ]
+
+
+class FileCache(object):
+    """
+    Holds the cached file contents of a single host, loaded from (and saved
+    to) its JSON file in ``cache_dir``
+    """
+
+    def __init__(self, cache_dir, hostname, container=None):
+        name = hostname if not container else '%s-%s' % (hostname, container)
+        name = name.replace(os.sep, '_')
+        self.path = os.path.join(cache_dir, '%s.json' % name)
+        self.files = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            logger.exception('unable to load cache file: %s, ignoring it', self.path)
+            return {}
+
+    def states(self, root):
+        """
+        Map every cached file under ``root`` to its state, as expected by
+        ``remote.functions.path_metadata``
+        """
+        prefix = root.rstrip(os.sep) + os.sep
+        return dict(
+            (path, cached['state']) for path, cached in self.files.items()
+            if path.startswith(prefix)
+        )
+
+    def update(self, root, files):
+        """
+        Fill in the contents of files the remote end reported as unchanged, and
+        replace the cached entries under ``root`` with the files just collected
+        """
+        prefix = root.rstrip(os.sep) + os.sep
+        for path in [p for p in self.files if p.startswith(prefix)]:
+            cached = self.files.pop(path)
+            if path in files and files[path].get('cached'):
+                files[path]['contents'] = cached['contents']
+
+        for path, stat_metadata in files.items():
+            if stat_metadata.get('exception') or 'contents' not in stat_metadata:
+                continue
+            self.files[path] = {
+                'state': file_state(stat_metadata),
+                'contents': stat_metadata['contents'],
+            }
+
+    def save(self):
+        """
+        Write the cache to disk, using a temporary file so that a failure never
+        leaves a partially written cache behind. Every save gets its own
+        temporary file, since collocated daemons of the same host are collected
+        (and saved) at the same time
+        """
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # other hosts might be creating it at the same time
+            if not os.path.isdir(directory):
+                logger.exception('unable to create cache directory: %s', directory)
+                return
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=directory, prefix=os.path.basename(self.path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(self.files, cache_file)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            logger.exception('unable to save cache file: %s', self.path)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def get(hostname, container=None):
+    """
+    Return the :class:`FileCache` for a host, or ``None`` if caching is not
+    enabled
+    """
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    return FileCache(cache_dir, hostname, container)
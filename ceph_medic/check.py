@@ -1,7 +1,7 @@
 import sys
 import ceph_medic
 import logging
-from ceph_medic import runner, collector
+from ceph_medic import runner, collector, snapshot, terminal, timings
 from tambo import Transport
 
 logger = logging.getLogger(__name__)
@@ -26,6 +26,16 @@ check: Run for all the configured nodes in the configuration
 
 Options:
   --ignore              Comma-separated list of errors and warnings to ignore.
+  --save-snapshot       Path to save the collected metadata to, so that checks
+                        can be run again later with --from-snapshot
+  --from-snapshot       Path to a saved snapshot to run checks against, instead
+                        of connecting to the nodes and collecting information
+  --timings             Report how long each host, and each collection phase,
+                        took to collect
+  --jsonl               Path to stream every check result to as JSON Lines,
+                        followed by a summary record, while checks run
+  --profile-checks      Report the time (and peak memory, when supported) of
+                        every check across all hosts, slowest first
 
 
 Loaded Config Path: {config_path}
@@ -56,7 +66,7 @@ Configured Nodes:
         )
 
     def main(self):
-        options = ['--ignore']
+        options = ['--ignore', '--save-snapshot', '--from-snapshot', '--timings', '--jsonl', '--profile-checks']
         config_ignores = ceph_medic.config.file.get_list('check', '--ignore')
         parser = Transport(
             self.argv, options=options,
@@ -72,23 +82,76 @@ Configured Nodes:
         if len(self.argv) < 1:
             return parser.print_help()
 
-        # populate the nodes metadata with the configured nodes
-        for daemon in ceph_medic.config.nodes.keys():
-            ceph_medic.metadata['nodes'][daemon] = []
-        for daemon, nodes in ceph_medic.config.nodes.items():
-            for node in nodes:
-                node_metadata = {'host': node['host']}
-                if 'container' in node:
-                    node_metadata['container'] = node['container']
-                ceph_medic.metadata['nodes'][daemon].append(node_metadata)
-
-        collector.collect()
-        test = runner.Runner()
-        test.ignore = ignored_codes
-        results = test.run()
+        # open the output before collecting, so that an unwritable path
+        # doesn't make all the collection go to waste
+        stream = None
+        jsonl = parser.get('--jsonl')
+        if jsonl:
+            try:
+                stream = open(jsonl, 'w')
+            except (IOError, OSError) as error:
+                terminal.error('unable to write JSON Lines to %s: %s' % (jsonl, error))
+                sys.exit(1)
+        save_snapshot = parser.get('--save-snapshot')
+        if save_snapshot:
+            try:
+                snapshot.check_writable(save_snapshot)
+            except RuntimeError as error:
+                terminal.error(str(error))
+                sys.exit(1)
+
+        try:
+            results = self.run(parser, ignored_codes, stream)
+        finally:
+            if stream is not None:
+                stream.close()
         runner.report(results)
+        if parser.has('--profile-checks'):
+            runner.report_profile(results)
+        if parser.has('--timings'):
+            timings.report(timings.summarize())
+        terminal.flush()
         #XXX might want to make this configurable to not bark on warnings for
         # example, setting forcefully for now, but the results object doesn't
         # make a distinction between error and warning (!)
         if results.errors or results.warnings:
             sys.exit(1)
+
+    def run(self, parser, ignored_codes, stream=None):
+        """
+        Collect (or restore) the metadata and run all the checks on it,
+        streaming every result to ``stream`` if one is passed in
+        """
+        from_snapshot = parser.get('--from-snapshot')
+        if from_snapshot:
+            # everything was collected already, no need to connect anywhere
+            snapshot.restore(from_snapshot)
+        else:
+            # populate the nodes metadata with the configured nodes
+            for daemon in ceph_medic.config.nodes.keys():
+                ceph_medic.metadata['nodes'][daemon] = []
+            for daemon, nodes in ceph_medic.config.nodes.items():
+                for node in nodes:
+                    node_metadata = {'host': node['host']}
+                    if 'container' in node:
+                        node_metadata['container'] = node['container']
+                    ceph_medic.metadata['nodes'][daemon].append(node_metadata)
+
+            collector.collect()
+
+        save_snapshot = parser.get('--save-snapshot')
+        if save_snapshot:
+            try:
+                snapshot.save(save_snapshot)
+            except RuntimeError as error:
+                # the checks can still run on what was collected
+                terminal.error(str(error))
+
+        test = runner.Runner()
+        test.ignore = ignored_codes
+        test.profile = parser.has('--profile-checks')
+        test.stream = stream
+        results = test.run()
+        if stream is not None:
+            runner.write_record(stream, runner.summary(results))
+        return results
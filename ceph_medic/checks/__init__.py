@@ -1 +1 @@
-from . import osds, mons, clients, rgws, mdss, common, mgrs, cluster  # noqa
+from . import registry, osds, mons, clients, rgws, mdss, common, mgrs, cluster  # noqa
@@ -1,10 +1,12 @@
 from ceph_medic import metadata
+from ceph_medic.checks.registry import register
 
 
 #
 # Error checks
 #
 
+@register('ECLS1')
 def check_osds_exist():
     code = 'ECLS1'
     msg = 'There are no OSDs available'
@@ -13,6 +15,7 @@ def check_osds_exist():
         return code, msg
 
 
+@register('ECLS2')
 def check_nearfull():
     """
     Checks if the osd capacity is at nearfull
@@ -25,3 +28,35 @@ def check_nearfull():
         return
     if osd_map.get('nearfull'):
         return code, msg
+
+
+#
+# Warning checks
+#
+
+@register('WOSD4')
+def check_reasonable_ratios():
+    """
+    The OSD map is the same for the whole cluster, so ratios are verified once
+    from the cluster-wide ``osd dump``. The code retains its ``WOSD`` prefix so
+    that existing ``--ignore`` settings continue to work.
+    """
+    code = 'WOSD4'
+    msg = 'Ratios have been modified to unreasonable values: %s'
+    unreasonable_ratios = []
+    reasonable_ratios = {
+      "backfillfull_ratio": 0.9,
+      "nearfull_ratio": 0.85,
+      "full_ratio": 0.95
+    }
+
+    dump = metadata['cluster'].get('osd_dump', {})
+    for name, value in reasonable_ratios.items():
+        ratio = dump.get(name)
+        if not ratio:
+            continue
+        if ratio != reasonable_ratios[name]:
+            unreasonable_ratios.append(name)
+    if unreasonable_ratios:
+        msg = msg % ', '.join(sorted(unreasonable_ratios))
+        return code, msg
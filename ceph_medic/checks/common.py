@@ -1,67 +1,27 @@
-from collections import Counter
-from ceph_medic import metadata, daemon_types
-from ceph_medic.util import configuration, str_to_int
+from ceph_medic import metadata
+from ceph_medic.util import str_to_int
+from ceph_medic.checks import index
+from ceph_medic.checks.index import get_fsid
+from ceph_medic.checks.registry import register, map_reduce, format_groups
 
 
 #
 # Utilities
 #
 
-def get_fsid(data):
-    # FIXME: might want to load this thing into ConfigParser so that we can fetch
-    # information. ceph-deploy is a good example on how to do this. See:
-    # https://github.com/ceph/ceph-deploy/blob/master/ceph_deploy/conf/ceph.py
-    cluster_path = '/etc/ceph/%s.conf' % metadata['cluster_name']
-    try:
-        contents = data['paths']['/etc/ceph']['files'][cluster_path]['contents']
-    except KeyError:
-        return ''
-    conf = configuration.load_string(contents)
-    try:
-        return conf.get_safe('global', 'fsid', '')
-    except IndexError:
-        return ''
-
-
 def get_common_fsid():
     """
     Determine what is the most common Cluster FSID. If all of them are the same
     then we are fine, but if there is a mix, we need some base to compare to.
     """
-    all_fsids = []
-
-    for daemon_type in daemon_types:
-        for node_metadata in metadata[daemon_type].values():
-            fsids = get_host_fsids(node_metadata)
-            all_fsids.extend(fsids)
-
-    try:
-        common_fsid = Counter(all_fsids).most_common()[0][0]
-    except IndexError:
-        return ''
-    return common_fsid
-
-
-def get_host_fsids(node_metadata):
-    """
-    Return all the cluster FSIDs found for each socket in a host
-    """
-    all_fsids = []
-    for socket_metadata in node_metadata['ceph']['sockets'].values():
-        config = socket_metadata.get('config', {})
-        if not config:
-            continue
-        fsid = config.get('fsid')
-        if not fsid:
-            continue
-        all_fsids.append(fsid)
-    return all_fsids
+    return index.get(metadata).common_fsid
 
 
 #
 # Warning checks
 #
 
+@register('WCOM1')
 def check_colocated_running_mons_osds(host, data):
     code = 'WCOM1'
     msg = 'collocated OSDs with MONs running: %s'
@@ -83,6 +43,7 @@ def check_colocated_running_mons_osds(host, data):
 #
 
 
+@register('ECOM1')
 def check_ceph_conf_exists(host, data):
     cluster_conf = '/etc/ceph/%s.conf' % metadata['cluster_name']
 
@@ -92,11 +53,13 @@ def check_ceph_conf_exists(host, data):
         return 'ECOM1', msg
 
 
+@register('ECOM2')
 def check_ceph_executable_exists(host, data):
     if data['ceph']['installed'] is False:
         return 'ECOM2', 'ceph executable was not found in common paths when running `which`'
 
 
+@register('ECOM3')
 def check_var_lib_ceph_dir(host, data):
     code = 'ECOM3'
     exception = data['paths']['/var/lib/ceph']['dirs']['/var/lib/ceph']['exception']
@@ -105,6 +68,7 @@ def check_var_lib_ceph_dir(host, data):
         return code, msg
 
 
+@register('ECOM4')
 def check_var_lib_ceph_permissions(host, data):
     code = 'ECOM4'
     group = data['paths']['/var/lib/ceph']['dirs']['/var/lib/ceph']['group']
@@ -114,45 +78,33 @@ def check_var_lib_ceph_permissions(host, data):
         return code, msg
 
 
-def check_cluster_fsid(host, data):
-    code = 'ECOM5'
-    msg = 'fsid "%s" is different than host(s): %s'
-    mismatched_hosts = []
+def conf_fsid(host, data):
+    return get_fsid(data)
 
-    current_fsid = get_fsid(data)
 
-    # no fsid exists for the current host as defined in ceph.conf, let other
-    # checks note about this instead of reporting an empty FSID
-    if not current_fsid:
-        return
+@map_reduce('ECOM5', conf_fsid)
+def check_cluster_fsid(groups):
+    code = 'ECOM5'
+    msg = 'fsid defined in ceph.conf differs between hosts:%s'
+    # hosts without an fsid are not grouped, other checks note about them
+    # instead of reporting an empty FSID
+    if len(groups) > 1:
+        return code, msg % format_groups(groups)
 
-    for daemon, hosts in metadata['nodes'].items():
-        for host in hosts:
-            hostname = host['host']
-            host_fsid = get_fsid(metadata[daemon][hostname])
-            if host_fsid and current_fsid != host_fsid:
-                mismatched_hosts.append(hostname)
 
-    if mismatched_hosts:
-        return code, msg % (current_fsid, ','.join(mismatched_hosts))
+def installed_version(host, data):
+    return data['ceph']['version']
 
 
-def check_ceph_version_parity(host, data):
+@map_reduce('ECOM6', installed_version)
+def check_ceph_version_parity(groups):
     code = 'ECOM6'
-    msg = '(installed) Ceph version "%s" is different than host(s): %s'
-    mismatched_hosts = []
-    host_version = data['ceph']['version']
-    for daemon, hosts in metadata['nodes'].items():
-        for host in hosts:
-            hostname = host['host']
-            version = metadata[daemon][hostname]['ceph']['version']
-            if host_version != version:
-                mismatched_hosts.append(hostname)
-
-    if mismatched_hosts:
-        return code, msg % (host_version, ','.join(mismatched_hosts))
+    msg = '(installed) Ceph version differs between hosts:%s'
+    if len(groups) > 1:
+        return code, msg % format_groups(groups)
 
 
+@register('ECOM7')
 def check_ceph_socket_and_installed_version_parity(host, data):
     code = 'ECOM7'
     msg = '(installed) Ceph version "%s" is different than version from running socket(s): %s'
@@ -160,7 +112,8 @@ def check_ceph_socket_and_installed_version_parity(host, data):
     host_version = data['ceph']['version']
     sockets = data['ceph']['sockets']
     for socket, socket_data in sockets.items():
-        socket_version = socket_data['version'].get('version')
+        # sockets that could not be queried have no version at all
+        socket_version = (socket_data.get('version') or {}).get('version')
         if socket_version and socket_version not in host_version:
             mismatched_sockets.append("%s:%s" % (socket, socket_version))
 
@@ -168,6 +121,7 @@ def check_ceph_socket_and_installed_version_parity(host, data):
         return code, msg % (host_version, ','.join(mismatched_sockets))
 
 
+@register('WCOM7', config_keys=['rgw_num_rados_handles'])
 def check_rgw_num_rados_handles(host, data):
     """
     Although this is an RGW setting, the way Ceph handles configurations can
@@ -193,6 +147,7 @@ def check_rgw_num_rados_handles(host, data):
         return code, msg % ','.join(failed)
 
 
+@register('ECOM8')
 def check_fsid_exists(host, data):
     code = 'ECOM8'
     msg = "'fsid' is missing in the ceph configuration"
@@ -202,6 +157,7 @@ def check_fsid_exists(host, data):
         return code, msg
 
 
+@register('ECOM9', config_keys=['fsid'])
 def check_fsid_per_daemon(host, data):
     """
     In certain deployments types (hi rook!) the FSID will not be present in a
@@ -235,6 +191,7 @@ def check_fsid_per_daemon(host, data):
         return code, msg
 
 
+@register('ECOM10')
 def check_multiple_running_mons(host, data):
     code = 'ECOM10'
     msg = 'multiple running mons found: %s'
@@ -0,0 +1,194 @@
+"""
+Checks that compare a host against the rest of the cluster (like the most
+common fsid of running daemons) would otherwise go through all the collected
+metadata for every single host. Instead, the runner creates a ``ClusterIndex``
+once, after collection, and those checks do lookups against it.
+
+Utilities that extract information from the metadata of a single host live
+here as well, so that both the index and the checks can use them.
+"""
+import hashlib
+from collections import Counter
+from ceph_medic import metadata, daemon_types
+from ceph_medic.util import configuration
+
+
+#
+# Utilities
+#
+
+def get_ceph_conf(data):
+    path = '/etc/ceph/%s.conf' % metadata['cluster_name']
+    try:
+        contents = data['paths']['/etc/ceph']['files'][path]['contents']
+    except KeyError:
+        return None
+    return configuration.load_string_cached(contents)
+
+
+def get_fsid(data):
+    # FIXME: might want to load this thing into ConfigParser so that we can fetch
+    # information. ceph-deploy is a good example on how to do this. See:
+    # https://github.com/ceph/ceph-deploy/blob/master/ceph_deploy/conf/ceph.py
+    return get_conf_fsid(get_ceph_conf(data))
+
+
+def get_conf_fsid(conf):
+    if conf is None:
+        return ''
+    try:
+        return conf.get_safe('global', 'fsid', '')
+    except IndexError:
+        return ''
+
+
+def get_host_fsids(node_metadata):
+    """
+    Return all the cluster FSIDs found for each socket in a host
+    """
+    all_fsids = []
+    for socket_metadata in node_metadata['ceph']['sockets'].values():
+        config = socket_metadata.get('config', {})
+        if not config:
+            continue
+        fsid = config.get('fsid')
+        if not fsid:
+            continue
+        all_fsids.append(fsid)
+    return all_fsids
+
+
+def get_mon_keyring(data):
+    """
+    Metadata of the first keyring found in a monitor directory, or ``None``
+    """
+    files = data['paths']['/var/lib/ceph']['files']
+    for path, file_metadata in files.items():
+        if path.startswith('/var/lib/ceph/mon/') and path.endswith('keyring'):
+            return file_metadata
+
+
+def get_secret(data):
+    """
+    keyring files look like::
+
+    [mon.]
+        key = AQBvaBFZAAAAABAA9VHgwCg3rWn8fMaX8KL01A==
+            caps mon = "allow *"
+
+    Fetch that keyring file and extract the actual key, no spaces.
+
+    .. warning:: If multiple mon dirs exist, this utility will pick the first
+    one it finds. There are checks that will complain about multiple mon dirs
+    """
+    keyring = get_mon_keyring(data)
+    if keyring is None:
+        return None
+    contents = keyring.get('contents')
+    if contents is None:
+        # contents were not captured (e.g. the file was too large)
+        return ''
+    conf = configuration.load_string_cached(contents)
+    try:
+        return conf.get_safe('mon.', 'key', '').split('\n')[0]
+    except IndexError:
+        # is it really possible to get a keyring file that doesn't
+        # have a monitor secret?
+        return ''
+
+
+def get_secret_digest(data):
+    """
+    The sha256 digest of the monitor secret. Keyring contents are not
+    collected from monitors, so the digest comes from the remote end (in
+    ``key_digests``), but it is computed from the secret itself when the
+    contents are available (e.g. snapshots taken before that). Returns
+    ``None`` when there is no secret
+    """
+    keyring = get_mon_keyring(data)
+    if keyring is None:
+        return None
+    if 'key_digests' in keyring:
+        return keyring['key_digests'].get('mon.')
+    secret = get_secret(data)
+    if secret:
+        return u'sha256:%s' % hashlib.sha256(secret.encode('utf-8')).hexdigest()
+
+
+#
+# Index
+#
+
+class ClusterIndex(object):
+    """
+    Aggregates of the whole cluster. Each one is computed with a single pass
+    over the metadata the first time it is needed, and then reused:
+
+    * ``socket_fsids``: fsid from running sockets -> count
+
+    .. note:: Comparisons of a single value per host (like the fsid in
+              ceph.conf, or the installed version) are better written as
+              map/reduce checks (see ``ceph_medic.checks.registry``)
+    """
+
+    def __init__(self, _metadata=None):
+        self.metadata = _metadata if _metadata is not None else metadata
+        self._aggregates = {}
+
+    def aggregate(self, name, build):
+        try:
+            return self._aggregates[name]
+        except KeyError:
+            value = self._aggregates[name] = build()
+            return value
+
+    @property
+    def socket_fsids(self):
+        def build():
+            fsids = Counter()
+            for daemon_type in daemon_types:
+                for node_metadata in self.metadata.get(daemon_type, {}).values():
+                    fsids.update(get_host_fsids(node_metadata))
+            return fsids
+        return self.aggregate('socket_fsids', build)
+
+    @property
+    def common_fsid(self):
+        """
+        The most common cluster FSID reported by running sockets. If all of
+        them are the same then we are fine, but if there is a mix, we need
+        some base to compare to.
+        """
+        try:
+            return self.socket_fsids.most_common()[0][0]
+        except IndexError:
+            return ''
+
+
+_index = None
+
+
+def build(_metadata=None):
+    """
+    Create the index for the collected metadata, and keep it around for
+    checks to use until ``clear()`` is called.
+    """
+    global _index
+    _index = ClusterIndex(_metadata)
+    return _index
+
+
+def get(_metadata=None):
+    """
+    Return the index built for ``_metadata``. When there isn't one (e.g.
+    a check being called on its own) an index is built just for this call.
+    """
+    _metadata = _metadata if _metadata is not None else metadata
+    if _index is not None and _index.metadata is _metadata:
+        return _index
+    return ClusterIndex(_metadata)
+
+
+def clear():
+    global _index
+    _index = None
@@ -1,38 +1,12 @@
 from ceph_medic import metadata
-from ceph_medic.util import configuration
+from ceph_medic.checks.index import get_secret_digest
+from ceph_medic.checks.registry import register, map_reduce, format_groups
 
 #
 # Utilities
 #
 
 
-def get_secret(data):
-    """
-    keyring files look like::
-
-    [mon.]
-        key = AQBvaBFZAAAAABAA9VHgwCg3rWn8fMaX8KL01A==
-            caps mon = "allow *"
-
-    Fetch that keyring file and extract the actual key, no spaces.
-
-    .. warning:: If multiple mon dirs exist, this utility will pick the first
-    one it finds. There are checks that will complain about multiple mon dirs
-    """
-    file_paths = data['paths']['/var/lib/ceph']['files'].keys()
-    _path = data['paths']['/var/lib/ceph']['files']
-    for _file in file_paths:
-        if _file.startswith('/var/lib/ceph/mon/') and _file.endswith('keyring'):
-            contents = _path[_file]['contents']
-            conf = configuration.load_string(contents)
-            try:
-                return conf.get_safe('mon.', 'key', '').split('\n')[0]
-            except IndexError:
-                # is it really possible to get a keyring file that doesn't
-                # have a monitor secret?
-                return ''
-
-
 def get_monitor_dirs(dirs):
     """
     Find all the /var/lib/ceph/mon/* directories. This is a bit tricky because
@@ -80,32 +54,30 @@ def get_osd_dirs(dirs):
 #
 
 
-def check_mon_secret(host, data):
-    code = 'EMON1'
-    msg = 'secret key "%s" is different than host(s): %s'
-    mismatched_hosts = []
-
-    current_secret = get_secret(data)
-    if not current_secret:
-        # there is no file for the current host, so we can't compare
-        return
+def mon_secret_digest(host, data):
+    """
+    Monitor secrets are compared by digest, which is computed on the remote
+    end so that secrets are never collected (or exposed in the output)
+    """
+    digest = get_secret_digest(data)
+    if digest:
+        return digest.split(':')[-1][:12]
 
-    for host, host_data in metadata['mons'].items():
-        host_secret = get_secret(host_data)
-        if not host_secret:
-            # cannot compare with another host that may not have the secret
-            continue
-        if current_secret != host_secret:
-            mismatched_hosts.append(host)
 
-    if mismatched_hosts:
-        return code, msg % (current_secret, ','.join(mismatched_hosts))
+@map_reduce('EMON1', mon_secret_digest)
+def check_mon_secret(groups):
+    code = 'EMON1'
+    msg = 'secret key differs between hosts (by sha256 digest):%s'
+    # hosts without a keyring are not grouped, there is nothing to compare
+    if len(groups) > 1:
+        return code, msg % format_groups(groups)
 
 #
 # Warning Checks
 #
 
 
+@register('WMON1')
 def check_multiple_mon_dirs(host, data):
     code = 'WMON1'
     msg = 'multiple /var/lib/ceph/mon/* dirs found: %s'
@@ -115,6 +87,7 @@ def check_multiple_mon_dirs(host, data):
         return code, msg % ','.join(monitor_dirs)
 
 
+@register('WMON2')
 def check_mon_collocated_with_osd(host, data):
     code = 'WMON2'
     msg = 'collocated OSDs found: %s'
@@ -124,6 +97,7 @@ def check_mon_collocated_with_osd(host, data):
         return code, msg % ','.join(osd_dirs)
 
 
+@register('WMON3')
 def check_mon_recommended_count(host, data):
     code = 'WMON3'
     msg = 'Recommended number of MONs (3) not met: %s'
@@ -132,6 +106,7 @@ def check_mon_recommended_count(host, data):
         return code, msg % mon_count
 
 
+@register('WMON4')
 def check_mon_count_is_odd(host, data):
     code = 'WMON4'
     msg = 'Number of MONs is not an odd number: %s'
@@ -140,6 +115,7 @@ def check_mon_count_is_odd(host, data):
         return code, msg % mon_count
 
 
+@register('WMON5')
 def check_for_single_mon(host, data):
     code = 'WMON5'
     msg = 'A single monitor was detected: %s'
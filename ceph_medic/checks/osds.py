@@ -1,5 +1,6 @@
 from ceph_medic import metadata
-from ceph_medic.util import configuration
+from ceph_medic.checks.index import get_ceph_conf
+from ceph_medic.checks.registry import register
 
 
 #
@@ -8,22 +9,13 @@ from ceph_medic.util import configuration
 
 def get_osd_ceph_fsids(data):
     fsids = []
-    for file_path in data['paths']['/var/lib/ceph']['files'].keys():
-        if "ceph_fsid" in file_path:
-            fsids.append(data['paths']['/var/lib/ceph']['files'][file_path]['contents'].strip())
+    for file_path, file_metadata in data['paths']['/var/lib/ceph']['files'].items():
+        if "ceph_fsid" in file_path and 'contents' in file_metadata:
+            fsids.append(file_metadata['contents'].strip())
     return set(fsids)
 
 
-# XXX move out to a central utility module for other checks
-def get_ceph_conf(data):
-    path = '/etc/ceph/%s.conf' % metadata['cluster_name']
-    try:
-        conf_file = data['paths']['/etc/ceph']['files'][path]
-    except KeyError:
-        return None
-    return configuration.load_string(conf_file['contents'])
-
-
+@register('WOSD1')
 def check_osd_ceph_fsid(host, data):
     code = 'WOSD1'
     msg = "Multiple ceph_fsid values found: %s"
@@ -34,6 +26,7 @@ def check_osd_ceph_fsid(host, data):
         return code, msg % ", ".join(current_fsids)
 
 
+@register('WOSD2')
 def check_min_pool_size(host, data):
     code = 'WOSD2'
     msg = 'osd default pool min_size is set to 1, can potentially lose data'
@@ -45,6 +38,7 @@ def check_min_pool_size(host, data):
         return code, msg
 
 
+@register('WOSD3')
 def check_min_osd_nodes(host, data):
     code = 'WOSD3'
     msg = 'OSD nodes might not be enough for a healthy cluster (%s needed, %s found)'
@@ -58,24 +52,3 @@ def check_min_osd_nodes(host, data):
     if magical_number > osd_nodes:
         return code, msg % (magical_number, osd_nodes)
 
-
-def check_reasonable_ratios(host, data):
-    code = 'WOSD4'
-    msg = 'Ratios have been modified to unreasonable values: %s'
-    unreasonable_ratios = []
-    reasonable_ratios = {
-      "backfillfull_ratio": 0.9,
-      "nearfull_ratio": 0.85,
-      "full_ratio": 0.95
-    }
-
-    dump = data['ceph']['osd'].get('dump', {})
-    for name, value in reasonable_ratios.items():
-        ratio = dump.get(name)
-        if not ratio:
-            continue
-        if ratio != reasonable_ratios[name]:
-            unreasonable_ratios.append(name)
-    if unreasonable_ratios:
-        msg = msg % ', '.join(sorted(unreasonable_ratios))
-        return code, msg
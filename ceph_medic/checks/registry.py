@@ -0,0 +1,155 @@
+"""
+All checks register themselves here when their module is imported, so that
+the runner doesn't need to introspect modules looking for functions, and can
+leave out ignored codes before any check runs::
+
+    @register('ECOM1')
+    def check_ceph_conf_exists(host, data):
+        ...
+
+The scope of a check is the name of the module that defines it (``common``,
+``mons``, ``osds``, ``cluster``, etc...), and the severity is taken from the
+first letter of the code (``E`` for errors, ``W`` for warnings), unless they
+are passed in explicitly.
+
+Checks that compare hosts with each other are split in two: a *map* function
+that runs for every host in the scope and extracts a small key from it, and
+a *reduce* check that runs once for the whole cluster with the hosts grouped
+by their key (hosts with an empty key are left out)::
+
+    def ceph_version(host, data):
+        return data['ceph']['version']
+
+    @map_reduce('ECOM6', ceph_version)
+    def check_ceph_version_parity(groups):
+        if len(groups) > 1:
+            ...
+
+Checks that read the configuration of running daemons (from their admin
+sockets) declare the keys they use, so that only those are collected (see
+``config_keys()``)::
+
+    @register('WCOM7', config_keys=['rgw_num_rados_handles'])
+    def check_rgw_num_rados_handles(host, data):
+        ...
+"""
+from collections import OrderedDict
+
+severities = {'E': 'error', 'W': 'warning'}
+
+# scope -> list of registered checks, in the order they were defined
+checks = OrderedDict()
+
+
+class Check(object):
+
+    def __init__(self, function, code, severity, scope, mapper=None, config_keys=None):
+        self.function = function
+        self.code = code
+        self.severity = severity
+        self.scope = scope
+        self.map = mapper
+        self.config_keys = tuple(config_keys or ())
+
+    @property
+    def is_reduce(self):
+        return self.map is not None
+
+    @property
+    def name(self):
+        return self.function.__name__
+
+    def __call__(self, *args):
+        return self.function(*args)
+
+    def __repr__(self):
+        return '<Check %s: %s (%s)>' % (self.code, self.name, self.scope)
+
+
+def register(code, severity=None, scope=None, mapper=None, config_keys=None):
+    """
+    Decorator to register a check function with its code, and the daemon
+    configuration keys it reads (if any). The function is returned untouched
+    so that it can still be called directly.
+    """
+    def decorator(function):
+        check = Check(
+            function,
+            code,
+            severity or severities.get(code[:1], 'error'),
+            scope or function.__module__.split('.')[-1],
+            mapper=mapper,
+            config_keys=config_keys,
+        )
+        checks.setdefault(check.scope, []).append(check)
+        return function
+    return decorator
+
+
+def map_reduce(code, mapper, severity=None, scope=None, config_keys=None):
+    """
+    Decorator to register a reduce check, with the ``mapper`` function that
+    extracts the key of every host in ``scope``
+    """
+    return register(
+        code, severity=severity, scope=scope, mapper=mapper, config_keys=config_keys)
+
+
+def get_checks(*scopes, **kw):
+    """
+    Return the registered (per host, or per cluster) checks for all the
+    ``scopes``, leaving out the ones with a code in ``ignore``
+    """
+    ignore = kw.get('ignore') or []
+    return [
+        check for scope in scopes for check in checks.get(scope, [])
+        if check.code not in ignore and not check.is_reduce
+    ]
+
+
+def get_reducers(*scopes, **kw):
+    """
+    Return the reduce checks whose map applies to hosts in ``scopes`` (or all
+    of them when no scope is given), leaving out the ones with a code in
+    ``ignore``
+    """
+    ignore = kw.get('ignore') or []
+    scopes = scopes or list(checks)
+    return [
+        check for scope in scopes for check in checks.get(scope, [])
+        if check.code not in ignore and check.is_reduce
+    ]
+
+
+def count(*scopes):
+    """
+    Number of per host (or per cluster) checks registered for ``scopes``
+    """
+    return len([
+        check for scope in scopes for check in checks.get(scope, [])
+        if not check.is_reduce
+    ])
+
+
+def count_reducers():
+    return len(get_reducers())
+
+
+def config_keys():
+    """
+    All the daemon configuration keys that registered checks read, sorted
+    """
+    return sorted(set(
+        key for scope_checks in checks.values()
+        for check in scope_checks for key in check.config_keys
+    ))
+
+
+def format_groups(groups):
+    """
+    Lines listing the hosts for every key of a reduce check, to be appended
+    to its message
+    """
+    return ''.join(
+        '\n    %s: %s' % (key, ','.join(hosts)) for key, hosts in groups.items()
+    )
@@ -2,17 +2,60 @@
 Collect remote information on Ceph daemons, store everything in memory and make
 it available as a global part of the module so that other checks can consume it
 """
-from ceph_medic import metadata, remote, terminal
+from ceph_medic import cache, checks, config, connection, metadata, remote, terminal
 from ceph_medic.terminal import loader
 from ceph_medic.connection import get_connection
+from collections import Counter
 from execnet.gateway_bootstrap import HostNotFound
+from multiprocessing.pool import ThreadPool
+from contextlib import contextmanager
 import logging
+import threading
+import time
 
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_COLLECTION_WORKERS = 10
 
-def collect_paths(conn):
+# seconds allowed for each command run on a remote node
+COMMAND_TIMEOUT = 60
+
+# number of admin sockets queried at the same time on a remote node
+SOCKET_WORKERS = 8
+
+# Limits what files get their contents captured: only files with names that
+# checks actually read, and never more than ``max_bytes``. Any other file gets
+# a digest of its contents instead. Keys in monitor keyrings are only compared
+# across hosts, so their digests are enough and the secrets stay on the remote
+# end
+CAPTURE_POLICY = {
+    'include': ['keyring', '*.keyring', 'ceph_fsid', '*.conf'],
+    'secrets': ['/var/lib/ceph/mon/*/keyring'],
+    'max_bytes': 256 * 1024,
+}
+
+# guards writes to the shared ``ceph_medic.metadata`` from collection threads
+metadata_lock = threading.Lock()
+# ensures cluster-wide information is only requested from a single monitor
+cluster_lock = threading.Lock()
+
+
+@contextmanager
+def timed(timings, name):
+    """
+    Record how long the wrapped block took, in seconds, as ``timings[name]``.
+    Does nothing if ``timings`` is ``None``
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = time.time() - start
+
+
+def collect_paths(conn, file_cache=None, timings=None, remote_module=None):
     """
     Gather all the interesting paths from the remote system, stat them, and
     capture contents when needed.
@@ -71,12 +114,28 @@ def collect_paths(conn):
               be a single line with possible line breaks (if any). For reading and
               parsing that key on each line a split must be done on the line break.
 
+    Contents are only captured for files allowed by ``CAPTURE_POLICY``, any
+    other file (or one that is binary or too large) gets a ``digest`` key with
+    the sha256 of its contents and a ``contents_skipped`` key with the reason.
+    Monitor keyrings get a ``key_digests`` key instead of their contents, with
+    the sha256 of each key in them.
+
+    When a ``file_cache`` (see :mod:`ceph_medic.cache`) is passed in, the
+    contents of files that haven't changed since the last run are not sent
+    back from the remote end, but reused from the cache.
+
+    If ``timings`` is passed in, the time spent on each path is recorded in
+    it, as ``paths:<path>``.
+
+    ``remote_module`` is the module returned by ``conn.import_module()``, see
+    :func:`get_node_metadata` for why it is preferred over
+    ``conn.remote_module``.
     """
     path_metadata = {}
     paths = {
-        "/etc/ceph": {'get_contents': True},
+        "/etc/ceph": {'get_contents': CAPTURE_POLICY},
         "/var/lib/ceph": {
-            'get_contents': True,
+            'get_contents': CAPTURE_POLICY,
             'skip_files': ['activate.monmap', 'superblock'],
             'skip_dirs': ['tmp', 'current', 'store.db']
         },
@@ -85,44 +144,51 @@ def collect_paths(conn):
     for p, kw in paths.items():
         # Collect metadata about the files and dirs for the given path and assign
         # it back to the path_metadata for the current node
-        path_metadata[p] = get_path_metadata(conn, p, **kw)
+        if file_cache is not None and kw['get_contents']:
+            kw['cached'] = file_cache.states(p)
+        with timed(timings, 'paths:%s' % p):
+            path_metadata[p] = get_path_metadata(conn, p, remote_module=remote_module, **kw)
+        if file_cache is not None and kw['get_contents']:
+            file_cache.update(p, path_metadata[p]['files'])
+    if file_cache is not None:
+        file_cache.save()
     return path_metadata
 
 
-def get_path_metadata(conn, path, **kw):
-    # generate the tree
-    tree = conn.remote_module.path_tree(
+def get_path_metadata(conn, path, remote_module=None, **kw):
+    """
+    Walk, stat, and optionally read the contents of a path tree with a single
+    remote call, so that the number of round trips does not depend on the
+    number of files and directories in the tree.
+    """
+    if remote_module is None:
+        remote_module = conn.remote_module
+    return remote_module.path_metadata(
         path,
         kw.get('skip_dirs'),
         kw.get('skip_files'),
-        kw.get('get_contents')
+        kw.get('get_contents'),
+        kw.get('cached')
     )
 
-    files = {}
-    dirs = {}
-
-    for i in tree['files']:
-        files[i] = conn.remote_module.stat_path(i, None, None, kw.get('get_contents'))
-    for i in tree['dirs']:
-        dirs[i] = conn.remote_module.stat_path(i, None, None, False)
 
-    # actual root path
-    dirs[path] = conn.remote_module.stat_path(path, None, None, False)
-
-    return {'dirs': dirs, 'files': files}
-
-
-def get_node_metadata(conn, hostname, cluster_nodes):
+def get_node_metadata(conn, hostname, cluster_nodes, container=None, job=None):
     # "import" the remote functions so that remote calls using the
-    # functions can be executed
-    conn.import_module(remote.functions)
+    # functions can be executed. Nodes on the same host share a pooled
+    # connection, and every import replaces ``conn.remote_module`` with a new
+    # channel, so the one returned here is kept and passed down instead
+    remote_module = conn.import_module(remote.functions)
 
-    node_metadata = {'ceph': {}}
+    node_metadata = {'ceph': {}, 'timings': {}}
+    timings = node_metadata['timings']
 
     # collect paths and files first
     loader.write('Host: %-*s  collecting: [%s]' % (40, hostname, terminal.yellow('paths')))
-    node_metadata['paths'] = collect_paths(conn)
+    node_metadata['paths'] = collect_paths(
+        conn, cache.get(hostname, container), timings, remote_module=remote_module
+    )
     loader.write('Host: %-*s  collecting: [%s]' % (40, hostname, terminal.green('paths')))
+    check_cancelled(job)
 
     # TODO: collect network information, passing all the cluster_nodes
     # so that it can check for inter-node connectivity
@@ -134,31 +200,269 @@ def get_node_metadata(conn, hostname, cluster_nodes):
     loader.write('Host: %-*s  collecting: [%s]' % (40, hostname, terminal.yellow('devices')))
     node_metadata['devices'] = collect_devices()
     loader.write('Host: %-*s  collecting: [%s]' % (40, hostname, terminal.green('devices')))
+    check_cancelled(job)
 
     # collect ceph information
     loader.write('Host: %-*s  collecting: [%s]' % (40, hostname, terminal.yellow('ceph information')))
-    node_metadata['ceph'] = collect_ceph_info(conn)
-    node_metadata['ceph']['sockets'] = collect_socket_info(conn, node_metadata)
-    node_metadata['ceph']['osd'] = collect_ceph_osd_info(conn)
+    with timed(timings, 'ceph'):
+        node_metadata['ceph'] = collect_ceph_info(conn, remote_module=remote_module)
+    check_cancelled(job)
+    with timed(timings, 'sockets'):
+        node_metadata['ceph']['sockets'] = collect_socket_info(
+            conn, node_metadata, remote_module=remote_module
+        )
     loader.write('Host: %-*s  collecting: [%s]' % (40, hostname, terminal.green('ceph information')))
 
     return node_metadata
 
 
+def get_collection_workers():
+    """
+    Number of hosts that are collected from concurrently, configurable with
+    ``collection_workers`` in the ``[global]`` section of the ceph-medic
+    configuration file. Falls back to ``DEFAULT_COLLECTION_WORKERS`` when the
+    value is not set, is invalid, or no configuration was loaded.
+    """
+    try:
+        workers = config.file.get_safe(
+            'global', 'collection_workers', DEFAULT_COLLECTION_WORKERS)
+    except RuntimeError:
+        return DEFAULT_COLLECTION_WORKERS
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        logger.warning('invalid collection_workers value: %s, using default', workers)
+        return DEFAULT_COLLECTION_WORKERS
+    return max(workers, 1)
+
+
+def get_collection_timeout():
+    """
+    Maximum number of seconds allowed to collect a single node, configurable
+    with ``collection_timeout`` in the ``[global]`` section of the ceph-medic
+    configuration file. Returns ``None`` (no limit) when the value is not set,
+    is invalid, or is not a positive number.
+    """
+    try:
+        timeout = config.file.get_safe('global', 'collection_timeout', None)
+    except RuntimeError:
+        return None
+    if timeout is None:
+        return None
+    try:
+        timeout = float(timeout)
+    except (TypeError, ValueError):
+        logger.warning('invalid collection_timeout value: %s, ignoring it', timeout)
+        return None
+    if timeout <= 0:
+        return None
+    return timeout
+
+
+class CollectionCancelled(Exception):
+    pass
+
+
+class NodeJob(object):
+    """
+    Tracks the collection of a single node, so that the scheduler in
+    :func:`collect` can time it out or cancel it while a worker thread is
+    running it.
+    """
+
+    def __init__(self, node_type, node):
+        self.node_type = node_type
+        self.node = node
+        self.hostname = node['host']
+        self.started = None
+        self.cancelled = threading.Event()
+
+    def start(self):
+        self.started = time.time()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def expired(self, timeout):
+        if timeout is None or self.started is None:
+            return False
+        return time.time() - self.started > timeout
+
+
+def check_cancelled(job):
+    """
+    Called in between collection phases, stops collecting a node as soon as
+    its job has been cancelled (for example because it timed out)
+    """
+    if job is not None and job.cancelled.is_set():
+        raise CollectionCancelled(job.hostname)
+
+
+def mark_failed(node_type, hostname, reason):
+    """
+    Remove a node from the metadata, recording the reason it failed
+    """
+    with metadata_lock:
+        if metadata[node_type].get(hostname):
+            metadata[node_type].pop(hostname)
+        metadata['nodes'][node_type] = [i for i in metadata['nodes'][node_type] if i['host'] != hostname]
+        metadata['failed_nodes'].update({hostname: reason})
+
+
+def collect_node(job, cluster_nodes):
+    """
+    Connect to a single node, gather all its metadata and store it in the
+    global ``ceph_medic.metadata``. Returns ``False`` if the connection could
+    not be established, ``True`` otherwise.
+
+    This function is called concurrently for many hosts, so every write to the
+    shared metadata has to happen while holding ``metadata_lock``. If the job
+    gets cancelled while collecting, nothing is written.
+    """
+    job.start()
+    node_type, node, hostname = job.node_type, job.node, job.hostname
+    loader.write('Host: %-40s  connection: [%-20s]' % (hostname, terminal.yellow('connecting')))
+    # TODO: make sure that the hostname is resolvable, trying to
+    # debug SSH issues with execnet is pretty hard/impossible, use
+    # util.net.host_is_resolvable
+    try:
+        logger.debug('attempting connection to host: %s', node['host'])
+        connect_start = time.time()
+        conn = get_connection(node['host'], container=node.get('container'))
+        connect_time = time.time() - connect_start
+        loader.write('Host: %-40s  connection: [%-20s]' % (hostname, terminal.green('connected')))
+        loader.write('\n')
+    except HostNotFound as err:
+        logger.exception('connection failed')
+        loader.write('Host: %-40s  connection: [%-20s]' % (hostname, terminal.red('failed')))
+        loader.write('\n')
+        mark_failed(node_type, hostname, str(err))
+        return False
+
+    # send the full node metadata for global scope so that the checks
+    # can consume this
+    check_cancelled(job)
+    node_metadata = get_node_metadata(
+        conn, hostname, cluster_nodes, container=node.get('container'), job=job)
+    timings = node_metadata.setdefault('timings', {})
+    timings['connect'] = connect_time
+    with metadata_lock:
+        check_cancelled(job)
+        metadata[node_type][hostname] = node_metadata
+    if node_type == 'mons':  # if node type is monitor, admin privileges are most likely authorized
+        # only the first monitor that answers needs to report cluster
+        # data, the lock ensures other monitors wait and skip it when it
+        # is already there
+        with cluster_lock:
+            if not metadata['cluster'] and not job.cancelled.is_set():
+                with timed(timings, 'cluster'):
+                    cluster_data = collect_cluster(conn)
+                if cluster_data:
+                    metadata['cluster'] = cluster_data
+    timings['total'] = time.time() - job.started
+    return True
+
+
+def cancel_host_jobs(timed_out, running):
+    """
+    Cancel the jobs in ``running`` that are still collecting from the same host
+    as the ``timed_out`` job, because they use the connection that is about to
+    be closed, and report them as failed. Returns the number of cancelled jobs.
+    Jobs that haven't started yet are left alone, they will connect again.
+    """
+    cancelled = 0
+    for job, result in running:
+        if job is timed_out or job.hostname != timed_out.hostname:
+            continue
+        if job.started is None or job.cancelled.is_set() or result.ready():
+            continue
+        logger.error('collection stopped for %s on host: %s', job.node_type, job.hostname)
+        job.cancel()
+        mark_failed(
+            job.node_type, job.hostname,
+            'connection closed after %s on the same host timed out' % timed_out.node_type
+        )
+        cancelled += 1
+    return cancelled
+
+
+def wait_for_jobs(running, timeout, poll_interval=0.1):
+    """
+    Wait for all the ``(job, async_result)`` pairs in ``running`` to
+    complete, returning the number of nodes that failed. Jobs that take longer
+    than ``timeout`` seconds are cancelled and their connections closed, which
+    interrupts any blocking remote call, and the node is reported as failed.
+    Nodes whose collection raises an error are reported as failed as well.
+
+    All the nodes of a host share its connection (see
+    :class:`ceph_medic.connection.ConnectionPool`), so closing it for a timed
+    out node also stops the other nodes of that host that are still
+    collecting, which are reported as failed because of it.
+    """
+    failed_nodes = 0
+    while running:
+        still_running = []
+        for job, result in running:
+            if job.cancelled.is_set():
+                # stopped along with a timed out node of the same host
+                continue
+            if result.ready():
+                try:
+                    succeeded = result.get()
+                except CollectionCancelled:
+                    # it was timed out and reported already
+                    continue
+                except Exception as error:
+                    if job.cancelled.is_set():
+                        # closing the connection of a timed out job can
+                        # break its remote calls, it was reported already
+                        continue
+                    # any other failure (like a RuntimeError from remoto)
+                    # fails this node only, not the whole collection. Its
+                    # connection is left open for the other nodes of the
+                    # host, the pool replaces it if it is no longer usable
+                    logger.exception('collection failed for host: %s', job.hostname)
+                    loader.write('Host: %-40s  collection: [%-20s]\n' % (job.hostname, terminal.red('failed')))
+                    mark_failed(job.node_type, job.hostname, str(error))
+                    failed_nodes += 1
+                    continue
+                if not succeeded:
+                    failed_nodes += 1
+            elif job.expired(timeout):
+                logger.error('collection timed out for host: %s', job.hostname)
+                loader.write('Host: %-40s  collection: [%-20s]\n' % (job.hostname, terminal.red('timed out')))
+                job.cancel()
+                failed_nodes += cancel_host_jobs(job, running)
+                mark_failed(job.node_type, job.hostname, 'collection timed out after %s seconds' % timeout)
+                connection.pool.close(job.hostname)
+                failed_nodes += 1
+            else:
+                still_running.append((job, result))
+        running = [(job, result) for job, result in still_running if not job.cancelled.is_set()]
+        if running:
+            time.sleep(poll_interval)
+    return failed_nodes
+
+
 def collect():
     """
     The main collecting entrypoint. This function will call all the pieces
     needed to build the complete metadata set of a remote system so that checks
     can consume and verify that data.
 
+    Hosts are collected concurrently, using up to ``collection_workers``
+    threads (see :func:`get_collection_workers`), so that the total time is
+    bound by the slowest hosts rather than the sum of all of them. Each node
+    is tracked as a :class:`NodeJob`, so that nodes taking longer than
+    ``collection_timeout`` seconds are cancelled, and everything is cancelled
+    if collection is interrupted.
+
     After collection is done, the full contents of the metadata are available
     at ``ceph_medic.metadata``
     """
     cluster_nodes = metadata['nodes']
     loader.write('collecting remote node information')
-    total_nodes = 0
-    failed_nodes = 0
-    has_cluster_data = False
+    jobs = []
 
     for node_type, nodes in cluster_nodes.items():
         for node in nodes:
@@ -169,39 +473,47 @@ def collect():
                 msg = "Skipping node {} from unknown host group: {}".format(node, node_type)
                 logger.warning(msg)
                 continue
-
-            total_nodes += 1
-            hostname = node['host']
-            loader.write('Host: %-40s  connection: [%-20s]' % (hostname, terminal.yellow('connecting')))
-            # TODO: make sure that the hostname is resolvable, trying to
-            # debug SSH issues with execnet is pretty hard/impossible, use
-            # util.net.host_is_resolvable
+            jobs.append(NodeJob(node_type, node))
+
+    # connections are pooled and shared between all the nodes of a host (for
+    # example collocated daemons or containers), so a host is closed only
+    # after its last node is collected
+    pending = Counter(job.hostname for job in jobs)
+    pending_lock = threading.Lock()
+
+    def collect_job(job):
+        try:
+            return collect_node(job, cluster_nodes)
+        finally:
+            with pending_lock:
+                pending[job.hostname] -= 1
+                host_done = pending[job.hostname] == 0
+            if host_done:
+                connection.pool.close(job.hostname)
+
+    total_nodes = len(jobs)
+    failed_nodes = 0
+    try:
+        if jobs:
+            thread_pool = ThreadPool(min(get_collection_workers(), total_nodes))
             try:
-                logger.debug('attempting connection to host: %s', node['host'])
-                conn = get_connection(node['host'], container=node.get('container'))
-                loader.write('Host: %-40s  connection: [%-20s]' % (hostname, terminal.green('connected')))
-                loader.write('\n')
-            except HostNotFound as err:
-                logger.exception('connection failed')
-                loader.write('Host: %-40s  connection: [%-20s]' % (hostname, terminal.red('failed')))
-                loader.write('\n')
-                failed_nodes += 1
-                if metadata[node_type].get(hostname):
-                    metadata[node_type].pop(hostname)
-                metadata['nodes'][node_type] = [i for i in metadata['nodes'][node_type] if i['host'] != hostname]
-                metadata['failed_nodes'].update({hostname: str(err)})
-                continue
-
-            # send the full node metadata for global scope so that the checks
-            # can consume this
-            metadata[node_type][hostname] = get_node_metadata(conn, hostname, cluster_nodes)
-            if node_type == 'mons':  # if node type is monitor, admin privileges are most likely authorized
-                if not has_cluster_data:
-                    cluster_data = collect_cluster(conn)
-                if cluster_data:
-                    metadata['cluster'] = cluster_data
-                    has_cluster_data = True
-            conn.exit()
+                running = [(job, thread_pool.apply_async(collect_job, (job,))) for job in jobs]
+                failed_nodes = wait_for_jobs(running, get_collection_timeout())
+            except BaseException:
+                # interrupted (e.g. KeyboardInterrupt): stop every node from
+                # doing any more work, and unblock the ones waiting on a
+                # remote call by closing all the connections
+                for job in jobs:
+                    job.cancel()
+                connection.pool.close()
+                raise
+            finally:
+                # not joining: every job is done at this point, except for the
+                # ones that were cancelled, which should not block the run
+                thread_pool.close()
+    finally:
+        # anything left open, like connections used to discover containers
+        connection.pool.close()
 
     if failed_nodes == total_nodes:
         loader.write(terminal.red('Collection failed!') + ' ' *70)
@@ -236,38 +548,77 @@ def collect_devices():
 
 # Ceph
 #
-def collect_ceph_info(conn):
+def collect_ceph_info(conn, remote_module=None):
+    """
+    Run all the commands needed for basic ceph information concurrently, with
+    a single remote call
+    """
+    commands = remote.commands
+    version, installed = commands.run_many(
+        conn,
+        [commands.ceph_version_command, commands.ceph_is_installed_command],
+        timeout=COMMAND_TIMEOUT,
+        remote_module=remote_module
+    )
     result = dict()
-    result['version'] = remote.commands.ceph_version(conn)
-    result['installed'] = remote.commands.ceph_is_installed(conn)
+    result['version'] = commands.ceph_version(conn, version)
+    result['installed'] = commands.ceph_is_installed(conn, installed)
     return result
 
 
 def collect_cluster(conn):
     """
-    Captures useful cluster information like the status
+    Captures useful cluster information like the status and the OSD map. This
+    information is the same regardless of the host it is requested from, so it
+    only needs to be fetched once per run. If the monitor is not able to report
+    the cluster status an empty dictionary is returned, so that the next
+    monitor can be tried instead.
     """
     result = dict()
     result['status'] = remote.commands.ceph_status(conn)
+    if not result['status']:
+        return {}
+    result['osd_dump'] = remote.commands.ceph_osd_dump(conn) or {}
     return result
 
 
 # Ceph socket info
 #
-def collect_socket_info(conn, node_metadata):
-    sockets = [socket for socket in node_metadata['paths']['/var/run/ceph']['files']
-               if socket.endswith(".asok")]
-    result = dict()
-    for socket in sockets:
-        result[socket] = {'version': {}, 'config': {}}
-        result[socket]['version'] = remote.commands.ceph_socket_version(conn, socket)
-        result[socket]['config'] = remote.commands.daemon_socket_config(conn, socket)
-    return result
+def get_socket_config_keys():
+    """
+    The daemon configuration keys to collect from admin sockets, which are
+    only the ones that registered checks read (see
+    :func:`ceph_medic.checks.registry.config_keys`), unless
+    ``full_socket_config`` is enabled in the ``[global]`` section of the
+    ceph-medic configuration file. Returns ``None`` to collect every key.
+    """
+    try:
+        full = config.file.get_safe('global', 'full_socket_config', 'false')
+    except RuntimeError:
+        full = 'false'
+    if str(full).strip().lower() in ('true', 'yes', 'on', '1'):
+        return None
+    return checks.registry.config_keys()
 
 
-# Ceph OSD info
-#
-def collect_ceph_osd_info(conn):
-    result = {'dump': {}}
-    result['dump'] = remote.commands.ceph_osd_dump(conn)
+def collect_socket_info(conn, node_metadata, remote_module=None):
+    """
+    Query all the admin sockets found in ``/var/run/ceph`` with a single
+    remote call, which interrogates each socket concurrently on the remote
+    host. Only the configuration keys that checks need are sent back (see
+    :func:`get_socket_config_keys`)
+    """
+    sockets = [socket for socket in node_metadata['paths']['/var/run/ceph']['files']
+               if socket.endswith(".asok")]
+    if not sockets:
+        return {}
+    if remote_module is None:
+        remote_module = conn.remote_module
+    result = remote_module.socket_info(sockets, SOCKET_WORKERS, get_socket_config_keys())
+    # keep the time spent on each socket with the rest of the timings
+    timings = node_metadata.get('timings')
+    for socket, socket_metadata in result.items():
+        duration = socket_metadata.pop('duration', None)
+        if timings is not None and duration is not None:
+            timings['socket:%s' % socket] = duration
     return result
@@ -1,5 +1,7 @@
+import atexit
 import logging
 import socket
+import threading
 import remoto
 import ceph_medic
 from execnet.gateway_bootstrap import HostNotFound
@@ -7,16 +9,107 @@ from execnet.gateway_bootstrap import HostNotFound
 logger = logging.getLogger(__name__)
 
 
+class ConnectionPool(object):
+    """
+    Keeps connections open so that they can be reused, keyed by
+    ``(hostname, deployment_type, container)``. This allows sharing
+    connections between inventory discovery, collection, and cluster name
+    inference, and container connections (docker, podman) on the same physical
+    host share a single SSH gateway to that host.
+
+    Connections are closed deterministically with :meth:`close`, either for
+    a single host (when no more work is needed for it) or for every host.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.key_locks = {}
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key, make_connection):
+        """
+        Return the connection for ``key``, calling ``make_connection`` to
+        create one if it doesn't exist yet (or if it is no longer usable).
+        A lock per key ensures concurrent callers don't create duplicate
+        connections, while different hosts can connect at the same time.
+        """
+        with self._key_lock(key):
+            conn = self.connections.get(key)
+            if conn is not None and not is_alive(conn):
+                logger.debug('pooled connection is no longer usable: %s', key)
+                conn = None
+            if conn is None:
+                conn = make_connection()
+                with self.lock:
+                    self.connections[key] = conn
+            return conn
+
+    def close(self, hostname=None):
+        """
+        Close (and forget about) all pooled connections, or only the ones for
+        ``hostname`` if defined
+        """
+        with self.lock:
+            keys = [k for k in self.connections if hostname is None or k[0] == hostname]
+            connections = [self.connections.pop(k) for k in keys]
+        for conn in connections:
+            try:
+                conn.exit()
+            except Exception:
+                logger.exception('failed to close connection to: %s', conn.hostname)
+
+
+def is_alive(conn):
+    try:
+        return conn.has_connection()
+    except Exception:
+        return False
+
+
+pool = ConnectionPool()
+atexit.register(pool.close)
+
+
 def get_connection(hostname, username=None, threads=5, use_sudo=None, detect_sudo=True, **kw):
     """
     A very simple helper, meant to return a connection
     that will know about the need to use sudo.
+
+    Connections are pooled (see :class:`ConnectionPool`), so requesting
+    a connection for the same host, deployment type and container returns the
+    already established connection. Callers should not close pooled
+    connections, but use ``pool.close()`` instead.
+    """
+    deployment_type = kw.get('deployment_type')
+    if deployment_type is None:
+        deployment_type = ceph_medic.config.file.get_safe(
+            'global', 'deployment_type', 'baremetal')
+        kw['deployment_type'] = deployment_type
+    if deployment_type == 'baremetal':
+        deployment_type = 'ssh'
+    key = (hostname, deployment_type, kw.get('container'))
+    return pool.get(
+        key,
+        lambda: make_connection(hostname, username, threads, use_sudo, detect_sudo, **kw)
+    )
+
+
+def make_connection(hostname, username=None, threads=5, use_sudo=None, detect_sudo=True, **kw):
+    """
+    Create a new connection, without going through the connection pool. For
+    docker and podman deployments, the pooled SSH connection to the physical
+    host is used to reach the container.
     """
     if kw.get('logger') is False:  # explicitly disable remote logging
         remote_logger = None
     else:
         remote_logger = logging.getLogger(hostname)
 
+    physical_hostname = hostname
     if username:
         hostname = "%s@%s" % (username, hostname)
 
@@ -39,12 +132,21 @@ def get_connection(hostname, username=None, threads=5, use_sudo=None, detect_sud
         elif deployment_type in ['docker', 'podman']:
             if kw.get('logger', True):
                 remote_logger = logging.getLogger(kw['container'])
+            # share the gateway of the physical host, commands get wrapped to
+            # execute in the container by the connection object
+            host_conn = get_connection(
+                physical_hostname, username, threads, use_sudo, detect_sudo,
+                deployment_type='ssh',
+            )
             conn = conn_obj(
                 hostname,
                 container_name=kw['container'],
                 logger=remote_logger,
-                detect_sudo=detect_sudo,
+                eager=False,
             )
+            conn.sudo = host_conn.sudo
+            conn.group = host_conn.group
+            conn.gateway = host_conn.gateway
         elif deployment_type in ['ssh', 'baremetal']:
             conn = conn_obj(
                 hostname,
@@ -7,9 +7,38 @@ import json
 from remoto.process import check
 
 
-def ceph_version(conn):
+ceph_version_command = ['ceph', '--version']
+ceph_is_installed_command = ['which', 'ceph']
+
+
+def run_many(conn, commands, workers=4, timeout=None, remote_module=None):
+    """
+    Run all ``commands`` concurrently on the remote end, with a single call,
+    returning ``(stdout, stderr, exit_code)`` for each of them in the same
+    order. Commands that can't be started at all get an exit code of ``-1``.
+    Helpers in this module accept these results as ``output``, so that they
+    don't run the command again.
+
+    .. note:: Unlike the other helpers, this requires
+              ``ceph_medic.remote.functions`` to be imported in ``conn``. Pass
+              the module that the import returned as ``remote_module`` when
+              other threads may import it in the same connection
+    """
+    if remote_module is None:
+        remote_module = conn.remote_module
+    results = []
+    for command, result in zip(commands, remote_module.run_many(commands, workers, timeout)):
+        if isinstance(result, dict):
+            error = result.get('exception', {})
+            conn.logger.error('failed to run %s: %s' % (' '.join(command), error.get('repr')))
+            result = ([], [error.get('repr', '')], -1)
+        results.append(tuple(result))
+    return results
+
+
+def ceph_version(conn, output=None):
     try:
-        output, _, exit_code = check(conn, ['ceph', '--version'])
+        output, _, exit_code = output or check(conn, ceph_version_command)
         if exit_code != 0:
             conn.logger.error('Non zero exit status received, unable to retrieve information')
             return
@@ -18,27 +47,6 @@ def ceph_version(conn):
         conn.logger.exception('failed to fetch ceph version')
 
 
-def ceph_socket_version(conn, socket):
-    try:
-        result = dict()
-        output, _, exit_code = check(
-            conn,
-            ['ceph', '--admin-daemon', socket, '--format', 'json', 'version']
-        )
-        if exit_code != 0:
-            conn.logger.error('Non zero exit status received, unable to retrieve information')
-            return result
-        try:
-            result = json.loads(output[0])
-        except ValueError:
-            conn.logger.exception(
-                "failed to fetch ceph socket version, invalid json: %s" % output[0]
-            )
-        return result
-    except RuntimeError:
-        conn.logger.exception('failed to fetch ceph socket version')
-
-
 def ceph_status(conn):
     try:                # collects information using ceph -s
         stdout, stderr, exit_code = check(conn, ['ceph', '-s', '--format', 'json'])
@@ -78,33 +86,9 @@ def ceph_osd_dump(conn):
         conn.logger.exception('failed to fetch ceph osd dump')
 
 
-def daemon_socket_config(conn, socket):
-    """
-    Capture daemon-based config from the socket
-    """
-    try:
-        output, _, exit_code = check(
-            conn,
-            ['ceph', '--admin-daemon', socket, 'config', 'show', '--format', 'json']
-        )
-        if exit_code != 0:
-            conn.logger.error('Non zero exit status received, unable to retrieve information')
-            return
-        result = dict()
-        try:
-            result = json.loads(output[0])
-        except ValueError:
-            conn.logger.exception(
-                "failed to fetch ceph configuration via socket, invalid json: %s" % output[0]
-            )
-        return result
-    except RuntimeError:
-        conn.logger.exception('failed to fetch ceph configuration via socket')
-
-
-def ceph_is_installed(conn):
+def ceph_is_installed(conn, output=None):
     try:
-        stdout, stderr, exit_code = check(conn, ['which', 'ceph'])
+        stdout, stderr, exit_code = output or check(conn, ceph_is_installed_command)
     except RuntimeError:
         conn.logger.exception('failed to check if ceph is available in the path')
         # XXX this might be incorrect
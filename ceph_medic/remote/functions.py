@@ -1,9 +1,23 @@
 import os
+import fnmatch
+import functools
 import grp
+import hashlib
+import json
 import pwd
+import socket
+import struct
+import threading
+import time
 import traceback
 import sys
 import subprocess
+from stat import S_ISREG
+
+try:
+    from os import scandir
+except ImportError:  # Python 2
+    scandir = None
 
 
 # Utilities
@@ -35,8 +49,125 @@ def decoded(string):
         return string
 
 
+def concurrently(function, items, workers):
+    """
+    Call ``function`` for every item in ``items`` using at most ``workers``
+    threads, returning the results in the same order as ``items``. Any
+    exception raised by ``function`` is captured and returned as the result
+    for that item
+    """
+    items = list(items)
+    results = [None] * len(items)
+    lock = threading.Lock()
+    position = [0]
+
+    def worker():
+        while True:
+            with lock:
+                index = position[0]
+                if index >= len(items):
+                    return
+                position[0] += 1
+            try:
+                results[index] = function(items[index])
+            except Exception as error:
+                results[index] = {'exception': capture_exception(error)}
+
+    threads = [threading.Thread(target=worker) for _ in range(min(max(workers, 1), len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
 # Paths
 #
+STAT_FIELDS = (
+    u'n_fields', u'n_sequence_fields', u'n_unnamed_fields', u'st_atime',
+    u'st_blksize', u'st_blocks', u'st_ctime', u'st_dev', u'st_gid', u'st_ino',
+    u'st_mode', u'st_mtime', u'st_nlink', u'st_rdev', u'st_size', u'st_uid'
+)
+
+
+def stat_metadata(stat_info):
+    """
+    Copy the interesting fields of a ``stat`` result, along with the names of
+    the owner and group
+    """
+    metadata = {u'exception': {}}
+    for field in STAT_FIELDS:
+        metadata[field] = getattr(stat_info, field)
+
+    # translate the owner and group:
+    metadata[u'owner'] = owner_name(stat_info.st_uid)
+    metadata[u'group'] = group_name(stat_info.st_gid)
+    return metadata
+
+
+# uid -> owner and gid -> group names, resolved once for as long as this module
+# lives on the remote end, since lookups can be slow (e.g. backed by LDAP) and
+# almost every file is owned by the same few users
+owners = {}
+groups = {}
+
+
+def owner_name(uid):
+    """
+    Name of the user with ``uid``, or the ``uid`` itself if it doesn't exist
+    """
+    try:
+        return owners[uid]
+    except KeyError:
+        pass
+    try:
+        name = decoded(pwd.getpwuid(uid)[0])
+    except KeyError:
+        name = uid
+    owners[uid] = name
+    return name
+
+
+def group_name(gid):
+    """
+    Name of the group with ``gid``, or the ``gid`` itself if it doesn't exist
+    """
+    try:
+        return groups[gid]
+    except KeyError:
+        pass
+    try:
+        name = decoded(grp.getgrgid(gid)[0])
+    except KeyError:
+        name = gid
+    groups[gid] = name
+    return name
+
+
+def stat_entry(path, stat, get_contents=False, state=None):
+    """
+    Metadata of a path using ``stat``, a callable returning its ``stat``
+    result (like ``DirEntry.stat`` while walking a tree) so that the path is
+    never stat'ed twice. When ``state`` is given and the path hasn't changed
+    since then (see ``is_unchanged``), contents are not read and the path is
+    flagged with ``'cached': True`` instead
+    """
+    try:
+        stat_info = stat()
+        metadata = stat_metadata(stat_info)
+        if state is not None and is_unchanged(metadata, state):
+            metadata[u'cached'] = True
+        elif get_contents is True and S_ISREG(stat_info.st_mode):
+            with open(path, 'r') as opened_file:
+                metadata[u'contents'] = decoded(opened_file.read())
+        elif get_contents and S_ISREG(stat_info.st_mode):
+            metadata.update(capture_contents(path, stat_info.st_size, get_contents))
+    except Exception as error:
+        return {'exception': capture_exception(error)}
+    return metadata
+
+
 def stat_path(path, skip_dirs=None, skip_files=None, get_contents=False):
     """stat a path on a remote host"""
     # Capture all information about a path, optionally getting the contents of
@@ -46,40 +177,163 @@ def stat_path(path, skip_dirs=None, skip_files=None, get_contents=False):
     # .. note:: Neither ``skip_dirs`` nor ``skip_files`` is used here, but the
     # remote execution of functions use name-based arguments which does not allow
     # the use of ``**kw``
-    metadata = {u'exception': {}}
+    # ``get_contents`` can be a boolean, or a capture policy (see
+    # ``capture_contents``) to limit what files get their contents read
     path = decoded(path)
-    try:
-        stat_info = os.stat(path)
-        if get_contents and os.path.isfile(path):
-            with open(path, 'r') as opened_file:
-                metadata[u'contents'] = decoded(opened_file.read())
-    except Exception as error:
-        return {'exception': capture_exception(error)}
+    return stat_entry(path, functools.partial(os.stat, path), get_contents)
 
-    allowed_attrs = [
-        'n_fields', 'n_sequence_fields', 'n_unnamed_fields', 'st_atime',
-        'st_blksize', 'st_blocks', 'st_ctime', 'st_dev', 'st_gid', 'st_ino',
-        'st_mode', 'st_mtime', 'st_nlink', 'st_rdev', 'st_size', 'st_uid'
-    ]
 
-    # get all the stat results back into the metadata
-    for attr in dir(stat_info):
-        attr = decoded(attr)
-        if attr in allowed_attrs:
-            value = decoded(getattr(stat_info, attr))
-            metadata[attr] = value
+def file_digest(path, chunk_size=65536):
+    """
+    Compute the sha256 digest of a file, reading it in chunks so that memory
+    usage stays bounded regardless of the size of the file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as opened_file:
+        for chunk in iter(lambda: opened_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return u'sha256:%s' % digest.hexdigest()
 
-    # translate the owner and group:
-    try:
-        metadata[u'owner'] = decoded(pwd.getpwuid(stat_info.st_uid)[0])
-    except KeyError:
-        metadata[u'owner'] = stat_info.st_uid
+
+def keyring_digests(path):
+    """
+    Map every entity in a keyring (like ``mon.``) to the sha256 digest of its
+    key, so that keys can be compared without being sent back. Keyrings look
+    like::
+
+        [mon.]
+            key = AQBvaBFZAAAAABAA9VHgwCg3rWn8fMaX8KL01A==
+            caps mon = "allow *"
+    """
+    digests = {}
+    entity = None
+    with open(path) as keyring:
+        for line in keyring:
+            line = line.strip()
+            if line.startswith('[') and line.endswith(']'):
+                entity = decoded(line[1:-1].strip())
+            elif entity is not None and '=' in line:
+                name, value = line.split('=', 1)
+                if name.strip() == 'key':
+                    key = value.strip().encode('utf-8')
+                    digests[entity] = u'sha256:%s' % hashlib.sha256(key).hexdigest()
+    return digests
+
+
+def matches(path, patterns):
+    """
+    Check if ``path`` matches any of ``patterns``. Patterns with a ``/`` are
+    matched against the whole path, all others against the file name
+    """
+    name = os.path.basename(path)
+    for pattern in patterns:
+        if fnmatch.fnmatch(path if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+def capture_contents(path, size, policy):
+    """
+    Capture the contents of a file as long as it is allowed by ``policy``,
+    which is a dictionary like::
+
+        {
+            'include': ['keyring', '*.conf'],
+            'secrets': ['/var/lib/ceph/mon/*/keyring'],
+            'digest': False,
+            'max_bytes': 262144,
+        }
+
+    Only files with a name matching one of the ``include`` patterns get their
+    contents captured (every file, if ``include`` is not defined), up to
+    ``max_bytes``. Files that are not included, are too large, or are binary,
+    get a digest of their contents instead, along with the reason their
+    contents were skipped.
+
+    Keyrings matching ``secrets`` never have their contents sent back, only
+    the digest of every key in them (see ``keyring_digests``), which is
+    enough to compare keys across hosts without exposing them. With
+    ``digest`` set, captured contents are sent along with their digest.
+    """
+    include = policy.get('include')
+    max_bytes = policy.get('max_bytes')
+
+    if policy.get('secrets') and matches(path, policy['secrets']):
+        return {
+            u'digest': file_digest(path),
+            u'key_digests': keyring_digests(path),
+            u'contents_skipped': u'secret',
+        }
+    if include is not None and not matches(path, include):
+        return {u'digest': file_digest(path), u'contents_skipped': u'excluded'}
+    if max_bytes is not None and size > max_bytes:
+        return {u'digest': file_digest(path), u'contents_skipped': u'size'}
+
+    with open(path, 'rb') as opened_file:
+        if max_bytes is not None:
+            raw = opened_file.read(max_bytes + 1)
+        else:
+            raw = opened_file.read()
+    # the file might've grown after calling stat
+    if max_bytes is not None and len(raw) > max_bytes:
+        return {u'digest': file_digest(path), u'contents_skipped': u'size'}
+    if b'\0' in raw:
+        return {u'digest': file_digest(path), u'contents_skipped': u'binary'}
     try:
-        metadata[u'group'] = decoded(grp.getgrgid(stat_info.st_gid)[0])
-    except KeyError:
-        metadata[u'group'] = stat_info.st_gid
+        captured = {u'contents': raw.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {u'digest': file_digest(path), u'contents_skipped': u'binary'}
+    if policy.get('digest'):
+        captured[u'digest'] = u'sha256:%s' % hashlib.sha256(raw).hexdigest()
+    return captured
 
-    return metadata
+
+def walk(path, skip_dirs=None, skip_files=None):
+    """walk a path tree"""
+    # Yield ``(absolute_path, is_dir, stat)`` for every file and directory
+    # below ``path``, where ``stat`` is a callable returning the ``stat``
+    # result of the path. Directories in ``skip_dirs`` are neither reported
+    # nor descended into, and files in ``skip_files`` are not reported.
+    # Symlinks to directories are reported as directories, but not followed.
+
+    # ``os.scandir`` (Python 3.5 and newer) tells directories apart without
+    # calling ``stat``, and caches the ``stat`` result in each entry, older
+    # Pythons fall back to ``os.walk``
+    skip_files = skip_files or []
+    skip_dirs = skip_dirs or []
+    if scandir is None:
+        for root, _dirs, _files in os.walk(path, topdown=True):
+            _dirs[:] = [d for d in _dirs if d not in skip_dirs]
+            for _file in _files:
+                if _file in skip_files:
+                    continue
+                absolute_path = os.path.join(root, _file)
+                yield absolute_path, False, functools.partial(os.stat, absolute_path)
+            for _dir in _dirs:
+                absolute_path = os.path.join(root, _dir)
+                yield absolute_path, True, functools.partial(os.stat, absolute_path)
+        return
+
+    pending = [path]
+    while pending:
+        try:
+            entries = list(scandir(pending.pop()))
+        except OSError:
+            # like ``os.walk``, unreadable directories are silently skipped
+            continue
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if entry.name in skip_dirs:
+                    continue
+                yield entry.path, True, entry.stat
+                if not entry.is_symlink():
+                    pending.append(entry.path)
+            elif entry.name not in skip_files:
+                yield entry.path, False, entry.stat
 
 
 def path_tree(path, skip_dirs=None, skip_files=None, get_contents=None):
@@ -97,27 +351,14 @@ def path_tree(path, skip_dirs=None, skip_files=None, get_contents=None):
 
     # .. note:: ``get_contents`` is not used here, but the remote execution of functions
     # use name-based arguments which does not allow the use of ``**kw``
-    try:
-        path = path.decode('utf-8')
-    except AttributeError:
-        pass
-    skip_files = skip_files or []
-    skip_dirs = skip_dirs or []
+    path = decoded(path)
     files = []
     dirs = []
-    # traverse for files and directories, topdown allows us to trim the
-    # directories on the fly
-    for root, _dirs, _files in os.walk(path, topdown=True):
-        _dirs[:] = [d for d in _dirs if d not in skip_dirs]
-        for _file in _files:
-            absolute_path = os.path.join(root, _file)
-            if _file in skip_files:
-                continue
-            files.append(absolute_path)
-
-        for _dir in _dirs:
-            absolute_path = os.path.join(root, _dir)
+    for absolute_path, is_dir, _ in walk(path, skip_dirs, skip_files):
+        if is_dir:
             dirs.append(absolute_path)
+        else:
+            files.append(absolute_path)
 
     # using the 'u' prefix forces python3<->python2 compatibility otherwise the
     # keys would be bytes, regardless if input is a str which should've forced
@@ -126,6 +367,50 @@ def path_tree(path, skip_dirs=None, skip_files=None, get_contents=None):
     return {u'path': path, u'dirs': dirs, u'files': files}
 
 
+def path_metadata(path, skip_dirs=None, skip_files=None, get_contents=False, cached=None):
+    """walk, stat and optionally read a path tree"""
+    # Combine ``walk`` and ``stat_entry`` so that a whole tree (including
+    # the root path itself) can be collected in a single remote call, instead
+    # of one call per file and per directory, and every path is stat'ed only
+    # once. The output groups the stat results of files and directories by
+    # their absolute path::
+
+    #     {
+    #         'dirs': {'/etc/ceph': {...}, '/etc/ceph/ceph.d': {...}},
+    #         'files': {'/etc/ceph/ceph.d/test.conf': {...}}
+    #     }
+
+    # ``cached`` optionally maps file paths to their [inode, mtime, size]
+    # state from a previous run. Contents are not read for files that still
+    # have the same state, and they are flagged with ``'cached': True`` so that
+    # the caller can reuse the contents it already has.
+    path = decoded(path)
+    cached = cached or {}
+    files = {}
+    dirs = {}
+
+    for absolute_path, is_dir, stat in walk(path, skip_dirs, skip_files):
+        if is_dir:
+            dirs[absolute_path] = stat_entry(absolute_path, stat)
+        else:
+            state = cached.get(absolute_path) if get_contents else None
+            files[absolute_path] = stat_entry(absolute_path, stat, get_contents, state)
+
+    # actual root path
+    dirs[path] = stat_path(path)
+
+    return {u'dirs': dirs, u'files': files}
+
+
+def is_unchanged(metadata, state):
+    """
+    Compare the inode, modification time and size of a stat result with
+    a previously recorded ``state``
+    """
+    current = [metadata.get('st_ino'), metadata.get('st_mtime'), metadata.get('st_size')]
+    return current == list(state)
+
+
 def which(executable):
     """find the location of an executable"""
     locations = (
@@ -143,18 +428,160 @@ def which(executable):
             return executable_path
 
 
-def run(command):
+def run(command, timeout=None):
     """
-    run a command, return stdout, stderr, and exit code.
+    run a command, return stdout, stderr, and exit code. If the command takes
+    longer than ``timeout`` seconds it gets killed.
     """
     process = subprocess.Popen(
         command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True
     )
-    stdout = process.stdout.read().splitlines()
-    stderr = process.stderr.read().splitlines()
-    returncode = process.wait()
+    # Python 2 doesn't support a timeout in ``communicate()``, so the process
+    # is killed from a timer thread instead
+    timed_out = []
+
+    def kill():
+        timed_out.append(True)
+        process.kill()
+
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        if timer is not None:
+            timer.cancel()
+    stdout = stdout.splitlines()
+    stderr = stderr.splitlines()
+    if timed_out:
+        stderr.append(('command timed out after %s seconds' % timeout).encode('utf-8'))
+
+    return stdout, stderr, process.returncode
+
+
+def run_many(commands, workers=4, timeout=None):
+    """run commands concurrently"""
+    # Run every command in ``commands`` using at most ``workers`` threads,
+    # allowing each one up to ``timeout`` seconds, so that all of them get
+    # done with a single remote call and the slowest command bounds the total
+    # time. The output has the stdout lines, stderr lines, and exit code of
+    # each command, in the same order as ``commands``::
+
+    #     [
+    #         [['ceph version 12.2.1 (...)'], [], 0],
+    #         [[], ['command timed out after 10 seconds'], -9],
+    #     ]
+
+    # Commands that could not be started (e.g. the executable does not exist)
+    # get a captured exception instead: ``{'exception': {...}}``
+    def run_command(command):
+        stdout, stderr, returncode = run(command, timeout)
+        return [
+            [decoded(line) for line in stdout],
+            [decoded(line) for line in stderr],
+            returncode
+        ]
+
+    return concurrently(run_command, commands, workers)
+
+
+# Admin sockets
+#
+def receive(connection, size):
+    """
+    Read exactly ``size`` bytes from ``connection``
+    """
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError('admin socket closed with %s bytes left to read' % size)
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def admin_socket_request(socket_path, command, timeout=10):
+    """
+    Send ``command`` (like ``['config', 'show']``) to a daemon admin socket and
+    return the response as text, without going through the ``ceph`` CLI. The
+    request is a JSON object terminated by a null byte, and the response is
+    prefixed with its length as a 4-byte big-endian integer
+
+    .. note:: The response is decoded so that it can be sent back over
+              connections that serialize with JSON (like containers)
+    """
+    request = json.dumps({'prefix': ' '.join(command), 'format': 'json'})
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(socket_path)
+        connection.sendall(request.encode('utf-8') + b'\0')
+        length = struct.unpack('>I', receive(connection, 4))[0]
+        return receive(connection, length).decode('utf-8')
+    finally:
+        connection.close()
+
+
+def admin_socket_json(socket_path, command, timeout=10):
+    """
+    Run a command against a daemon admin socket and return its JSON output
+    loaded. The socket is queried directly, falling back to the ``ceph`` CLI
+    if that fails for any reason. Failures of the CLI (not being installed,
+    like on hosts where only the sockets are mounted from containers,
+    non-zero exit status, or invalid JSON) return an empty dictionary
+    """
+    try:
+        return json.loads(admin_socket_request(socket_path, command, timeout))
+    except Exception:
+        pass
+    try:
+        stdout, stderr, returncode = run(
+            ['ceph', '--admin-daemon', socket_path, '--format', 'json'] + command,
+            timeout=timeout
+        )
+    except (OSError, IOError):
+        # a command that times out is killed and has a non-zero exit status,
+        # so only failing to start it at all raises
+        return {}
+    if returncode != 0:
+        return {}
+    try:
+        return json.loads(decoded(b'\n'.join(stdout)))
+    except ValueError:
+        return {}
+
+
+def socket_info(sockets, workers=8, config_keys=None):
+    """query the version and configuration of admin sockets"""
+    # Interrogate every admin socket concurrently, so that a host with many
+    # daemons does not wait on each socket sequentially. The output maps each
+    # socket to its version and configuration::
+
+    #     {
+    #         '/var/run/ceph/ceph-osd.0.asok': {
+    #             'version': {...}, 'config': {...}, 'duration': 0.52
+    #         },
+    #     }
+
+    # The configuration of a daemon has well over a thousand keys, when
+    # ``config_keys`` is passed in only those keys are sent back
+    def query(socket_path):
+        start = time.time()
+        config = admin_socket_json(socket_path, ['config', 'show'])
+        if config_keys is not None:
+            config = dict((key, config[key]) for key in config_keys if key in config)
+        result = {
+            u'version': admin_socket_json(socket_path, ['version']),
+            u'config': config,
+        }
+        result[u'duration'] = time.time() - start
+        return result
 
-    return stdout, stderr, returncode
+    sockets = [decoded(socket_path) for socket_path in sockets]
+    return dict(zip(sockets, concurrently(query, sockets, workers)))
 
 
 # remoto magic, needed to execute these functions remotely
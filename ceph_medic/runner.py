@@ -1,14 +1,265 @@
+import json
 import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
 from ceph_medic import metadata, terminal, daemon_types
-from ceph_medic import checks, __version__
+from ceph_medic import __version__
+from ceph_medic.checks import index, registry
 from ceph_medic import config
+from ceph_medic.util import configuration
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_CHECK_WORKERS = 1
+
+
+def get_check_workers():
+    """
+    Number of processes that run host checks in parallel, configurable with
+    ``check_workers`` in the ``[global]`` section of the ceph-medic
+    configuration file. Checks run serially in the current process by default,
+    when the value is invalid, or no configuration was loaded.
+    """
+    try:
+        workers = config.file.get_safe('global', 'check_workers', DEFAULT_CHECK_WORKERS)
+    except RuntimeError:
+        return DEFAULT_CHECK_WORKERS
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        logger.warning('invalid check_workers value: %s, using default', workers)
+        return DEFAULT_CHECK_WORKERS
+    return max(workers, 1)
+
+
+class Result(object):
+    """
+    A single check run for a host (or the cluster). ``status`` is one of
+    ``passed``, ``failed``, ``ignored`` (failed with an ignored code) or
+    ``internal_error`` (the check raised an unhandled exception).
+    """
+
+    def __init__(self, host, daemon_type, check, status, code=None,
+                 severity=None, message=None, duration=0, memory=None):
+        self.host = host
+        self.daemon_type = daemon_type
+        self.check = check
+        self.status = status
+        self.code = code
+        self.severity = severity
+        self.message = message
+        self.duration = duration
+        # peak bytes allocated by the check, only measured when profiling
+        self.memory = memory
+
+    def to_dict(self):
+        return dict(
+            type='result',
+            host=self.host,
+            daemon_type=self.daemon_type,
+            check=self.check,
+            status=self.status,
+            code=self.code,
+            severity=self.severity,
+            message=self.message,
+            duration=self.duration,
+            memory=self.memory,
+        )
+
+
+class HostResults(object):
+    """
+    The outcome of running a batch of checks for a single host (or for the
+    whole cluster), so that it can be produced anywhere (even in a separate
+    process) and then merged into the ``Runner``
+    """
+
+    def __init__(self, host, daemon_type):
+        self.host = host
+        self.daemon_type = daemon_type
+        self.results = []
+        self.internal_errors = []
+        # keys extracted by the map of every reduce check, by check name
+        self.keys = {}
+
+    def count(self, status):
+        return len([r for r in self.results if r.status == status])
+
+    @property
+    def passed(self):
+        # checks with unhandled errors don't report a failure, so they pass
+        return self.count('passed') + self.count('internal_error')
+
+    @property
+    def skipped(self):
+        return self.count('ignored')
+
+    @property
+    def failures(self):
+        return [r for r in self.results if r.status == 'failed']
+
+
+def call_check(check, args, profile=False):
+    """
+    Call ``check`` and return ``(result, error, duration, memory)``, where
+    ``error`` is the unhandled exception raised by the check (if any). When
+    profiling, and ``tracemalloc`` is tracing, the peak memory allocated
+    during the call is measured as well, otherwise it is ``None``.
+    """
+    measure = profile and can_trace_memory() and tracemalloc.is_tracing()
+    if measure:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    result = error = memory = None
+    start = time.time()
+    try:
+        result = check(*args)
+    except Exception as exc:
+        error = exc
+        logger.exception('check had an unhandled error: %s', check.name)
+    duration = time.time() - start
+    if measure:
+        memory = max(tracemalloc.get_traced_memory()[1] - before, 0)
+    return result, error, duration, memory
+
+
+def can_trace_memory():
+    # resetting the peak is needed to measure each call, and it is only
+    # available in Python 3.9 and newer
+    return tracemalloc is not None and hasattr(tracemalloc, 'reset_peak')
+
+
+def run_checks(host, daemon_type, checks, args, ignore, profile=False, maps=()):
+    """
+    Run every check with ``args`` and collect the results for ``host``.
+    A check might report a code other than the one it was registered with,
+    which is skipped when ignored. The map of every reduce check in ``maps``
+    is called with ``args`` as well, to collect the keys of the host.
+    """
+    results = HostResults(host, daemon_type)
+    for check in maps:
+        try:
+            key = check.map(*args)
+        except Exception as error:
+            logger.exception('check map had an unhandled error: %s', check.name)
+            results.internal_errors.append(error)
+            results.results.append(Result(
+                host, daemon_type, check.name, 'internal_error', code=check.code,
+                message='%s: %s' % (error.__class__.__name__, error),
+            ))
+            continue
+        if key:
+            results.keys[check.name] = key
+    for check in checks:
+        result, error, duration, memory = call_check(check, args, profile)
+        if error is not None:
+            results.internal_errors.append(error)
+            results.results.append(Result(
+                host, daemon_type, check.name, 'internal_error', code=check.code,
+                message='%s: %s' % (error.__class__.__name__, error),
+                duration=duration, memory=memory,
+            ))
+        elif result:
+            code, message = result
+            status = 'ignored' if code in ignore else 'failed'
+            severity = registry.severities.get(code[:1], check.severity)
+            results.results.append(Result(
+                host, daemon_type, check.name, status, code=code,
+                severity=severity, message=message, duration=duration, memory=memory,
+            ))
+        else:
+            results.results.append(Result(
+                host, daemon_type, check.name, 'passed', code=check.code,
+                severity=check.severity, duration=duration, memory=memory,
+            ))
+    return results
+
+
+def run_host_checks(args):
+    """
+    Entry point for pool workers, which look up the host metadata and the
+    enabled checks on their own so that only names go across processes.
+    Unhandled errors are logged in the worker, and sent back as plain
+    exceptions since not all of them can be pickled.
+    """
+    daemon_type, host, ignore, profile = args
+    checks = registry.get_checks('common', daemon_type, ignore=ignore)
+    maps = registry.get_reducers('common', daemon_type, ignore=ignore)
+    data = metadata[daemon_type][host]
+    results = run_checks(host, daemon_type, checks, (host, data), ignore, profile, maps)
+    results.internal_errors = [
+        Exception('%s: %s' % (error.__class__.__name__, error))
+        for error in results.internal_errors
+    ]
+    return results
+
+
+def make_pool(workers):
+    """
+    A pool of ``workers`` processes to run host checks in. Workers get the
+    collected metadata (and the index) from module globals, so they must be
+    forked: with other start methods, like ``spawn`` (the default on macOS,
+    and on Linux since Python 3.14), they would start with empty metadata
+    """
+    try:
+        context = multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2 always forks
+        context = multiprocessing
+    return context.Pool(workers)
+
+
+def inventory_order(daemon_type):
+    """
+    Hostnames with collected metadata for ``daemon_type``, in the order they
+    are configured in the inventory (collection can finish in any order).
+    Hosts not in the inventory go last.
+    """
+    hosts = metadata[daemon_type]
+    ordered = []
+    seen = set()
+    configured = [node['host'] for node in metadata['nodes'].get(daemon_type, [])]
+    for host in configured + list(hosts):
+        if host in hosts and host not in seen:
+            seen.add(host)
+            ordered.append(host)
+    return ordered
+
+
+class CheckProfile(object):
+    """
+    Accumulated calls, time, and peak memory of a single check across all
+    the hosts it ran for
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0
+        self.slowest = 0
+        self.memory = None
+
+    def add(self, result):
+        self.calls += 1
+        self.total += result.duration
+        self.slowest = max(self.slowest, result.duration)
+        if result.memory is not None:
+            self.memory = max(self.memory or 0, result.memory)
+
+    @property
+    def mean(self):
+        return self.total / self.calls if self.calls else 0
+
+
 class Runner(object):
 
-    def __init__(self):
+    def __init__(self, workers=None):
         self.passed = 0
         self.skipped = 0
         self.total = 0
@@ -16,6 +267,16 @@ class Runner(object):
         self.warnings = 0
         self.ignore = []
         self.internal_errors = []
+        self.workers = workers or get_check_workers()
+        self.pool = None
+        # a file-like object to stream every result to, as JSON Lines
+        self.stream = None
+        # when profiling, every check is timed (and its memory measured)
+        # into ``profiles``, keyed by check name
+        self.profile = False
+        self.profiles = {}
+        # hosts grouped by the key of every reduce check, by check name
+        self.groups = {}
 
     @property
     def total_hosts(self):
@@ -32,12 +293,35 @@ class Runner(object):
         checks everywhere.
         """
         start_header()
-        for daemon_type in daemon_types:
-            self.run_daemons(daemon_type)
-
-        # these are checks that should run once per cluster
-        nodes_header('cluster')
-        self.run_cluster(checks.cluster)
+        # cluster-wide aggregates are computed once for all the checks that
+        # compare a host with the rest of the cluster
+        index.build(metadata)
+        tracing = self.profile and can_trace_memory() and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.workers > 1:
+            # workers are forked after the index is created so that they
+            # share the (read-only) metadata
+            self.pool = make_pool(self.workers)
+        try:
+            for daemon_type in daemon_types:
+                self.run_daemons(daemon_type)
+
+            # these are checks that should run once per cluster
+            nodes_header('cluster')
+            enabled = registry.get_checks('cluster', ignore=self.ignore)
+            reducers = registry.get_reducers(ignore=self.ignore)
+            self.skipped += registry.count('cluster') - len(enabled)
+            self.skipped += registry.count_reducers() - len(reducers)
+            self.run_cluster(enabled, reducers)
+        finally:
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool = None
+            if tracing:
+                tracemalloc.stop()
+            index.clear()
+            configuration.clear_cache()
 
         if metadata['failed_nodes']:
             terminal.write.bold('\n{daemon:-^30}\n'.format(daemon=' Failed Nodes '))
@@ -60,93 +344,80 @@ class Runner(object):
         else:
             return
 
-        for host, data in metadata[daemon_type].items():
-            modules = [checks.common, getattr(checks, daemon_type, None)]
-            self.run_host(host, data, modules)
+        # ignored checks are left out before running anything, and are
+        # accounted for as skipped on every host
+        enabled = registry.get_checks('common', daemon_type, ignore=self.ignore)
+        maps = registry.get_reducers('common', daemon_type, ignore=self.ignore)
+        ignored = registry.count('common', daemon_type) - len(enabled)
+        hosts = inventory_order(daemon_type)
+        self.skipped += ignored * len(hosts)
+
+        if self.pool is None:
+            for host in hosts:
+                self.run_host(host, metadata[daemon_type][host], enabled, daemon_type, maps)
+            return
+
+        # results come back in the same order the hosts were sent, so output
+        # is the same as when running serially
+        batches = [(daemon_type, host, self.ignore, self.profile) for host in hosts]
+        for results in self.pool.imap(run_host_checks, batches):
+            terminal.loader.write(' %s' % terminal.yellow(results.host))
+            self.merge(results)
 
-    def run_cluster(self, module):
+    def run_cluster(self, checks, reducers=()):
         # XXX get the cluster name here
         cluster_name = '%s cluster' % metadata.get('cluster_name', 'ceph')
         terminal.loader.write(' %s' % terminal.yellow(cluster_name))
-        has_error = False
-        checks = collect_checks(module)
-        for check in checks:
-            try:
-                # TODO: figure out how to skip running a specific check if
-                # the code is ignored, maybe introspecting the function?
-                result = getattr(module, check)()
-            except Exception as error:
-                result = None
-                logger.exception('check had an unhandled error: %s', check)
-                self.internal_errors.append(error)
-            if result:
-                code, message = result
-                # XXX This is not ideal, we shouldn't need to get all the way here
-                # to make sure this is actually ignored. (Or maybe it doesn't matter?)
-                if code in self.ignore:
-                    self.skipped += 1
-                    # avoid writing anything else to the terminal, and just
-                    # go to the next check
-                    continue
-                if not has_error:
-                    # XXX get the cluster name here
-                    terminal.loader.write(' %s' % terminal.red(cluster_name))
-                    terminal.write.write('\n')
-
-                if code.startswith('E'):
-                    code = terminal.red(code)
-                    self.errors += 1
-                elif code.startswith('W'):
-                    code = terminal.yellow(code)
-                    self.warnings += 1
-                terminal.write.write("   %s: %s\n" % (code, message))
-                has_error = True
-            else:
-                self.passed += 1
-
-        if not has_error:
-            terminal.loader.write(' %s\n' % terminal.green(cluster_name))
-
-    def run_host(self, host, data, modules):
+        results = run_checks(cluster_name, 'cluster', checks, (), self.ignore, self.profile)
+        # every reduce check gets the hosts grouped by its own keys
+        for check in reducers:
+            groups = self.groups.get(check.name, OrderedDict())
+            reduced = run_checks(
+                cluster_name, 'cluster', [check], (groups,), self.ignore, self.profile)
+            results.results.extend(reduced.results)
+            results.internal_errors.extend(reduced.internal_errors)
+        self.merge(results)
+
+    def run_host(self, host, data, checks, daemon_type=None, maps=()):
         terminal.loader.write(' %s' % terminal.yellow(host))
-        has_error = False
-        for module in modules:
-            checks = collect_checks(module)
-            for check in checks:
-                try:
-                    # TODO: figure out how to skip running a specific check if
-                    # the code is ignored, maybe introspecting the function?
-                    result = getattr(module, check)(host, data)
-                except Exception as error:
-                    result = None
-                    logger.exception('check had an unhandled error: %s', check)
-                    self.internal_errors.append(error)
-                if result:
-                    code, message = result
-                    # XXX This is not ideal, we shouldn't need to get all the way here
-                    # to make sure this is actually ignored. (Or maybe it doesn't matter?)
-                    if code in self.ignore:
-                        self.skipped += 1
-                        # avoid writing anything else to the terminal, and just
-                        # go to the next check
-                        continue
-                    if not has_error:
-                        terminal.loader.write(' %s' % terminal.red(host))
-                        terminal.write.write('\n')
-
-                    if code.startswith('E'):
-                        self.errors += 1
-                        code = terminal.red(code)
-                    elif code.startswith('W'):
-                        self.warnings += 1
-                        code = terminal.yellow(code)
-                    terminal.write.write("   %s: %s\n" % (code, message))
-                    has_error = True
-                else:
-                    self.passed += 1
-
-        if not has_error:
-            terminal.loader.write(' %s\n' % terminal.green(host))
+        self.merge(run_checks(
+            host, daemon_type, checks, (host, data), self.ignore, self.profile, maps))
+
+    def merge(self, results):
+        """
+        Add the results of a host into the totals, and report its failures
+        """
+        self.passed += results.passed
+        self.skipped += results.skipped
+        self.internal_errors.extend(results.internal_errors)
+        for name, key in results.keys.items():
+            hosts = self.groups.setdefault(name, OrderedDict()).setdefault(key, [])
+            # collocated daemons map the same host more than once
+            if results.host not in hosts:
+                hosts.append(results.host)
+        if self.profile:
+            for result in results.results:
+                self.profiles.setdefault(result.check, CheckProfile(result.check)).add(result)
+        if self.stream is not None:
+            for result in results.results:
+                write_record(self.stream, result.to_dict())
+
+        failures = results.failures
+        if not failures:
+            terminal.loader.write(' %s\n' % terminal.green(results.host))
+            return
+
+        terminal.loader.write(' %s' % terminal.red(results.host))
+        terminal.write.write('\n')
+        for failure in failures:
+            code, message = failure.code, failure.message
+            if code.startswith('E'):
+                self.errors += 1
+                code = terminal.red(code)
+            elif code.startswith('W'):
+                self.warnings += 1
+                code = terminal.yellow(code)
+            terminal.write.write("   %s: %s\n" % (code, message))
 
 
 run_errors = terminal.yellow("""
@@ -155,6 +426,32 @@ configured log file and report the issue along with the traceback.
 """)
 
 
+def write_record(stream, record):
+    """
+    Write a single JSON record as one line, flushing right away so that the
+    stream can be consumed while checks are still running
+    """
+    stream.write(json.dumps(record, sort_keys=True) + '\n')
+    stream.flush()
+
+
+def summary(results):
+    """
+    The same totals that ``report`` writes to the terminal, as a JSON
+    serializable record
+    """
+    return dict(
+        type='summary',
+        passed=results.passed,
+        errors=results.errors,
+        warnings=results.warnings,
+        skipped=results.skipped,
+        internal_errors=len(results.internal_errors),
+        hosts=results.total_hosts,
+        total=results.total,
+    )
+
+
 def report(results):
     msg = "\n{passed}{error}{warning}{skipped}{internal_errors}{hosts}"
 
@@ -188,6 +485,22 @@ def report(results):
         terminal.write.raw(run_errors % len(results.internal_errors))
 
 
+def report_profile(results, limit=None):
+    """
+    Ranked table of the checks that took the most time in total, across all
+    hosts
+    """
+    profiles = sorted(results.profiles.values(), key=lambda p: p.total, reverse=True)
+    terminal.write.bold('\n{title:-^30}\n'.format(title=' check profile '))
+    terminal.write.raw('   %-50s %6s %10s %10s %10s %12s' % (
+        'check', 'calls', 'total', 'mean', 'max', 'peak memory'))
+    for profile in profiles[:limit]:
+        memory = '%.1f KiB' % (profile.memory / 1024.0) if profile.memory is not None else '-'
+        terminal.write.raw('   %-50s %6s %9.3fs %9.4fs %9.4fs %12s' % (
+            profile.name, profile.calls, profile.total, profile.mean,
+            profile.slowest, memory))
+
+
 start_header_tmpl = """
 {title:=^80}
 Version:    {version: >4}    Cluster Name: "{cluster_name}"
@@ -229,7 +542,3 @@ def nodes_header(daemon_type):
     terminal.write.bold('\n{daemon:-^30}\n'.format(
         daemon=readable_daemons.get(daemon_type, daemon_type)))
 
-
-def collect_checks(module):
-    checks = [i for i in dir(module) if i.startswith('check')]
-    return checks
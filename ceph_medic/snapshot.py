@@ -0,0 +1,98 @@
+"""
+Persist the collected metadata to disk, and load it back, so that checks can
+be run again (for example with a different ``--ignore`` list) without having
+to connect and collect from every host.
+
+Snapshots are gzip-compressed JSON documents that record the format version
+they were written with, so that incompatible snapshots can be detected when
+loading them::
+
+    {
+        "version": 1,
+        "ceph_medic_version": "1.0.8",
+        "metadata": {...}
+    }
+"""
+import gzip
+import json
+import logging
+import os
+from ceph_medic import metadata, __version__
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def check_writable(path):
+    """
+    Raise ``RuntimeError`` if a snapshot can't be written to ``path``, so that
+    a bad path is reported before spending time collecting. The file is not
+    created, since it may be the snapshot that is about to be loaded
+    """
+    if os.path.isdir(path):
+        raise RuntimeError('unable to save snapshot to %s: it is a directory' % path)
+    if os.path.exists(path):
+        writable = os.access(path, os.W_OK)
+    else:
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            raise RuntimeError(
+                'unable to save snapshot to %s: %s does not exist' % (path, directory))
+        writable = os.access(directory, os.W_OK)
+    if not writable:
+        raise RuntimeError('unable to save snapshot to %s: permission denied' % path)
+
+
+def save(path, _metadata=None):
+    """
+    Write the (already collected) metadata to ``path``. Raises
+    ``RuntimeError`` if the file can't be written
+    """
+    _metadata = _metadata if _metadata is not None else metadata
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'ceph_medic_version': __version__,
+        'metadata': _metadata,
+    }
+    logger.info('saving metadata snapshot to: %s', path)
+    try:
+        with gzip.open(path, 'wb') as snapshot_file:
+            snapshot_file.write(
+                json.dumps(snapshot, separators=(',', ':')).encode('utf-8')
+            )
+    except (IOError, OSError) as error:
+        raise RuntimeError('unable to save snapshot to %s: %s' % (path, error))
+
+
+def load(path):
+    """
+    Read a snapshot from ``path`` and return the metadata it contains. Raises
+    ``RuntimeError`` if the file can't be read or if it was written with an
+    unsupported snapshot version
+    """
+    logger.info('loading metadata snapshot from: %s', path)
+    try:
+        with gzip.open(path, 'rb') as snapshot_file:
+            snapshot = json.loads(snapshot_file.read().decode('utf-8'))
+    except (IOError, OSError, ValueError) as error:
+        raise RuntimeError('unable to load snapshot %s: %s' % (path, error))
+
+    version = snapshot.get('version')
+    if version != SNAPSHOT_VERSION:
+        raise RuntimeError(
+            'unsupported snapshot version %s (expected %s) in: %s' % (
+                version, SNAPSHOT_VERSION, path)
+        )
+    return snapshot['metadata']
+
+
+def restore(path):
+    """
+    Load a snapshot and replace the contents of ``ceph_medic.metadata`` with
+    it, so that everything consuming the global metadata will see the
+    snapshot
+    """
+    loaded = load(path)
+    metadata.clear()
+    metadata.update(loaded)
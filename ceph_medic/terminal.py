@@ -1,4 +1,19 @@
+import atexit
 import sys
+import threading
+
+
+def _isatty(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        # no stream at all, or a closed one
+        return False
+
+
+# colors are only useful when stdout is attached to a terminal, there is no
+# reason to build them when output is redirected to a file or a pipe
+use_colors = _isatty(sys.__stdout__) and sys.platform != 'win32'
 
 
 class colorize(str):
@@ -18,13 +33,23 @@ class colorize(str):
         string._set_attributes()
         string.red
 
+    Colors are built only when they are requested, so ``colorize.make`` does
+    not need ``_set_attributes`` anymore.
     """
 
     def __init__(self, string):
         self.stdout = sys.__stdout__
         self.appends = ''
         self.prepends = ''
-        self.isatty = self.stdout.isatty()
+        self.isatty = _isatty(self.stdout)
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set, so that a color is
+        # built the first time it is used
+        colors = self.__colors__
+        if name not in colors:
+            raise AttributeError(name)
+        return self.make_color(colors[name])
 
     def _set_attributes(self):
         """
@@ -64,20 +89,27 @@ class colorize(str):
         the str object doesn't allow extra arguments passed in to the
         constructor
         """
-        obj = cls(string)
-        obj._set_attributes()
-        return obj
+        return cls(string)
+
+
+def _color(name):
+    def color(string):
+        if not use_colors:
+            return string
+        return getattr(colorize(string), name)
+    return color
+
 
 #
 # Common string manipulations
 #
 red_arrow = colorize.make('-->').red
 blue_arrow = colorize.make('-->').blue
-yellow = lambda x: colorize.make(x).yellow
-blue = lambda x: colorize.make(x).blue
-green = lambda x: colorize.make(x).green
-red = lambda x: colorize.make(x).red
-bold = lambda x: colorize.make(x).bold
+yellow = _color('yellow')
+blue = _color('blue')
+green = _color('green')
+red = _color('red')
+bold = _color('bold')
 
 
 CRITICAL = 5
@@ -106,6 +138,44 @@ _level_colors = {
 }
 
 
+class _Buffer(object):
+    """
+    Collects everything written to ``stream`` and writes it out in batches
+    of (about) ``size`` characters, instead of once per line. Used for stdout
+    when it is not a terminal (e.g. redirected to a log file), where nobody
+    is watching lines appear one by one.
+    """
+
+    def __init__(self, stream, size=64 * 1024):
+        self.stream = stream
+        self.size = size
+        self.pending = []
+        self.length = 0
+        # hosts are collected (and report progress) from many threads
+        self.lock = threading.Lock()
+
+    def write(self, string):
+        with self.lock:
+            self.pending.append(string)
+            self.length += len(string)
+            if self.length >= self.size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            self.stream.write(''.join(self.pending))
+            self.pending = []
+            self.length = 0
+        self.stream.flush()
+
+    def isatty(self):
+        return False
+
+
 class _Write(object):
 
     def __init__(self, _writer=None, prefix='', suffix='', clear_line=False, flush=False):
@@ -134,8 +204,24 @@ class _Write(object):
             self._writer.flush()
 
 
-write = _Write()
-loader = _Write(prefix='\r', clear_line=True)
+stdout = sys.stdout if _isatty(sys.stdout) else _Buffer(sys.stdout)
+write = _Write(stdout)
+loader = _Write(stdout, prefix='\r', clear_line=True)
+
+
+def flush():
+    """
+    Write out anything that is still buffered for stdout
+    """
+    if isinstance(stdout, _Buffer):
+        try:
+            stdout.flush()
+        except ValueError:
+            # stdout was closed already, like when exiting
+            pass
+
+
+atexit.register(flush)
 
 
 class LogMessage(object):
@@ -177,6 +263,8 @@ class LogMessage(object):
 
     def write(self):
         if not self.skip():
+            # keep the ordering with whatever is still buffered for stdout
+            flush()
             self.writer.write(self.line())
 
     def get_config_level(self):
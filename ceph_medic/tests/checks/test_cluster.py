@@ -33,4 +33,61 @@ class TestNearfull(object):
         assert cluster.check_nearfull() == ('ECLS2', 'Cluster is nearfull')
     def test_osd_map_is_not_nearfull(self):
         metadata['cluster'] = {'status': {'osdmap': {'osdmap': {'nearfull': False}}}}
-    
\ No newline at end of file
+
+
+class TestReasonableRatios(object):
+
+    def setup(self):
+        metadata['cluster'] = {'osd_dump': {}}
+
+    def teardown(self):
+        metadata['cluster'] = {}
+
+    def test_osd_dump_is_missing(self):
+        metadata['cluster'] = {}
+        assert cluster.check_reasonable_ratios() is None
+
+    def test_ratios_are_all_very_reasonable(self):
+        metadata['cluster']['osd_dump'] = {
+          "backfillfull_ratio": 0.9,
+          "nearfull_ratio": 0.85,
+          "full_ratio": 0.95
+        }
+        assert cluster.check_reasonable_ratios() is None
+
+    def test_all_ratios_are_messed_up(self):
+        metadata['cluster']['osd_dump'] = {
+          "backfillfull_ratio": 0.91,
+          "nearfull_ratio": 0.84,
+          "full_ratio": 0.92
+        }
+        code, msg = cluster.check_reasonable_ratios()
+        assert code == 'WOSD4'
+        assert 'backfillfull_ratio, full_ratio, nearfull_ratio' in msg
+
+    def test_backfillfull_is_messed_up(self):
+        metadata['cluster']['osd_dump'] = {
+          "backfillfull_ratio": 0.91,
+          "nearfull_ratio": 0.85,
+          "full_ratio": 0.95
+        }
+        code, msg = cluster.check_reasonable_ratios()
+        assert msg.endswith('backfillfull_ratio')
+
+    def test_nearfull_is_messed_up(self):
+        metadata['cluster']['osd_dump'] = {
+          "backfillfull_ratio": 0.9,
+          "nearfull_ratio": 0.88,
+          "full_ratio": 0.95
+        }
+        code, msg = cluster.check_reasonable_ratios()
+        assert msg.endswith('nearfull_ratio')
+
+    def test_full_is_messed_up(self):
+        metadata['cluster']['osd_dump'] = {
+          "backfillfull_ratio": 0.9,
+          "nearfull_ratio": 0.89,
+          "full_ratio": 0.95
+        }
+        code, msg = cluster.check_reasonable_ratios()
+        assert msg.endswith('full_ratio')
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from ceph_medic.checks import common
 from ceph_medic import metadata
 
@@ -33,15 +34,20 @@ class TestGetFsid(object):
         fsid = common.get_fsid(data)
         assert fsid == '1234-lkjh'
 
-    def test_fsids_have_parity(self, make_nodes, make_data):
-        metadata['nodes'] = make_nodes(mons=['node1', 'node2'])
-        node1_data = make_data()
+    def test_fsids_have_parity(self):
+        groups = OrderedDict([('1234-lkjh', ['node1', 'node2'])])
+        assert common.check_cluster_fsid(groups) is None
+
+    def test_fsids_differ(self):
+        groups = OrderedDict([('1234', ['node1', 'node2']), ('5678', ['node3'])])
+        code, msg = common.check_cluster_fsid(groups)
+        assert code == 'ECOM5'
+        assert '1234: node1,node2' in msg
+        assert '5678: node3' in msg
+
+    def test_maps_conf_fsid(self):
         data = self.make_metadata("[global]\nfsid = 1234-lkjh   \n\n[mdss]\ndisabled=true\n")
-        node1_data["paths"] = data["paths"]
-        metadata['mons']['node1'] = node1_data
-        metadata['mons']['node2'] = node1_data
-        result = common.check_cluster_fsid('node1', node1_data)
-        assert result is None
+        assert common.conf_fsid('node1', data) == '1234-lkjh'
 
     def test_fsid_does_not_exist(self, make_nodes, make_data):
         metadata['nodes'] = make_nodes(mons=['node1'])
@@ -61,18 +67,9 @@ class TestGetFsid(object):
         result = common.check_fsid_exists('node1', node1_data)
         assert result is None
 
-    def test_ignores_empty_fsid_during_cluster_fsid_check(self, make_nodes, make_data):
-        metadata['nodes'] = make_nodes(mons=['node1', 'node2'])
-        node1_data = make_data()
-        node2_data = make_data()
-        data = self.make_metadata("[global]\nfsid = 1234-lkjh   \n\n[mdss]\ndisabled=true\n")
-        node1_data["paths"] = data["paths"]
+    def test_maps_empty_fsid(self):
         data = self.make_metadata("[global]\nfoo = 1234-lkjh   \n\n[mdss]\ndisabled=true\n")
-        node2_data["paths"] = data["paths"]
-        metadata['mons']['node1'] = node1_data
-        metadata['mons']['node2'] = node2_data
-        result = common.check_cluster_fsid('node1', node1_data)
-        assert result is None
+        assert common.conf_fsid('node1', data) == ''
 
 
 class TestGetCommonFSID(object):
@@ -172,24 +169,18 @@ class TestCheckFSIDPerDaemon(object):
 
 class TestCephVersionParity(object):
 
-    def setup(self):
-        metadata['cluster_name'] = 'ceph'
+    def test_finds_a_mismatch_of_versions(self):
+        groups = OrderedDict([('12.2.1', ['node1']), ('13', ['node2'])])
+        code, msg = common.check_ceph_version_parity(groups)
+        assert 'Ceph version differs between hosts' in msg
+        assert '13: node2' in msg
 
-    def test_finds_a_mismatch_of_versions(self, make_nodes, make_data):
-        metadata['nodes'] = make_nodes(mons=['node1', 'node2'])
-        node1_data = make_data()
-        metadata['mons']['node1'] = node1_data
-        metadata['mons']['node2'] = make_data({'ceph': {'version': '13'}})
-        result = common.check_ceph_version_parity('node1', node1_data)
-        assert 'Ceph version "12.2.1" is different' in str(result)
+    def test_versions_have_parity(self):
+        groups = OrderedDict([('12.2.1', ['node1', 'node2'])])
+        assert common.check_ceph_version_parity(groups) is None
 
-    def test_versions_have_parity(self, make_nodes, make_data):
-        metadata['nodes'] = make_nodes(mons=['node1', 'node2'])
-        node1_data = make_data()
-        metadata['mons']['node1'] = node1_data
-        metadata['mons']['node2'] = make_data()
-        result = common.check_ceph_version_parity('node1', node1_data)
-        assert result is None
+    def test_maps_installed_version(self, make_data):
+        assert common.installed_version('node1', make_data()) == '12.2.1'
 
 
 class TestCephSocketAndInstalledVersionParity(object):
@@ -242,6 +233,21 @@ class TestCephSocketAndInstalledVersionParity(object):
         result = common.check_ceph_socket_and_installed_version_parity('node1', node1_data)
         assert result is None
 
+    def test_socket_without_version(self, make_nodes, make_data):
+        metadata['nodes'] = make_nodes(mons=['node1'])
+        node1_data = make_data(
+            {'ceph': {
+                "sockets": {
+                    "/var/run/ceph/osd.asok": {"exception": {"name": "OSError"}},
+                },
+                "installed": True,
+                "version": "12.2.1",
+            }}
+        )
+        metadata['mons']['node1'] = node1_data
+        result = common.check_ceph_socket_and_installed_version_parity('node1', node1_data)
+        assert result is None
+
 
 class TestRgwNumRadosHandles(object):
 
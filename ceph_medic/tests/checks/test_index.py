@@ -0,0 +1,69 @@
+from ceph_medic.checks import index
+
+
+def make_socket(fsid):
+    return {'config': {'fsid': fsid}}
+
+
+class TestClusterIndex(object):
+
+    def make_metadata(self, make_data, hosts):
+        """
+        ``hosts`` is a mapping of hostname to the fsids of its sockets
+        """
+        _metadata = {'mons': {}}
+        for hostname, fsids in hosts.items():
+            sockets = dict(
+                ('/var/run/ceph/%s.%s.asok' % (hostname, i), make_socket(fsid))
+                for i, fsid in enumerate(fsids)
+            )
+            _metadata['mons'][hostname] = make_data(
+                {'ceph': {'installed': True, 'version': '12.2.1', 'sockets': sockets}})
+        return _metadata
+
+    def test_socket_fsids(self, make_data):
+        _metadata = self.make_metadata(make_data, {'node1': ['aaaa', 'bbbb'], 'node2': ['aaaa']})
+        cluster = index.ClusterIndex(_metadata)
+        assert cluster.socket_fsids['aaaa'] == 2
+        assert cluster.socket_fsids['bbbb'] == 1
+
+    def test_common_fsid(self, make_data):
+        _metadata = self.make_metadata(make_data, {'node1': ['aaaa', 'bbbb'], 'node2': ['aaaa']})
+        assert index.ClusterIndex(_metadata).common_fsid == 'aaaa'
+
+    def test_no_common_fsid(self):
+        cluster = index.ClusterIndex({'nodes': {}})
+        assert cluster.common_fsid == ''
+
+    def test_aggregates_are_computed_once(self, make_data, monkeypatch):
+        _metadata = self.make_metadata(make_data, {'node1': ['aaaa'], 'node2': ['aaaa']})
+        calls = []
+        get_host_fsids = index.get_host_fsids
+
+        def counting(data):
+            calls.append(data)
+            return get_host_fsids(data)
+        monkeypatch.setattr(index, 'get_host_fsids', counting)
+        cluster = index.ClusterIndex(_metadata)
+        cluster.common_fsid
+        cluster.common_fsid
+        assert len(calls) == 2
+
+
+class TestGet(object):
+
+    def test_returns_built_index(self):
+        _metadata = {'nodes': {}}
+        built = index.build(_metadata)
+        assert index.get(_metadata) is built
+
+    def test_different_metadata_gets_a_new_index(self):
+        index.build({'nodes': {}})
+        _metadata = {'nodes': {}}
+        assert index.get(_metadata).metadata is _metadata
+
+    def test_cleared(self):
+        _metadata = {'nodes': {}}
+        built = index.build(_metadata)
+        index.clear()
+        assert index.get(_metadata) is not built
@@ -1,5 +1,7 @@
+from collections import OrderedDict
 from ceph_medic import metadata
-from ceph_medic.checks import mons
+from ceph_medic.remote import functions
+from ceph_medic.checks import index, mons
 
 
 class TestGetSecret(object):
@@ -28,11 +30,11 @@ class TestGetSecret(object):
                caps mon = "allow *"
         """
         self.set_contents(contents)
-        result = mons.get_secret(self.data)
+        result = index.get_secret(self.data)
         assert result == 'AQBvaBFZAAAAABAA9VHgwCg3rWn8fMaX8KL01A=='
 
     def test_get_no_secret_empty_file(self):
-        result = mons.get_secret(self.data)
+        result = index.get_secret(self.data)
         assert result == ''
 
     def test_get_no_secret_wrong_file(self):
@@ -41,9 +43,64 @@ class TestGetSecret(object):
                caps mon = "allow *"
         """
         self.set_contents(contents)
-        result = mons.get_secret(self.data)
+        result = index.get_secret(self.data)
         assert result == ''
 
+    def test_secret_digest_from_contents(self):
+        contents = """
+        [mon.]
+               key = AQBvaBFZAAAAABAA9VHgwCg3rWn8fMaX8KL01A==
+        """
+        self.set_contents(contents)
+        digest = mons.mon_secret_digest('mon0', self.data)
+        assert len(digest) == 12
+        assert 'AQBvaBFZ' not in digest
+
+    def test_secret_digest_from_remote_digests(self):
+        keyring = self.data['paths']['/var/lib/ceph']['files']['/var/lib/ceph/mon/ceph-mon-0/keyring']
+        keyring.pop('contents')
+        keyring['key_digests'] = {
+            'mon.': 'sha256:2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae'
+        }
+        assert mons.mon_secret_digest('mon0', self.data) == '2c26b46b68ff'
+
+    def test_remote_and_local_digests_match(self, tmpdir):
+        contents = '[mon.]\n\tkey = foo\n\tcaps mon = "allow *"\n'
+        self.set_contents(contents)
+        local = mons.mon_secret_digest('mon0', self.data)
+        keyring = tmpdir.join('keyring')
+        keyring.write(contents)
+        self.data['paths']['/var/lib/ceph']['files']['/var/lib/ceph/mon/ceph-mon-0/keyring'] = {
+            'key_digests': functions.keyring_digests(str(keyring))
+        }
+        assert mons.mon_secret_digest('mon0', self.data) == local == '2c26b46b68ff'
+
+    def test_caps_do_not_change_the_digest(self):
+        self.set_contents('[mon.]\n\tkey = foo\n')
+        digest = mons.mon_secret_digest('mon0', self.data)
+        self.set_contents('[mon.]\n    key = foo\n    caps mon = "allow *"\n')
+        assert mons.mon_secret_digest('mon0', self.data) == digest
+
+    def test_no_keyring_no_digest(self):
+        self.data['paths']['/var/lib/ceph']['files'] = {}
+        assert mons.mon_secret_digest('mon0', self.data) is None
+
+    def test_no_secret_no_digest(self):
+        assert mons.mon_secret_digest('mon0', self.data) is None
+
+
+class TestCheckMonSecret(object):
+
+    def test_secrets_match(self):
+        groups = OrderedDict([('abcd', ['mon0', 'mon1'])])
+        assert mons.check_mon_secret(groups) is None
+
+    def test_secrets_differ(self):
+        groups = OrderedDict([('abcd', ['mon0', 'mon1']), ('ef01', ['mon2'])])
+        code, msg = mons.check_mon_secret(groups)
+        assert code == 'EMON1'
+        assert 'ef01: mon2' in msg
+
 
 class TestGetMonitorDirs(object):
 
@@ -0,0 +1,116 @@
+import pytest
+from ceph_medic import checks
+from ceph_medic.checks import registry
+
+
+@pytest.fixture
+def registered(monkeypatch):
+    monkeypatch.setattr(registry, 'checks', registry.OrderedDict())
+    return registry.checks
+
+
+class TestRegister(object):
+
+    def test_returns_the_function(self, registered):
+        def check_foo(host, data):
+            pass
+        assert registry.register('EFOO1')(check_foo) is check_foo
+
+    def test_scope_from_module(self, registered):
+        def check_foo(host, data):
+            pass
+        registry.register('EFOO1')(check_foo)
+        assert registered['test_registry'][0].name == 'check_foo'
+
+    def test_explicit_scope(self, registered):
+        def check_foo(host, data):
+            pass
+        registry.register('EFOO1', scope='osds')(check_foo)
+        assert registered['osds'][0].code == 'EFOO1'
+
+    @pytest.mark.parametrize('code, severity', [('EFOO1', 'error'), ('WFOO1', 'warning')])
+    def test_severity_from_code(self, registered, code, severity):
+        def check_foo(host, data):
+            pass
+        registry.register(code, scope='osds')(check_foo)
+        assert registered['osds'][0].severity == severity
+
+    def test_keeps_definition_order(self, registered):
+        registry.register('EFOO2', scope='osds')(lambda h, d: None)
+        registry.register('EFOO1', scope='osds')(lambda h, d: None)
+        assert [c.code for c in registered['osds']] == ['EFOO2', 'EFOO1']
+
+
+class TestGetChecks(object):
+
+    def test_ignores_codes(self, registered):
+        registry.register('EFOO1', scope='osds')(lambda h, d: None)
+        registry.register('EFOO2', scope='osds')(lambda h, d: None)
+        result = registry.get_checks('osds', ignore=['EFOO1'])
+        assert [c.code for c in result] == ['EFOO2']
+
+    def test_multiple_scopes_in_order(self, registered):
+        registry.register('EFOO1', scope='common')(lambda h, d: None)
+        registry.register('EFOO2', scope='osds')(lambda h, d: None)
+        result = registry.get_checks('common', 'osds')
+        assert [c.code for c in result] == ['EFOO1', 'EFOO2']
+
+    def test_unknown_scope(self, registered):
+        assert registry.get_checks('rgws') == []
+        assert registry.count('rgws') == 0
+
+
+class TestConfigKeys(object):
+
+    def test_no_keys_by_default(self, registered):
+        registry.register('EFOO1', scope='osds')(lambda h, d: None)
+        assert registered['osds'][0].config_keys == ()
+        assert registry.config_keys() == []
+
+    def test_keys_of_all_checks(self, registered):
+        registry.register('EFOO1', scope='osds', config_keys=['fsid'])(lambda h, d: None)
+        registry.map_reduce('EFOO2', lambda h, d: None, scope='mons', config_keys=['mon_host', 'fsid'])(
+            lambda groups: None)
+        assert registry.config_keys() == ['fsid', 'mon_host']
+
+    def test_registered_checks_declare_keys(self):
+        assert 'fsid' in registry.config_keys()
+        assert 'rgw_num_rados_handles' in registry.config_keys()
+
+
+class TestRegisteredChecks(object):
+
+    @pytest.mark.parametrize('module', [checks.common, checks.mons, checks.osds, checks.cluster])
+    def test_every_check_is_registered(self, module):
+        names = [i for i in dir(module) if i.startswith('check')]
+        scope = module.__name__.split('.')[-1]
+        registered = [c.name for c in registry.checks[scope]]
+        assert sorted(names) == sorted(registered)
+
+    def test_codes_are_unique(self):
+        codes = [c.code for scope in registry.checks.values() for c in scope]
+        assert len(codes) == len(set(codes))
+
+
+class TestMapReduce(object):
+
+    def test_reducers_are_not_host_checks(self, registered):
+        registry.map_reduce('EFOO1', lambda h, d: 'key', scope='common')(lambda groups: None)
+        registry.register('EFOO2', scope='common')(lambda h, d: None)
+        assert [c.code for c in registry.get_checks('common')] == ['EFOO2']
+        assert registry.count('common') == 1
+
+    def test_get_reducers_by_scope(self, registered):
+        registry.map_reduce('EFOO1', lambda h, d: 'key', scope='common')(lambda groups: None)
+        registry.map_reduce('EFOO2', lambda h, d: 'key', scope='mons')(lambda groups: None)
+        assert [c.code for c in registry.get_reducers('common', 'osds')] == ['EFOO1']
+        assert [c.code for c in registry.get_reducers()] == ['EFOO1', 'EFOO2']
+        assert registry.count_reducers() == 2
+
+    def test_get_reducers_ignores(self, registered):
+        registry.map_reduce('EFOO1', lambda h, d: 'key', scope='common')(lambda groups: None)
+        assert registry.get_reducers(ignore=['EFOO1']) == []
+
+    def test_format_groups(self):
+        groups = registry.OrderedDict([('a', ['node1', 'node2']), ('b', ['node3'])])
+        assert registry.format_groups(groups) == '\n    a: node1,node2\n    b: node3'
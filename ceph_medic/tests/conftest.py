@@ -1,6 +1,8 @@
 import pytest
 import random
 from ceph_medic import runner
+from ceph_medic.checks import index
+from ceph_medic.util import configuration
 import ceph_medic
 from ceph_medic.tests import base_metadata
 
@@ -27,6 +29,13 @@ def clear_metadata():
     ceph_medic.metadata = base_metadata
 
 
+@pytest.fixture(autouse=True)
+def clear_index():
+    yield
+    index.clear()
+    configuration.clear_cache()
+
+
 @pytest.fixture
 def mon_keyring():
     def make_keyring(default=False):
@@ -2,30 +2,6 @@ from mock import Mock
 from ceph_medic.remote import commands
 
 
-class TestCephSocketVersion(object):
-
-    def test_gets_socket_version(self, monkeypatch):
-        def mock_check(conn, cmd):
-            return (['{"version":"12.2.0"}'], [], 0)
-        monkeypatch.setattr(commands, 'check', mock_check)
-        result = commands.ceph_socket_version(Mock(), '/var/run/ceph/osd.asok')
-        assert 'version' in result
-
-    def test_handles_invalid_json(self, monkeypatch):
-        def mock_check(conn, cmd):
-            return (['version=12.2.0'], [], 0)
-        monkeypatch.setattr(commands, 'check', mock_check)
-        result = commands.ceph_socket_version(Mock(), '/var/run/ceph/osd.asok')
-        assert result == {}
-
-    def test_handles_non_zero_code(self, monkeypatch):
-        def mock_check(conn, cmd):
-            return (['version=12.2.0'], [], 1)
-        monkeypatch.setattr(commands, 'check', mock_check)
-        result = commands.ceph_socket_version(Mock(), '/var/run/ceph/osd.asok')
-        assert result == {}
-
-
 class TestCephVersion(object):
 
     def test_gets_ceph_version(self, stub_check):
@@ -43,19 +19,22 @@ class TestCephVersion(object):
         assert result is None
 
 
-class TestDaemonSocketConfig(object):
+class TestRunMany(object):
 
-    def test_loadable_json(self, stub_check, conn):
-        stub_check(
-            (['{"config": true}'], [], 0),
-            commands, 'check')
-        result = commands.daemon_socket_config(conn, '/')
-        assert result == {'config': True}
+    def test_returns_results_in_order(self, conn):
+        conn.remote_module = Mock()
+        conn.remote_module.run_many.return_value = [[['1'], [], 0], [[], ['error'], 1]]
+        result = commands.run_many(conn, [['echo', '1'], ['false']])
+        assert result == [(['1'], [], 0), ([], ['error'], 1)]
 
-    def test_unloadable_json(self, stub_check, conn):
-        stub_check(
-            (['{config: []}'], [], 0),
-            commands, 'check')
-        result = commands.daemon_socket_config(conn, '/')
-        assert result == {}
+    def test_commands_that_can_not_run(self, conn):
+        conn.remote_module = Mock()
+        conn.remote_module.run_many.return_value = [{'exception': {'repr': 'No such file'}}]
+        result = commands.run_many(conn, [['/does/not/exist']])
+        assert result == [([], ['No such file'], -1)]
 
+    def test_helpers_use_given_output(self, conn, monkeypatch):
+        monkeypatch.setattr(commands, 'check', Mock(side_effect=AssertionError))
+        assert commands.ceph_version(conn, (['ceph version 12.2.1'], [], 0)) == 'ceph version 12.2.1'
+        assert commands.ceph_is_installed(conn, (['/usr/bin/ceph'], [], 0)) is True
+        assert commands.ceph_is_installed(conn, ([], [], 1)) is False
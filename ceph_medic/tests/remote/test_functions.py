@@ -1,4 +1,12 @@
+import json
 import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+import pytest
 
 from ceph_medic.remote import functions
 
@@ -58,6 +66,52 @@ class TestStatPath(object):
             assert callable(value) is False
 
 
+class TestOwnerNames(object):
+
+    def setup(self):
+        functions.owners.clear()
+        functions.groups.clear()
+
+    def teardown(self):
+        functions.owners.clear()
+        functions.groups.clear()
+
+    def test_owner_is_looked_up_once(self, monkeypatch):
+        calls = []
+
+        def getpwuid(uid):
+            calls.append(uid)
+            return ('ceph',)
+        monkeypatch.setattr(functions.pwd, 'getpwuid', getpwuid)
+        assert functions.owner_name(167) == 'ceph'
+        assert functions.owner_name(167) == 'ceph'
+        assert calls == [167]
+
+    def test_group_is_looked_up_once(self, monkeypatch):
+        calls = []
+
+        def getgrgid(gid):
+            calls.append(gid)
+            return ('ceph',)
+        monkeypatch.setattr(functions.grp, 'getgrgid', getgrgid)
+        assert functions.group_name(167) == 'ceph'
+        assert functions.group_name(167) == 'ceph'
+        assert calls == [167]
+
+    def test_unknown_owner_falls_back_to_uid(self, monkeypatch):
+        def getpwuid(uid):
+            raise KeyError(uid)
+        monkeypatch.setattr(functions.pwd, 'getpwuid', getpwuid)
+        assert functions.owner_name(9999) == 9999
+        assert functions.owners[9999] == 9999
+
+    def test_unknown_group_falls_back_to_gid(self, monkeypatch):
+        def getgrgid(gid):
+            raise KeyError(gid)
+        monkeypatch.setattr(functions.grp, 'getgrgid', getgrgid)
+        assert functions.group_name(9999) == 9999
+
+
 class TestStatPathErrors(object):
 
     def test_captures_exceptions(self):
@@ -118,3 +172,442 @@ class TestPathTree(object):
         result = functions.path_tree(path)
         assert "dirs" in result
         assert os.path.join(path, "dir1") in result["dirs"]
+
+
+class TestWalk(object):
+
+    def walk(self, path, **kw):
+        return dict(
+            (absolute_path, is_dir) for absolute_path, is_dir, _ in functions.walk(path, **kw)
+        )
+
+    def test_files_and_dirs(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        assert self.walk(path) == {
+            os.path.join(path, "file1.txt"): False,
+            os.path.join(path, "dir1"): True,
+            os.path.join(path, "dir1/file2.txt"): False,
+        }
+
+    def test_same_result_without_scandir(self, tmpdir, monkeypatch):
+        path = str(tmpdir)
+        make_test_tree(path)
+        result = self.walk(path, skip_files=['file1.txt'])
+        monkeypatch.setattr(functions, 'scandir', None)
+        assert self.walk(path, skip_files=['file1.txt']) == result
+
+    def test_skipped_dirs_are_not_descended(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        assert list(self.walk(path, skip_dirs=['dir1']).keys()) == [os.path.join(path, "file1.txt")]
+
+    def test_symlinked_dirs_are_not_followed(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        os.symlink(os.path.join(path, "dir1"), os.path.join(path, "link"))
+        result = self.walk(path)
+        assert result[os.path.join(path, "link")] is True
+        assert os.path.join(path, "link/file2.txt") not in result
+
+    def test_stat_is_reused(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        for absolute_path, is_dir, stat in functions.walk(path):
+            assert stat().st_ino == os.stat(absolute_path).st_ino
+
+    def test_broken_symlinks_capture_exceptions(self, tmpdir):
+        path = str(tmpdir)
+        os.symlink(os.path.join(path, "missing"), os.path.join(path, "link"))
+        result = functions.path_metadata(path)
+        assert result["files"][os.path.join(path, "link")]["exception"]
+
+
+class TestPathMetadata(object):
+
+    def test_includes_root_path(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        result = functions.path_metadata(path)
+        assert path in result["dirs"]
+
+    def test_collects_root_path_when_no_files_or_dirs(self, tmpdir):
+        path = str(tmpdir)
+        result = functions.path_metadata(path)
+        assert list(result["dirs"].keys()) == [path]
+        assert result["files"] == {}
+
+    def test_stats_nested_files_and_dirs(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        result = functions.path_metadata(path)
+        assert "owner" in result["dirs"][os.path.join(path, "dir1")]
+        assert "owner" in result["files"][os.path.join(path, "dir1/file2.txt")]
+
+    def test_includes_file_contents(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        result = functions.path_metadata(path, get_contents=True)
+        assert result["files"][os.path.join(path, "file1.txt")]["contents"] == "foo"
+
+    def test_skips_contents_by_default(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        result = functions.path_metadata(path)
+        assert "contents" not in result["files"][os.path.join(path, "file1.txt")]
+
+    def test_honors_skip_rules(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        result = functions.path_metadata(path, skip_dirs=['dir1'], skip_files=['file1.txt'])
+        assert result["files"] == {}
+        assert list(result["dirs"].keys()) == [path]
+
+    def test_missing_path_captures_exception(self):
+        result = functions.path_metadata('/does/not/exist')
+        assert result["dirs"]["/does/not/exist"]["exception"]
+
+
+class TestConcurrently(object):
+
+    def test_preserves_order(self):
+        result = functions.concurrently(lambda x: x * 2, range(20), 4)
+        assert result == [x * 2 for x in range(20)]
+
+    def test_captures_exceptions(self):
+        def explode(item):
+            raise ValueError(item)
+        result = functions.concurrently(explode, ['a'], 2)
+        assert result[0]['exception']['name'] == 'ValueError'
+
+    def test_no_items(self):
+        assert functions.concurrently(lambda x: x, [], 4) == []
+
+
+class TestSocketInfo(object):
+
+    def test_queries_version_and_config(self, monkeypatch):
+        def fake_run(command, timeout=None):
+            if command[-1] == 'version':
+                return [b'{"version": "14.2.0"}'], [], 0
+            return [b'{"fsid": "1234"}'], [], 0
+        monkeypatch.setattr(functions, 'run', fake_run)
+        result = functions.socket_info(['/var/run/ceph/osd.0.asok'])
+        assert result['/var/run/ceph/osd.0.asok']['version'] == {'version': '14.2.0'}
+        assert result['/var/run/ceph/osd.0.asok']['config'] == {'fsid': '1234'}
+
+    def test_queries_every_socket(self, monkeypatch):
+        monkeypatch.setattr(functions, 'run', lambda command, timeout=None: ([b'{}'], [], 0))
+        sockets = ['/var/run/ceph/osd.%s.asok' % i for i in range(36)]
+        result = functions.socket_info(sockets)
+        assert sorted(result.keys()) == sorted(sockets)
+
+    def test_non_zero_exit_is_empty(self, monkeypatch):
+        monkeypatch.setattr(functions, 'run', lambda command, timeout=None: ([b'{}'], [], 1))
+        result = functions.socket_info(['/var/run/ceph/osd.0.asok'])
+        assert result['/var/run/ceph/osd.0.asok']['version'] == {}
+        assert result['/var/run/ceph/osd.0.asok']['config'] == {}
+
+    def test_includes_duration(self, monkeypatch):
+        monkeypatch.setattr(functions, 'run', lambda command, timeout=None: ([b'{}'], [], 0))
+        result = functions.socket_info(['/var/run/ceph/osd.0.asok'])
+        assert result['/var/run/ceph/osd.0.asok']['duration'] >= 0
+
+    def test_config_is_filtered_to_config_keys(self, monkeypatch):
+        def fake_run(command, timeout=None):
+            return [b'{"fsid": "1234", "cluster": "ceph", "debug_osd": "1/5"}'], [], 0
+        monkeypatch.setattr(functions, 'run', fake_run)
+        result = functions.socket_info(['/var/run/ceph/osd.0.asok'], config_keys=['fsid', 'missing'])
+        assert result['/var/run/ceph/osd.0.asok']['config'] == {'fsid': '1234'}
+
+    def test_full_config_without_config_keys(self, monkeypatch):
+        def fake_run(command, timeout=None):
+            return [b'{"fsid": "1234", "cluster": "ceph"}'], [], 0
+        monkeypatch.setattr(functions, 'run', fake_run)
+        result = functions.socket_info(['/var/run/ceph/osd.0.asok'])
+        assert result['/var/run/ceph/osd.0.asok']['config'] == {'fsid': '1234', 'cluster': 'ceph'}
+
+    def test_invalid_json_is_empty(self, monkeypatch):
+        monkeypatch.setattr(functions, 'run', lambda command, timeout=None: ([b'{config: []}'], [], 0))
+        result = functions.socket_info(['/var/run/ceph/osd.0.asok'])
+        assert result['/var/run/ceph/osd.0.asok']['config'] == {}
+
+
+class TestPathMetadataCached(object):
+
+    def test_unchanged_files_are_not_read(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        file1 = os.path.join(path, "file1.txt")
+        stat = functions.stat_path(file1)
+        cached = {file1: [stat['st_ino'], stat['st_mtime'], stat['st_size']]}
+        result = functions.path_metadata(path, get_contents=True, cached=cached)
+        assert result["files"][file1]["cached"] is True
+        assert "contents" not in result["files"][file1]
+        assert result["files"][os.path.join(path, "dir1/file2.txt")]["contents"] == "foo"
+
+    def test_changed_files_are_read(self, tmpdir):
+        path = str(tmpdir)
+        make_test_tree(path)
+        file1 = os.path.join(path, "file1.txt")
+        stat = functions.stat_path(file1)
+        cached = {file1: [stat['st_ino'], stat['st_mtime'], stat['st_size'] + 1]}
+        result = functions.path_metadata(path, get_contents=True, cached=cached)
+        assert "cached" not in result["files"][file1]
+        assert result["files"][file1]["contents"] == "foo"
+
+
+class TestCaptureContents(object):
+
+    policy = {'include': ['keyring', '*.conf'], 'max_bytes': 10}
+
+    def test_captures_included_files(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'ceph.conf')
+        make_test_file(filename, contents="[global]")
+        result = functions.stat_path(filename, get_contents=self.policy)
+        assert result["contents"] == "[global]"
+        assert "digest" not in result
+
+    def test_excluded_files_get_a_digest(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'whoami')
+        make_test_file(filename, contents="0")
+        result = functions.stat_path(filename, get_contents=self.policy)
+        assert "contents" not in result
+        assert result["contents_skipped"] == "excluded"
+        assert result["digest"] == functions.file_digest(filename)
+
+    def test_large_files_get_a_digest(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'keyring')
+        make_test_file(filename, contents="a" * 11)
+        result = functions.stat_path(filename, get_contents=self.policy)
+        assert "contents" not in result
+        assert result["contents_skipped"] == "size"
+
+    def test_binary_files_get_a_digest(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'keyring')
+        with open(filename, 'wb') as f:
+            f.write(b'\x00\x01')
+        result = functions.stat_path(filename, get_contents=self.policy)
+        assert "contents" not in result
+        assert result["contents_skipped"] == "binary"
+
+    def test_everything_is_included_without_include_patterns(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'whoami')
+        make_test_file(filename, contents="0")
+        result = functions.stat_path(filename, get_contents={'max_bytes': 10})
+        assert result["contents"] == "0"
+
+    def test_digest_is_sha256(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'file')
+        make_test_file(filename, contents="foo")
+        digest = functions.file_digest(filename)
+        assert digest == 'sha256:2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae'
+
+    def test_secrets_do_not_send_contents(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'keyring')
+        make_test_file(filename, contents="[mon.]\n\tkey = foo\n")
+        policy = dict(self.policy, secrets=['keyring'], max_bytes=None)
+        result = functions.stat_path(filename, get_contents=policy)
+        assert "contents" not in result
+        assert result["contents_skipped"] == "secret"
+        assert result["digest"] == functions.file_digest(filename)
+        assert result["key_digests"] == {
+            'mon.': 'sha256:2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae'
+        }
+
+    def test_secrets_match_full_paths(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'mon', 'ceph-0', 'keyring')
+        os.makedirs(os.path.dirname(filename))
+        make_test_file(filename, contents="foo")
+        policy = dict(self.policy, secrets=['*/mon/*/keyring'])
+        result = functions.stat_path(filename, get_contents=policy)
+        assert result["contents_skipped"] == "secret"
+
+    def test_secrets_do_not_match_other_paths(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'osd', 'ceph-0', 'keyring')
+        os.makedirs(os.path.dirname(filename))
+        make_test_file(filename, contents="foo")
+        policy = dict(self.policy, secrets=['*/mon/*/keyring'])
+        result = functions.stat_path(filename, get_contents=policy)
+        assert result["contents"] == "foo"
+
+    def test_digest_along_with_contents(self, tmpdir):
+        filename = os.path.join(str(tmpdir), 'ceph.conf')
+        make_test_file(filename, contents="foo")
+        policy = dict(self.policy, digest=True)
+        result = functions.stat_path(filename, get_contents=policy)
+        assert result["contents"] == "foo"
+        assert result["digest"] == functions.file_digest(filename)
+
+
+class TestRun(object):
+
+    def test_captures_output_and_exit_code(self):
+        stdout, stderr, returncode = functions.run(['sh', '-c', 'echo out; echo err >&2; exit 3'])
+        assert stdout == [b'out']
+        assert stderr == [b'err']
+        assert returncode == 3
+
+    def test_slow_commands_are_killed(self):
+        start = time.time()
+        stdout, stderr, returncode = functions.run(['sleep', '5'], timeout=0.2)
+        assert time.time() - start < 5
+        assert returncode != 0
+        assert b'timed out' in stderr[-1]
+
+
+class TestRunMany(object):
+
+    def test_results_are_in_order(self):
+        result = functions.run_many([['echo', '1'], ['echo', '2'], ['false']])
+        assert result == [[['1'], [], 0], [['2'], [], 0], [[], [], 1]]
+
+    def test_runs_concurrently(self):
+        start = time.time()
+        functions.run_many([['sleep', '0.5']] * 4, workers=4)
+        assert time.time() - start < 1.5
+
+    def test_missing_executables_capture_exceptions(self):
+        result = functions.run_many([['/does/not/exist'], ['echo', '1']])
+        assert result[0]['exception']
+        assert result[1] == [['1'], [], 0]
+
+    def test_timeout_applies_to_each_command(self):
+        result = functions.run_many([['sleep', '5'], ['echo', '1']], timeout=0.2)
+        assert 'timed out' in result[0][1][-1]
+        assert result[1] == [['1'], [], 0]
+
+
+class FakeAdminSocket(object):
+    """
+    A unix socket server that answers every request like a daemon admin
+    socket would, recording the requests it gets
+    """
+
+    def __init__(self, path, responses):
+        self.path = path
+        self.responses = responses
+        self.requests = []
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(5)
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except (OSError, socket.error):
+                return
+            request = b''
+            while not request.endswith(b'\0'):
+                chunk = connection.recv(1024)
+                if not chunk:
+                    break
+                request += chunk
+            request = json.loads(request.rstrip(b'\0').decode('utf-8'))
+            self.requests.append(request)
+            response = self.responses.get(request['prefix'], b'')
+            connection.sendall(struct.pack('>I', len(response)) + response)
+            connection.close()
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def admin_socket(request):
+    # unix socket paths are limited in length, tmpdir might be too long
+    path = os.path.join(tempfile.mkdtemp(), 'osd.0.asok')
+
+    def make(responses):
+        server = FakeAdminSocket(path, responses)
+        request.addfinalizer(server.close)
+        return server
+    return make
+
+
+class TestAdminSocketRequest(object):
+
+    def test_sends_json_command(self, admin_socket):
+        server = admin_socket({'config show': b'{}'})
+        functions.admin_socket_request(server.path, ['config', 'show'])
+        assert server.requests == [{'prefix': 'config show', 'format': 'json'}]
+
+    def test_reads_length_prefixed_response(self, admin_socket):
+        server = admin_socket({'version': b'{"version": "14.2.0"}'})
+        response = functions.admin_socket_request(server.path, ['version'])
+        assert response == u'{"version": "14.2.0"}'
+
+    def test_reads_large_responses(self, admin_socket):
+        config = json.dumps(dict(('option_%s' % i, str(i)) for i in range(20000)))
+        server = admin_socket({'config show': config.encode('utf-8')})
+        response = functions.admin_socket_request(server.path, ['config', 'show'])
+        assert len(json.loads(response)) == 20000
+
+    def test_missing_socket_raises(self):
+        with pytest.raises((OSError, socket.error)):
+            functions.admin_socket_request('/does/not/exist.asok', ['version'])
+
+
+class TestAdminSocketJson(object):
+
+    def test_uses_the_socket_directly(self, admin_socket, monkeypatch):
+        server = admin_socket({'version': b'{"version": "14.2.0"}'})
+        monkeypatch.setattr(functions, 'run', pytest.fail)
+        result = functions.admin_socket_json(server.path, ['version'])
+        assert result == {'version': '14.2.0'}
+
+    def test_falls_back_to_the_cli(self, monkeypatch):
+        commands = []
+
+        def fake_run(command, timeout=None):
+            commands.append(command)
+            return [b'{"version": "14.2.0"}'], [], 0
+        monkeypatch.setattr(functions, 'run', fake_run)
+        result = functions.admin_socket_json('/does/not/exist.asok', ['version'])
+        assert result == {'version': '14.2.0'}
+        assert commands[0][:3] == ['ceph', '--admin-daemon', '/does/not/exist.asok']
+
+    def test_falls_back_to_the_cli_on_invalid_json(self, admin_socket, monkeypatch):
+        server = admin_socket({'version': b'ERROR: unknown command'})
+        monkeypatch.setattr(functions, 'run', lambda command, timeout=None: ([b'{}'], [], 0))
+        assert functions.admin_socket_json(server.path, ['version']) == {}
+
+    def test_missing_cli_is_empty(self, monkeypatch):
+        def fake_run(command, timeout=None):
+            raise OSError(2, 'No such file or directory')
+        monkeypatch.setattr(functions, 'run', fake_run)
+        assert functions.admin_socket_json('/does/not/exist.asok', ['version']) == {}
+
+    def test_socket_info_without_the_cli(self, monkeypatch):
+        def fake_run(command, timeout=None):
+            raise OSError(2, 'No such file or directory')
+        monkeypatch.setattr(functions, 'run', fake_run)
+        result = functions.socket_info(['/does/not/exist.asok'])
+        assert result['/does/not/exist.asok']['version'] == {}
+        assert result['/does/not/exist.asok']['config'] == {}
+
+
+class TestKeyringDigests(object):
+
+    def test_digests_every_key(self, tmpdir):
+        keyring = tmpdir.join('keyring')
+        keyring.write('[mon.]\n\tkey = foo\n\tcaps mon = "allow *"\n[client.admin]\n\tkey = bar\n')
+        result = functions.keyring_digests(str(keyring))
+        assert sorted(result.keys()) == ['client.admin', 'mon.']
+        assert result['mon.'] == 'sha256:2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae'
+
+    def test_whitespace_and_caps_are_ignored(self, tmpdir):
+        first = tmpdir.join('first')
+        first.write('[mon.]\nkey=foo\n')
+        second = tmpdir.join('second')
+        second.write('[mon.]\n    key = foo  \n    caps mon = "allow *"\n')
+        assert functions.keyring_digests(str(first)) == functions.keyring_digests(str(second))
+
+    def test_keyring_without_keys(self, tmpdir):
+        keyring = tmpdir.join('keyring')
+        keyring.write('[mon.]\n\tcaps mon = "allow *"\n')
+        assert functions.keyring_digests(str(keyring)) == {}
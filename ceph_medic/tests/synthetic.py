@@ -0,0 +1,195 @@
+"""
+Build realistic ``ceph_medic.metadata`` for clusters of any shape, as if it
+had been collected from actual nodes, so that checks and the runner can be
+exercised (and timed) on clusters far larger than the hand-written metadata
+used in unit tests::
+
+    >>> cluster = make_metadata(mons=5, osd_hosts=2000, osds_per_host=24)
+    >>> len(cluster['osds'])
+    2000
+
+Every generated node agrees with the rest of the cluster (same fsid, same
+version, same monitor secret), so a run against it should report no errors
+and no warnings. Socket ``config show`` payloads have ``config_keys`` entries
+and, to keep memory in check, all the sockets of the same daemon type share
+the same (read-only) dictionary.
+"""
+FSID = '5e0d1fe2-1f47-4a0c-9d6a-0c3e8b9f3a11'
+VERSION = '12.2.1'
+MON_SECRET = 'AQBvaBFZAAAAABAA9VHgwCg3rWn8fMaX8KL01A=='
+
+# hostname prefixes and socket names for every daemon type
+daemons = {
+    'mons': ('mon', 'mon'),
+    'osds': ('osd', 'osd'),
+    'mgrs': ('mgr', 'mgr'),
+    'rgws': ('rgw', 'client.rgw'),
+    'mdss': ('mds', 'mds'),
+    'clients': ('client', None),
+}
+
+
+def stat(owner='ceph', group='ceph', size=4096, mode=16877):
+    return {
+        'exception': {},
+        'owner': owner,
+        'group': group,
+        'n_fields': 16,
+        'n_sequence_fields': 10,
+        'n_unnamed_fields': 3,
+        'st_atime': 1492721509.572292,
+        'st_blksize': 4096,
+        'st_blocks': 8,
+        'st_ctime': 1491259685.5462234,
+        'st_dev': 64769,
+        'st_gid': 167,
+        'st_ino': 1212,
+        'st_mode': mode,
+        'st_mtime': 1491259685.5462234,
+        'st_nlink': 2,
+        'st_rdev': 0,
+        'st_size': size,
+        'st_uid': 167,
+    }
+
+
+def file_stat(contents=None, **kw):
+    kw.setdefault('mode', 33188)
+    metadata = stat(size=len(contents or ''), **kw)
+    if contents is not None:
+        metadata['contents'] = contents
+    return metadata
+
+
+def ceph_conf(fsid, mon_hosts):
+    return (
+        '[global]\n'
+        'fsid = %s\n'
+        'mon initial members = %s\n'
+        'mon host = %s\n'
+        'auth cluster required = cephx\n'
+        'auth service required = cephx\n'
+        'auth client required = cephx\n'
+        'osd pool default size = 3\n'
+        'osd pool default min size = 2\n'
+        'public network = 10.0.0.0/16\n'
+    ) % (fsid, ','.join(mon_hosts), ','.join(mon_hosts))
+
+
+def socket_config(fsid, config_keys):
+    """
+    A ``config show`` payload with ``config_keys`` entries, including the ones
+    checks look at
+    """
+    config = dict(('option_%04d' % i, str(i)) for i in range(config_keys))
+    config.update({
+        'fsid': fsid,
+        'cluster': 'ceph',
+        'rgw_num_rados_handles': '1',
+        'osd_pool_default_size': '3',
+        'osd_pool_default_min_size': '2',
+    })
+    return config
+
+
+def make_host(daemon_type, hostname, index, cluster_name, fsid, version,
+              mon_hosts, config, osds_per_host):
+    prefix, socket_name = daemons[daemon_type]
+    conf_path = '/etc/ceph/%s.conf' % cluster_name
+    etc_files = {
+        conf_path: file_stat(ceph_conf(fsid, mon_hosts)),
+        '/etc/ceph/%s.client.admin.keyring' % cluster_name: file_stat(
+            '[client.admin]\n\tkey = %s\n' % MON_SECRET),
+    }
+    lib_dirs = {'/var/lib/ceph': stat()}
+    lib_files = {}
+    sockets = {}
+
+    if daemon_type == 'osds':
+        ids = range(index * osds_per_host, (index + 1) * osds_per_host)
+    else:
+        ids = [hostname]
+
+    lib_dirs['/var/lib/ceph/%s' % prefix] = stat()
+    for _id in ids:
+        daemon_dir = '/var/lib/ceph/%s/%s-%s' % (prefix, cluster_name, _id)
+        lib_dirs[daemon_dir] = stat()
+        lib_files['%s/keyring' % daemon_dir] = file_stat(
+            '[%s.]\n\tkey = %s\n\tcaps mon = "allow *"\n' % (prefix, MON_SECRET))
+        if daemon_type == 'osds':
+            lib_files['%s/ceph_fsid' % daemon_dir] = file_stat('%s\n' % fsid)
+            lib_files['%s/whoami' % daemon_dir] = file_stat('%s\n' % _id)
+        if socket_name:
+            path = '/var/run/ceph/%s-%s.%s.asok' % (cluster_name, socket_name, _id)
+            sockets[path] = {'version': {'version': version}, 'config': config}
+
+    run_files = dict((path, file_stat(mode=49645)) for path in sockets)
+
+    return {
+        'ceph': {
+            'installed': True,
+            'version': 'ceph version %s (0123456789abcdef) luminous (stable)' % version,
+            'sockets': sockets,
+        },
+        'paths': {
+            '/etc/ceph': {'dirs': {'/etc/ceph': stat()}, 'files': etc_files},
+            '/var/lib/ceph': {'dirs': lib_dirs, 'files': lib_files},
+            '/var/run/ceph': {'dirs': {'/var/run/ceph': stat()}, 'files': run_files},
+        },
+        'network': {},
+        'devices': {},
+        'timings': {'connect': 0.1, 'ceph': 0.1, 'sockets': 0.1, 'total': 0.5},
+    }
+
+
+def make_cluster(fsid, osds):
+    return {
+        'status': {
+            'fsid': fsid,
+            'health': {'status': 'HEALTH_OK'},
+            'osdmap': {'osdmap': {
+                'num_osds': osds, 'num_up_osds': osds, 'num_in_osds': osds,
+                'full': False, 'nearfull': False,
+            }},
+        },
+        'osd_dump': {
+            'fsid': fsid,
+            'full_ratio': 0.95,
+            'backfillfull_ratio': 0.9,
+            'nearfull_ratio': 0.85,
+            'osds': [{'osd': i, 'up': 1, 'in': 1} for i in range(osds)],
+        },
+    }
+
+
+def make_metadata(mons=3, osd_hosts=6, osds_per_host=4, mgrs=0, rgws=0,
+                  mdss=0, clients=0, config_keys=1500, cluster_name='ceph',
+                  fsid=FSID, version=VERSION):
+    """
+    Generate metadata for a healthy cluster with the given number of hosts
+    for every daemon type
+    """
+    counts = {
+        'mons': mons, 'osds': osd_hosts, 'mgrs': mgrs, 'rgws': rgws,
+        'mdss': mdss, 'clients': clients,
+    }
+    metadata = {
+        'cluster_name': cluster_name,
+        'failed_nodes': {},
+        'nodes': {},
+        'cluster': make_cluster(fsid, osd_hosts * osds_per_host),
+    }
+    mon_hosts = ['mon%s' % i for i in range(mons)]
+    for daemon_type, count in counts.items():
+        prefix = daemons[daemon_type][0]
+        config = socket_config(fsid, config_keys)
+        hostnames = ['%s%s' % (prefix, i) for i in range(count)]
+        metadata['nodes'][daemon_type] = [{'host': host} for host in hostnames]
+        metadata[daemon_type] = dict(
+            (host, make_host(
+                daemon_type, host, i, cluster_name, fsid, version, mon_hosts,
+                config, osds_per_host))
+            for i, host in enumerate(hostnames)
+        )
+    return metadata
+
@@ -0,0 +1,94 @@
+import os
+import threading
+from ceph_medic import cache
+from ceph_medic.util import configuration
+
+
+def stat_metadata(contents=None, ino=1, mtime=1.5, size=10):
+    metadata = {'exception': {}, 'st_ino': ino, 'st_mtime': mtime, 'st_size': size}
+    if contents is not None:
+        metadata['contents'] = contents
+    return metadata
+
+
+class TestGetCacheDir(object):
+
+    def test_disabled_without_a_loaded_config(self):
+        assert cache.get_cache_dir() is None
+        assert cache.get('node1') is None
+
+    def test_disabled_when_not_configured(self, monkeypatch):
+        conf = configuration.load_string("[global]\n")
+        monkeypatch.setattr(cache.config, 'file', conf)
+        assert cache.get_cache_dir() is None
+
+    def test_uses_configured_directory(self, tmpdir, monkeypatch):
+        conf = configuration.load_string("[global]\ncollection_cache = %s\n" % str(tmpdir))
+        monkeypatch.setattr(cache.config, 'file', conf)
+        assert cache.get_cache_dir() == str(tmpdir)
+        assert cache.get('node1').path == os.path.join(str(tmpdir), 'node1.json')
+
+
+class TestFileCache(object):
+
+    def test_containers_get_separate_files(self, tmpdir):
+        file_cache = cache.FileCache(str(tmpdir), 'node1', 'ceph-osd-0')
+        assert file_cache.path.endswith('node1-ceph-osd-0.json')
+
+    def test_states_are_limited_to_root(self, tmpdir):
+        file_cache = cache.FileCache(str(tmpdir), 'node1')
+        file_cache.files = {
+            '/etc/ceph/ceph.conf': {'state': [1, 1.5, 10], 'contents': ''},
+            '/var/lib/ceph/mon/ceph-0/keyring': {'state': [2, 1.5, 10], 'contents': ''},
+        }
+        assert file_cache.states('/etc/ceph') == {'/etc/ceph/ceph.conf': [1, 1.5, 10]}
+
+    def test_update_fills_cached_contents(self, tmpdir):
+        file_cache = cache.FileCache(str(tmpdir), 'node1')
+        file_cache.files = {'/etc/ceph/ceph.conf': {'state': [1, 1.5, 10], 'contents': 'old'}}
+        files = {'/etc/ceph/ceph.conf': dict(stat_metadata(), cached=True)}
+        file_cache.update('/etc/ceph', files)
+        assert files['/etc/ceph/ceph.conf']['contents'] == 'old'
+        assert file_cache.files['/etc/ceph/ceph.conf']['contents'] == 'old'
+
+    def test_update_replaces_changed_contents(self, tmpdir):
+        file_cache = cache.FileCache(str(tmpdir), 'node1')
+        file_cache.files = {'/etc/ceph/ceph.conf': {'state': [1, 1.5, 10], 'contents': 'old'}}
+        files = {'/etc/ceph/ceph.conf': stat_metadata('new', mtime=2.5)}
+        file_cache.update('/etc/ceph', files)
+        assert file_cache.files['/etc/ceph/ceph.conf'] == {'state': [1, 2.5, 10], 'contents': 'new'}
+
+    def test_update_drops_removed_files(self, tmpdir):
+        file_cache = cache.FileCache(str(tmpdir), 'node1')
+        file_cache.files = {'/etc/ceph/old.conf': {'state': [1, 1.5, 10], 'contents': 'old'}}
+        file_cache.update('/etc/ceph', {})
+        assert file_cache.files == {}
+
+    def test_save_and_load(self, tmpdir):
+        cache_dir = os.path.join(str(tmpdir), 'cache')
+        file_cache = cache.FileCache(cache_dir, 'node1')
+        file_cache.update('/etc/ceph', {'/etc/ceph/ceph.conf': stat_metadata('contents')})
+        file_cache.save()
+        loaded = cache.FileCache(cache_dir, 'node1')
+        assert loaded.files == file_cache.files
+
+    def test_concurrent_saves_do_not_collide(self, tmpdir):
+        cache_dir = str(tmpdir)
+        caches = []
+        for i in range(10):
+            file_cache = cache.FileCache(cache_dir, 'node1')
+            file_cache.update('/etc/ceph', {'/etc/ceph/ceph.conf': stat_metadata('contents %s' % i)})
+            caches.append(file_cache)
+        threads = [threading.Thread(target=c.save) for c in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        loaded = cache.FileCache(cache_dir, 'node1')
+        assert loaded.files in [c.files for c in caches]
+        assert os.listdir(cache_dir) == ['node1.json']
+
+    def test_invalid_cache_file_is_ignored(self, tmpdir):
+        with open(os.path.join(str(tmpdir), 'node1.json'), 'w') as f:
+            f.write('{invalid')
+        assert cache.FileCache(str(tmpdir), 'node1').files == {}
@@ -0,0 +1,35 @@
+import pytest
+import ceph_medic
+from ceph_medic import check
+from ceph_medic.util import configuration
+
+
+@pytest.fixture
+def collected(monkeypatch):
+    monkeypatch.setattr(ceph_medic.config, 'file', configuration.load_string('[global]\n'))
+    monkeypatch.setattr(ceph_medic.config, 'nodes', {}, raising=False)
+    monkeypatch.setattr(ceph_medic.config, 'config_path', '/etc/ceph-medic.conf', raising=False)
+    monkeypatch.setattr(check.terminal.LogMessage, 'skip', lambda self: False)
+    collected = []
+    monkeypatch.setattr(check.collector, 'collect', lambda: collected.append(True))
+    return collected
+
+
+class TestJsonl(object):
+
+    def test_unwritable_path_fails_before_collecting(self, tmpdir, collected, capsys):
+        path = str(tmpdir.join('missing', 'results.jsonl'))
+        with pytest.raises(SystemExit):
+            check.Check(['ceph-medic', 'check', '--jsonl', path]).main()
+        assert collected == []
+        assert 'unable to write JSON Lines to %s' % path in capsys.readouterr().out
+
+
+class TestSaveSnapshot(object):
+
+    def test_unwritable_path_fails_before_collecting(self, tmpdir, collected, capsys):
+        path = str(tmpdir.join('missing', 'snapshot.gz'))
+        with pytest.raises(SystemExit):
+            check.Check(['ceph-medic', 'check', '--save-snapshot', path]).main()
+        assert collected == []
+        assert 'unable to save snapshot to %s' % path in capsys.readouterr().out
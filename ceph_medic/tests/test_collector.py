@@ -1,7 +1,11 @@
+import os
+import threading
 import pytest
 
-from ceph_medic import collector, metadata
+from ceph_medic import cache, collector, metadata
 from mock import Mock
+from execnet.gateway_bootstrap import HostNotFound
+from ceph_medic.util import configuration
 
 
 class FakeConnRemoteModule(object):
@@ -14,36 +18,35 @@ class FakeConnRemoteModule(object):
     value from the class attribute return_values.
 
     When creating an instance pass a dictionary that maps
-    function names to their return values.
+    function names to their return values. Every call is recorded in
+    ``calls`` so that tests can verify what was sent to the remote end.
     """
 
     def __init__(self, return_values):
         self.return_values = return_values
+        self.calls = []
 
     def stat_path(self, *args, **kwargs):
+        self.calls.append(('stat_path', args))
         return self.return_values.get('stat_path', {})
 
     def path_tree(self, *args, **kwargs):
+        self.calls.append(('path_tree', args))
         return self.return_values.get('path_tree', {})
 
+    def path_metadata(self, *args, **kwargs):
+        self.calls.append(('path_metadata', args))
+        return self.return_values.get('path_metadata', {})
 
-def get_tree(files=None, dirs=None):
-    if files is None:
-        files = ["file1.txt"]
-    if dirs is None:
-        dirs = ["dir1"]
-    tree = dict(
-        files=files,
-        dirs=dirs,
-    )
-    return tree
+    def run_many(self, *args, **kwargs):
+        self.calls.append(('run_many', args))
+        return self.return_values.get('run_many', [])
 
 
-def get_mock_connection(data=None, files=None, dirs=None):
+def get_mock_connection(data=None):
     conn = Mock()
-    tree = get_tree(files=files, dirs=dirs)
     default_data = dict(
-        path_tree=tree
+        path_metadata={'dirs': {'/some/path': {}}, 'files': {'/some/path/file1.txt': {}}}
     )
     data = data or default_data
     conn.remote_module = FakeConnRemoteModule(data)
@@ -60,17 +63,19 @@ class TestCollectPathMetadata(object):
     def test_metadata_includes_files(self):
         conn = get_mock_connection()
         result = collector.get_path_metadata(conn, "/some/path")
-        assert "dirs" in result
+        assert "files" in result
 
-    def test_metadata_includes_root_path(self):
+    def test_uses_a_single_remote_call(self):
         conn = get_mock_connection()
-        result = collector.get_path_metadata(conn, "/some/path")
-        assert "/some/path" in result["dirs"]
+        collector.get_path_metadata(conn, "/some/path")
+        assert [call[0] for call in conn.remote_module.calls] == ['path_metadata']
 
-    def test_collects_root_path_when_no_files_or_dirs(self):
-        conn = get_mock_connection(files=[], dirs=[])
-        result = collector.get_path_metadata(conn, "/some/path")
-        assert "/some/path" in result["dirs"]
+    def test_passes_options_to_the_remote_call(self):
+        conn = get_mock_connection()
+        collector.get_path_metadata(
+            conn, "/some/path", skip_dirs=['tmp'], skip_files=['superblock'], get_contents=True)
+        name, args = conn.remote_module.calls[0]
+        assert args == ("/some/path", ['tmp'], ['superblock'], True, None)
 
 
 class TestCollectPaths(object):
@@ -87,30 +92,78 @@ class TestCollectPaths(object):
         assert path in result
 
 
+class TestCollectPathsWithCache(object):
+
+    def test_sends_cached_states_and_saves(self, tmpdir, monkeypatch):
+        file_cache = cache.FileCache(str(tmpdir), 'node1')
+        file_cache.files = {
+            '/etc/ceph/ceph.conf': {'state': [1, 1.5, 10], 'contents': 'cached'},
+        }
+        sent = {}
+
+        def mock_metadata(conn, p, **kw):
+            sent[p] = kw.get('cached')
+            if p == '/etc/ceph':
+                return {'dirs': {}, 'files': {'/etc/ceph/ceph.conf': {
+                    'exception': {}, 'cached': True,
+                    'st_ino': 1, 'st_mtime': 1.5, 'st_size': 10}}}
+            return {'dirs': {}, 'files': {}}
+        monkeypatch.setattr(collector, 'get_path_metadata', mock_metadata)
+        result = collector.collect_paths(Mock(), file_cache)
+        assert sent['/etc/ceph'] == {'/etc/ceph/ceph.conf': [1, 1.5, 10]}
+        assert sent['/var/run/ceph'] is None
+        assert result['/etc/ceph']['files']['/etc/ceph/ceph.conf']['contents'] == 'cached'
+        assert os.path.exists(file_cache.path)
+
+
 class TestCollectSocketInfo(object):
 
-    def tests_collects_sockets(self, monkeypatch):
-        monkeypatch.setattr(collector.remote.commands, 'ceph_socket_version', lambda conn, socket: dict())
-        monkeypatch.setattr(collector.remote.commands, 'daemon_socket_config', lambda conn, socket: dict())
+    def get_connection(self):
+        conn = Mock()
+        conn.remote_module = FakeConnRemoteModule({})
+        conn.remote_module.socket_info = lambda sockets, workers, config_keys: dict(
+            (socket, {'version': {}, 'config': {}, 'config_keys': config_keys})
+            for socket in sockets
+        )
+        return conn
+
+    def test_only_requests_keys_used_by_checks(self):
         metadata = {
             'paths': {
                 '/var/run/ceph': {'files': ['/var/run/ceph/osd.asok']},
             },
         }
-        result = collector.collect_socket_info(Mock(), metadata)
+        result = collector.collect_socket_info(self.get_connection(), metadata)
+        assert 'fsid' in result['/var/run/ceph/osd.asok']['config_keys']
+
+    def tests_collects_sockets(self):
+        metadata = {
+            'paths': {
+                '/var/run/ceph': {'files': ['/var/run/ceph/osd.asok']},
+            },
+        }
+        result = collector.collect_socket_info(self.get_connection(), metadata)
         assert '/var/run/ceph/osd.asok' in result
 
-    def test_ignores_unknown_files(self, monkeypatch):
-        monkeypatch.setattr(collector.remote.commands, 'ceph_socket_version', lambda conn, socket: dict())
-        monkeypatch.setattr(collector.remote.commands, 'daemon_socket_config', lambda conn, socket: dict())
+    def test_ignores_unknown_files(self):
         metadata = {
             'paths': {
                 '/var/run/ceph': {'files': ['/var/run/ceph/osd.asok', '/var/run/ceph/osd.log']},
             },
         }
-        result = collector.collect_socket_info(Mock(), metadata)
+        result = collector.collect_socket_info(self.get_connection(), metadata)
         assert '/var/run/ceph/osd.log' not in result
 
+    def test_no_sockets_skips_remote_call(self):
+        conn = Mock()
+        metadata = {
+            'paths': {
+                '/var/run/ceph': {'files': ['/var/run/ceph/osd.log']},
+            },
+        }
+        assert collector.collect_socket_info(conn, metadata) == {}
+        assert conn.remote_module.socket_info.called is False
+
 
 class TestCollect(object):
 
@@ -126,7 +179,7 @@ class TestCollect(object):
             "osds": [{"host": "osd0"}],
         }
         metadata["cluster_name"] = "ceph"
-        def mock_metadata(conn, hostname, cluster_nodes):
+        def mock_metadata(conn, hostname, cluster_nodes, **kw):
             return dict(meta="data")
         monkeypatch.setattr(collector, "get_connection",
                             lambda host, container=None: Mock())
@@ -151,6 +204,360 @@ class TestGetNodeMetadata(object):
         monkeypatch.setattr(collector, "collect_network", mock_metadata)
         monkeypatch.setattr(collector, "collect_ceph_info", mock_metadata)
         monkeypatch.setattr(collector, "collect_socket_info", mock_metadata)
-        monkeypatch.setattr(collector, "collect_ceph_osd_info", mock_metadata)
         result = collector.get_node_metadata(Mock(), "mon0", [])
         assert key in result
+
+    def test_nodes_on_the_same_host_keep_their_own_module(self):
+        # two daemons on one host share a pooled connection, and the second
+        # one imports the remote functions while the first is collecting
+        conn = Mock()
+        modules = []
+
+        def import_module(module):
+            remote_module = FakeConnRemoteModule(dict(
+                path_metadata={'dirs': {}, 'files': {'/var/run/ceph/ceph-mon.mon0.asok': {}}},
+                run_many=[[['ceph version 12.2.1'], [], 0], [['/usr/bin/ceph'], [], 0]],
+            ))
+            remote_module.socket_info = Mock(return_value={})
+            conn.remote_module = remote_module
+            modules.append(remote_module)
+            return remote_module
+
+        conn.import_module = import_module
+        first_path_metadata = FakeConnRemoteModule.path_metadata
+
+        def path_metadata(self, *args):
+            if len(modules) == 1:
+                collector.get_node_metadata(conn, "mon0", [], container="mon-b")
+            return first_path_metadata(self, *args)
+
+        FakeConnRemoteModule.path_metadata = path_metadata
+        try:
+            collector.get_node_metadata(conn, "mon0", [], container="mon-a")
+        finally:
+            FakeConnRemoteModule.path_metadata = first_path_metadata
+        first, second = modules
+        for remote_module in modules:
+            names = [call[0] for call in remote_module.calls]
+            assert names == ['path_metadata'] * 3 + ['run_many']
+            assert remote_module.socket_info.call_count == 1
+
+
+class TestCollectCephInfo(object):
+
+    def test_runs_commands_with_a_single_call(self):
+        conn = get_mock_connection(dict(
+            run_many=[[['ceph version 12.2.1'], [], 0], [['/usr/bin/ceph'], [], 0]]
+        ))
+        result = collector.collect_ceph_info(conn)
+        assert result == {'version': 'ceph version 12.2.1', 'installed': True}
+        assert len(conn.remote_module.calls) == 1
+
+    def test_ceph_is_not_installed(self):
+        conn = get_mock_connection(dict(
+            run_many=[[[], ['not found'], 127], [[], [], 1]]
+        ))
+        result = collector.collect_ceph_info(conn)
+        assert result == {'version': None, 'installed': False}
+
+
+class TestGetSocketConfigKeys(object):
+
+    def test_keys_used_by_checks_without_a_loaded_config(self):
+        assert collector.get_socket_config_keys() == collector.checks.registry.config_keys()
+
+    def test_full_config(self, monkeypatch):
+        conf = configuration.load_string("[global]\nfull_socket_config = true\n")
+        monkeypatch.setattr(collector.config, 'file', conf)
+        assert collector.get_socket_config_keys() is None
+
+    def test_full_config_disabled(self, monkeypatch):
+        conf = configuration.load_string("[global]\nfull_socket_config = false\n")
+        monkeypatch.setattr(collector.config, 'file', conf)
+        assert 'fsid' in collector.get_socket_config_keys()
+
+
+class TestGetCollectionWorkers(object):
+
+    def test_defaults_without_a_loaded_config(self):
+        assert collector.get_collection_workers() == collector.DEFAULT_COLLECTION_WORKERS
+
+    def test_uses_configured_value(self, monkeypatch):
+        conf = configuration.load_string("[global]\ncollection_workers = 42\n")
+        monkeypatch.setattr(collector.config, 'file', conf)
+        assert collector.get_collection_workers() == 42
+
+    def test_invalid_value_uses_default(self, monkeypatch):
+        conf = configuration.load_string("[global]\ncollection_workers = many\n")
+        monkeypatch.setattr(collector.config, 'file', conf)
+        assert collector.get_collection_workers() == collector.DEFAULT_COLLECTION_WORKERS
+
+    def test_value_is_never_below_one(self, monkeypatch):
+        conf = configuration.load_string("[global]\ncollection_workers = 0\n")
+        monkeypatch.setattr(collector.config, 'file', conf)
+        assert collector.get_collection_workers() == 1
+
+
+class TestCollectConcurrently(object):
+
+    def setup(self):
+        for daemon in ('mons', 'osds'):
+            metadata[daemon] = {}
+        metadata['failed_nodes'] = {}
+        metadata['cluster'] = {}
+
+    def test_collects_all_hosts(self, monkeypatch):
+        metadata["nodes"] = {
+            "osds": [{"host": "osd%s" % i} for i in range(20)],
+        }
+        monkeypatch.setattr(collector, "get_connection",
+                            lambda host, container=None: Mock())
+        monkeypatch.setattr(collector, "get_node_metadata",
+                            lambda conn, hostname, cluster_nodes, **kw: dict(host=hostname))
+        collector.collect()
+        assert len(metadata["osds"]) == 20
+        assert metadata["osds"]["osd7"]["host"] == "osd7"
+
+    def test_failed_hosts_are_recorded(self, monkeypatch):
+        metadata["nodes"] = {
+            "osds": [{"host": "osd0"}, {"host": "osd1"}],
+        }
+
+        def get_connection(host, container=None):
+            if host == 'osd1':
+                raise HostNotFound('unreachable')
+            return Mock()
+        monkeypatch.setattr(collector, "get_connection", get_connection)
+        monkeypatch.setattr(collector, "get_node_metadata",
+                            lambda conn, hostname, cluster_nodes, **kw: dict(host=hostname))
+        collector.collect()
+        assert list(metadata["osds"].keys()) == ["osd0"]
+        assert "osd1" in metadata["failed_nodes"]
+        assert metadata["nodes"]["osds"] == [{"host": "osd0"}]
+
+    def test_cluster_data_is_collected_once(self, monkeypatch):
+        metadata["nodes"] = {
+            "mons": [{"host": "mon%s" % i} for i in range(5)],
+        }
+        calls = []
+
+        def collect_cluster(conn):
+            calls.append(conn)
+            return {'status': {}}
+        monkeypatch.setattr(collector, "get_connection",
+                            lambda host, container=None: Mock())
+        monkeypatch.setattr(collector, "get_node_metadata",
+                            lambda conn, hostname, cluster_nodes, **kw: {})
+        monkeypatch.setattr(collector, "collect_cluster", collect_cluster)
+        collector.collect()
+        assert len(calls) == 1
+
+
+class TestCollectCluster(object):
+
+    def test_collects_status_and_osd_dump(self, monkeypatch):
+        monkeypatch.setattr(collector.remote.commands, 'ceph_status', lambda conn: {'fsid': '1234'})
+        monkeypatch.setattr(collector.remote.commands, 'ceph_osd_dump', lambda conn: {'epoch': 1})
+        result = collector.collect_cluster(Mock())
+        assert result == {'status': {'fsid': '1234'}, 'osd_dump': {'epoch': 1}}
+
+    def test_skips_osd_dump_when_monitor_does_not_answer(self, monkeypatch):
+        dumps = []
+        monkeypatch.setattr(collector.remote.commands, 'ceph_status', lambda conn: {})
+        monkeypatch.setattr(collector.remote.commands, 'ceph_osd_dump', lambda conn: dumps.append(conn))
+        assert collector.collect_cluster(Mock()) == {}
+        assert dumps == []
+
+    def test_node_metadata_does_not_include_osd_dump(self, monkeypatch):
+        def mock_metadata(*args, **kwargs):
+            return dict(meta="data")
+        monkeypatch.setattr(collector, "collect_paths", mock_metadata)
+        monkeypatch.setattr(collector, "collect_ceph_info", mock_metadata)
+        monkeypatch.setattr(collector, "collect_socket_info", mock_metadata)
+        result = collector.get_node_metadata(Mock(), "mon0", [])
+        assert 'osd' not in result['ceph']
+
+
+class TestGetCollectionTimeout(object):
+
+    def test_no_limit_without_a_loaded_config(self):
+        assert collector.get_collection_timeout() is None
+
+    def test_uses_configured_value(self, monkeypatch):
+        conf = configuration.load_string("[global]\ncollection_timeout = 30\n")
+        monkeypatch.setattr(collector.config, 'file', conf)
+        assert collector.get_collection_timeout() == 30
+
+    @pytest.mark.parametrize('value', ['0', '-1', 'soon'])
+    def test_invalid_values_mean_no_limit(self, value, monkeypatch):
+        conf = configuration.load_string("[global]\ncollection_timeout = %s\n" % value)
+        monkeypatch.setattr(collector.config, 'file', conf)
+        assert collector.get_collection_timeout() is None
+
+
+class TestCollectTimeouts(object):
+
+    def setup(self):
+        metadata['osds'] = {}
+        metadata['failed_nodes'] = {}
+        metadata['cluster'] = {}
+
+    def test_slow_hosts_are_timed_out(self, monkeypatch):
+        metadata["nodes"] = {
+            "osds": [{"host": "osd0"}, {"host": "slow"}],
+        }
+        release = threading.Event()
+
+        def get_node_metadata(conn, hostname, cluster_nodes, job=None, **kw):
+            if hostname == 'slow':
+                release.wait(5)
+                collector.check_cancelled(job)
+            return dict(host=hostname)
+        monkeypatch.setattr(collector, "get_connection",
+                            lambda host, container=None: Mock())
+        monkeypatch.setattr(collector, "get_node_metadata", get_node_metadata)
+        monkeypatch.setattr(collector, "get_collection_timeout", lambda: 0.2)
+        try:
+            collector.collect()
+        finally:
+            release.set()
+        assert list(metadata["osds"].keys()) == ["osd0"]
+        assert "timed out" in metadata["failed_nodes"]["slow"]
+        assert metadata["nodes"]["osds"] == [{"host": "osd0"}]
+
+    def test_errors_only_fail_their_node(self, monkeypatch):
+        metadata["nodes"] = {
+            "osds": [{"host": "osd0"}, {"host": "broken"}],
+        }
+
+        def get_node_metadata(conn, hostname, cluster_nodes, **kw):
+            if hostname == 'broken':
+                raise RuntimeError('channel closed')
+            return dict(host=hostname)
+        monkeypatch.setattr(collector, "get_connection",
+                            lambda host, container=None: Mock())
+        monkeypatch.setattr(collector, "get_node_metadata", get_node_metadata)
+        collector.collect()
+        assert list(metadata["osds"].keys()) == ["osd0"]
+        assert metadata["failed_nodes"]["broken"] == 'channel closed'
+        assert metadata["nodes"]["osds"] == [{"host": "osd0"}]
+
+    def test_errors_leave_the_host_connection_open(self, monkeypatch):
+        metadata["nodes"] = {"osds": [{"host": "broken"}]}
+        closed = []
+        monkeypatch.setattr(collector.connection.pool, "close", closed.append)
+        job = collector.NodeJob('osds', {'host': 'broken'})
+        job.start()
+        result = Mock(**{'ready.return_value': True, 'get.side_effect': RuntimeError('boom')})
+        assert collector.wait_for_jobs([(job, result)], timeout=5) == 1
+        assert closed == []
+        assert metadata["failed_nodes"]["broken"] == 'boom'
+
+    def test_errors_on_every_node_fail_collection(self, monkeypatch):
+        metadata["nodes"] = {"osds": [{"host": "broken"}]}
+
+        def get_node_metadata(conn, hostname, cluster_nodes, **kw):
+            raise RuntimeError('channel closed')
+        monkeypatch.setattr(collector, "get_connection",
+                            lambda host, container=None: Mock())
+        monkeypatch.setattr(collector, "get_node_metadata", get_node_metadata)
+        with pytest.raises(RuntimeError) as error:
+            collector.collect()
+        assert 'All nodes failed' in str(error.value)
+
+    def test_timeouts_stop_the_other_nodes_of_the_host(self, monkeypatch):
+        metadata["nodes"] = {
+            "mons": [{"host": "node0"}],
+            "osds": [{"host": "node0"}, {"host": "node1"}],
+        }
+        metadata["mons"] = {}
+        closed = []
+        monkeypatch.setattr(collector.connection.pool, "close", closed.append)
+        slow = collector.NodeJob('mons', {'host': 'node0'})
+        sibling = collector.NodeJob('osds', {'host': 'node0'})
+        other = collector.NodeJob('osds', {'host': 'node1'})
+        for job in (slow, sibling, other):
+            job.start()
+        slow.started -= 10
+        running = Mock(**{'ready.return_value': False})
+        done = Mock(**{'ready.return_value': True, 'get.return_value': True})
+        failed = collector.wait_for_jobs(
+            [(slow, running), (sibling, running), (other, done)], timeout=5)
+        assert failed == 2
+        assert sibling.cancelled.is_set()
+        assert not other.cancelled.is_set()
+        assert closed == ['node0']
+        assert "timed out after 5 seconds" in metadata["failed_nodes"]["node0"]
+        assert metadata["nodes"] == {"mons": [], "osds": [{"host": "node1"}]}
+
+    def test_cancelled_jobs_do_not_write_metadata(self, monkeypatch):
+        job = collector.NodeJob('osds', {'host': 'osd0'})
+        job.cancel()
+        monkeypatch.setattr(collector, "get_connection",
+                            lambda host, container=None: Mock())
+        monkeypatch.setattr(collector, "get_node_metadata",
+                            lambda conn, hostname, cluster_nodes, **kw: dict(host=hostname))
+        with pytest.raises(collector.CollectionCancelled):
+            collector.collect_node(job, {})
+        assert metadata['osds'] == {}
+
+
+class TestNodeJob(object):
+
+    def test_not_expired_before_starting(self):
+        job = collector.NodeJob('osds', {'host': 'osd0'})
+        assert job.expired(0) is False
+
+    def test_never_expires_without_timeout(self):
+        job = collector.NodeJob('osds', {'host': 'osd0'})
+        job.start()
+        assert job.expired(None) is False
+
+    def test_expires(self):
+        job = collector.NodeJob('osds', {'host': 'osd0'})
+        job.start()
+        job.started -= 10
+        assert job.expired(5) is True
+
+
+class TestTimings(object):
+
+    def test_timed_records_duration(self):
+        timings = {}
+        with collector.timed(timings, 'phase'):
+            pass
+        assert timings['phase'] >= 0
+
+    def test_timed_without_timings(self):
+        with collector.timed(None, 'phase'):
+            pass
+
+    def test_paths_are_timed_separately(self, monkeypatch):
+        monkeypatch.setattr(collector, 'get_path_metadata', lambda conn, p, **kw: {'files': {}})
+        timings = {}
+        collector.collect_paths(Mock(), timings=timings)
+        assert sorted(timings.keys()) == [
+            'paths:/etc/ceph', 'paths:/var/lib/ceph', 'paths:/var/run/ceph']
+
+    def test_sockets_are_timed_separately(self):
+        conn = Mock()
+        conn.remote_module.socket_info.return_value = {
+            '/var/run/ceph/osd.asok': {'version': {}, 'config': {}, 'duration': 1.5}
+        }
+        node_metadata = {
+            'timings': {},
+            'paths': {'/var/run/ceph': {'files': ['/var/run/ceph/osd.asok']}},
+        }
+        result = collector.collect_socket_info(conn, node_metadata)
+        assert result == {'/var/run/ceph/osd.asok': {'version': {}, 'config': {}}}
+        assert node_metadata['timings'] == {'socket:/var/run/ceph/osd.asok': 1.5}
+
+    def test_connect_and_total_are_recorded(self, monkeypatch):
+        metadata['osds'] = {}
+        job = collector.NodeJob('osds', {'host': 'osd0'})
+        monkeypatch.setattr(collector, "get_connection",
+                            lambda host, container=None: Mock())
+        monkeypatch.setattr(collector, "get_node_metadata",
+                            lambda conn, hostname, cluster_nodes, **kw: {})
+        collector.collect_node(job, {})
+        assert sorted(metadata['osds']['osd0']['timings'].keys()) == ['connect', 'total']
@@ -0,0 +1,108 @@
+import threading
+import pytest
+import ceph_medic
+from ceph_medic import connection
+from ceph_medic.util import configuration
+
+
+class FakeConnection(object):
+
+    def __init__(self, hostname=None, **kw):
+        self.hostname = hostname
+        self.kw = kw
+        self.sudo = False
+        self.group = 'group-%s' % hostname
+        self.gateway = 'gateway-%s' % hostname
+        self.closed = False
+
+    def exit(self):
+        self.closed = True
+
+    def has_connection(self):
+        return not self.closed
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = connection.ConnectionPool()
+    monkeypatch.setattr(connection, 'pool', pool)
+    return pool
+
+
+class TestConnectionPool(object):
+
+    def test_reuses_connections(self, pool):
+        first = pool.get(('node1', 'ssh', None), lambda: FakeConnection('node1'))
+        second = pool.get(('node1', 'ssh', None), lambda: FakeConnection('node1'))
+        assert first is second
+
+    def test_different_keys_get_different_connections(self, pool):
+        first = pool.get(('node1', 'ssh', None), lambda: FakeConnection('node1'))
+        second = pool.get(('node1', 'docker', 'osd0'), lambda: FakeConnection('node1'))
+        assert first is not second
+
+    def test_replaces_dead_connections(self, pool):
+        first = pool.get(('node1', 'ssh', None), lambda: FakeConnection('node1'))
+        first.closed = True
+        second = pool.get(('node1', 'ssh', None), lambda: FakeConnection('node1'))
+        assert first is not second
+
+    def test_concurrent_callers_share_a_single_connection(self, pool):
+        created = []
+
+        def make():
+            created.append(1)
+            return FakeConnection('node1')
+        threads = [
+            threading.Thread(target=pool.get, args=(('node1', 'ssh', None), make))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(created) == 1
+
+    def test_close_a_single_host(self, pool):
+        node1 = pool.get(('node1', 'ssh', None), lambda: FakeConnection('node1'))
+        node2 = pool.get(('node2', 'ssh', None), lambda: FakeConnection('node2'))
+        pool.close('node1')
+        assert node1.closed is True
+        assert node2.closed is False
+        assert list(pool.connections.keys()) == [('node2', 'ssh', None)]
+
+    def test_close_everything(self, pool):
+        node1 = pool.get(('node1', 'ssh', None), lambda: FakeConnection('node1'))
+        node2 = pool.get(('node2', 'ssh', None), lambda: FakeConnection('node2'))
+        pool.close()
+        assert node1.closed and node2.closed
+        assert pool.connections == {}
+
+
+class TestGetConnection(object):
+
+    @pytest.fixture(autouse=True)
+    def config(self, monkeypatch):
+        monkeypatch.setattr(ceph_medic.config, 'ssh_config', None, raising=False)
+        monkeypatch.setattr(ceph_medic.config, 'cluster_name', 'ceph')
+
+    def test_baremetal_and_ssh_share_connections(self, pool, monkeypatch):
+        monkeypatch.setattr(connection.remoto.connection, 'get', lambda name: FakeConnection)
+        conf = configuration.load_string("[global]\ndeployment_type = baremetal\n")
+        monkeypatch.setattr(ceph_medic.config, 'file', conf)
+        first = connection.get_connection('node1')
+        second = connection.get_connection('node1', deployment_type='ssh')
+        assert first is second
+
+    def test_containers_share_the_host_gateway(self, pool, monkeypatch):
+        monkeypatch.setattr(connection.remoto.connection, 'get', lambda name: FakeConnection)
+        conf = configuration.load_string("[global]\ndeployment_type = docker\n")
+        monkeypatch.setattr(ceph_medic.config, 'file', conf)
+        osd0 = connection.get_connection('node1', container='osd0')
+        osd1 = connection.get_connection('node1', container='osd1')
+        host_conn = connection.get_connection('node1', deployment_type='ssh')
+        assert osd0 is not osd1
+        assert osd0.gateway is host_conn.gateway
+        assert osd1.gateway is host_conn.gateway
+        assert osd0.kw['eager'] is False
+        assert len(pool.connections) == 3
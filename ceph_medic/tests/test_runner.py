@@ -1,7 +1,11 @@
+import json
+import pytest
 import ceph_medic
 from ceph_medic import runner
+from ceph_medic.checks import registry
 from ceph_medic.tests import base_metadata
 from textwrap import dedent
+from ceph_medic.compat import StringIO
 from ceph_medic.util import configuration
 
 
@@ -189,3 +193,351 @@ class TestReportErrors(object):
         for line in terminal.calls:
             if line.lstrip().startswith(('E', 'W')):
                 assert line.endswith('\n')
+
+
+class TestIgnoredChecks(object):
+
+    def setup(self):
+        self.calls = []
+        runner.metadata = {
+            'nodes': {'osds': [{'host': 'node1'}]},
+            'osds': {'node1': {}},
+        }
+
+    def teardown(self):
+        runner.metadata = base_metadata
+
+    def register(self, monkeypatch, codes):
+        monkeypatch.setattr(runner.registry, 'checks', runner.registry.OrderedDict())
+        for code in codes:
+            def check(host, data, code=code):
+                self.calls.append(code)
+                return code, 'failed'
+            runner.registry.register(code, scope='osds')(check)
+
+    def test_ignored_checks_do_not_run(self, terminal, monkeypatch):
+        self.register(monkeypatch, ['WOSD1', 'WOSD2'])
+        run = runner.Runner()
+        run.ignore = ['WOSD1']
+        run.run_daemons('osds')
+        assert self.calls == ['WOSD2']
+
+    def test_ignored_checks_are_skipped(self, terminal, monkeypatch):
+        self.register(monkeypatch, ['WOSD1', 'WOSD2'])
+        run = runner.Runner()
+        run.ignore = ['WOSD1']
+        run.run_daemons('osds')
+        assert run.skipped == 1
+        assert run.warnings == 1
+
+
+class TestInventoryOrder(object):
+
+    def teardown(self):
+        runner.metadata = base_metadata
+
+    def test_follows_configured_nodes(self):
+        runner.metadata = {
+            'nodes': {'osds': [{'host': 'node2'}, {'host': 'node1'}]},
+            'osds': {'node1': {}, 'node2': {}},
+        }
+        assert runner.inventory_order('osds') == ['node2', 'node1']
+
+    def test_skips_hosts_without_metadata(self):
+        runner.metadata = {
+            'nodes': {'osds': [{'host': 'node2'}, {'host': 'node1'}]},
+            'osds': {'node1': {}},
+        }
+        assert runner.inventory_order('osds') == ['node1']
+
+    def test_unconfigured_hosts_go_last(self):
+        runner.metadata = {
+            'nodes': {'osds': [{'host': 'node2'}]},
+            'osds': {'node1': {}, 'node2': {}},
+        }
+        assert runner.inventory_order('osds') == ['node2', 'node1']
+
+
+class TestRunChecks(object):
+
+    def make_check(self, function):
+        function.__name__ = 'check_foo'
+        return registry.Check(function, 'WFOO1', 'warning', 'osds')
+
+    def run(self, function, ignore=None):
+        return runner.run_checks(
+            'node1', 'osds', [self.make_check(function)], ('node1', {}), ignore or [])
+
+    def test_counts_passed(self):
+        results = self.run(lambda h, d: None)
+        assert results.passed == 1
+        assert results.failures == []
+
+    def test_collects_failures(self):
+        results = self.run(lambda h, d: ('WFOO1', 'bad'))
+        failure = results.failures[0]
+        assert (failure.code, failure.message) == ('WFOO1', 'bad')
+
+    def test_skips_ignored_codes(self):
+        results = self.run(lambda h, d: ('WFOO2', 'bad'), ['WFOO2'])
+        assert results.skipped == 1
+        assert results.failures == []
+
+    def test_captures_errors(self):
+        def check(host, data):
+            raise ValueError('boom')
+        results = self.run(check)
+        assert len(results.internal_errors) == 1
+        assert results.results[0].status == 'internal_error'
+        assert results.results[0].message == 'ValueError: boom'
+
+    def test_severity_from_reported_code(self):
+        results = self.run(lambda h, d: ('EFOO1', 'bad'))
+        assert results.failures[0].severity == 'error'
+
+    def test_record(self):
+        results = self.run(lambda h, d: ('WFOO1', 'bad'))
+        record = results.results[0].to_dict()
+        duration = record.pop('duration')
+        assert duration >= 0
+        assert record == {
+            'type': 'result', 'host': 'node1', 'daemon_type': 'osds',
+            'check': 'check_foo', 'status': 'failed', 'code': 'WFOO1',
+            'severity': 'warning', 'message': 'bad', 'memory': None,
+        }
+
+
+class TestProfile(object):
+
+    def setup(self):
+        runner.metadata = {
+            'nodes': {'osds': [{'host': 'node1'}, {'host': 'node2'}]},
+            'osds': {'node1': {}, 'node2': {}},
+        }
+
+    def teardown(self):
+        runner.metadata = base_metadata
+
+    def register(self, monkeypatch):
+        monkeypatch.setattr(registry, 'checks', registry.OrderedDict())
+
+        def check_allocates(host, data):
+            return 'WOSD1', 'x' * 1024 * 100
+        registry.register('WOSD1', scope='osds')(check_allocates)
+
+        def check_passes(host, data):
+            pass
+        registry.register('WOSD2', scope='osds')(check_passes)
+
+    def test_not_profiling_by_default(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        run = runner.Runner(workers=1)
+        run.run_daemons('osds')
+        assert run.profiles == {}
+
+    def test_counts_calls(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        run = runner.Runner(workers=1)
+        run.profile = True
+        run.run_daemons('osds')
+        assert run.profiles['check_allocates'].calls == 2
+        assert run.profiles['check_passes'].calls == 2
+        assert run.profiles['check_passes'].total >= 0
+
+    @pytest.mark.skipif(not runner.can_trace_memory(), reason='needs tracemalloc.reset_peak')
+    def test_measures_memory(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        run = runner.Runner(workers=1)
+        run.profile = True
+        runner.tracemalloc.start()
+        try:
+            run.run_daemons('osds')
+        finally:
+            runner.tracemalloc.stop()
+        assert run.profiles['check_allocates'].memory >= 100 * 1024
+
+    def test_report_is_ranked(self, terminal):
+        run = runner.Runner(workers=1)
+        fast, slow = runner.CheckProfile('check_fast'), runner.CheckProfile('check_slow')
+        fast.add(runner.Result('node1', 'osds', 'check_fast', 'passed', duration=0.1))
+        slow.add(runner.Result('node1', 'osds', 'check_slow', 'passed', duration=2))
+        run.profiles = {'check_fast': fast, 'check_slow': slow}
+        runner.report_profile(run)
+        output = terminal.get_output()
+        assert output.index('check_slow') < output.index('check_fast')
+
+
+class TestMapReduce(object):
+
+    def setup(self):
+        runner.metadata = {
+            'nodes': {
+                'osds': [{'host': 'node1'}, {'host': 'node2'}, {'host': 'node3'}],
+                'mons': [{'host': 'node1'}],
+            },
+            'osds': {'node1': {'v': '12'}, 'node2': {'v': '13'}, 'node3': {'v': '12'}},
+            'mons': {'node1': {'v': '12'}},
+            'cluster_name': 'ceph',
+        }
+        self.calls = []
+
+    def teardown(self):
+        runner.metadata = base_metadata
+
+    def register(self, monkeypatch):
+        monkeypatch.setattr(registry, 'checks', registry.OrderedDict())
+
+        def version(host, data):
+            return data['v']
+
+        def check_versions(groups):
+            self.calls.append(groups)
+            if len(groups) > 1:
+                return 'EFOO1', 'versions differ:%s' % registry.format_groups(groups)
+        registry.map_reduce('EFOO1', version, scope='common')(check_versions)
+
+    def run(self, workers):
+        run = runner.Runner(workers=workers)
+        if workers > 1:
+            run.pool = runner.make_pool(workers)
+        try:
+            for daemon_type in ['osds', 'mons']:
+                run.run_daemons(daemon_type)
+            run.run_cluster([], registry.get_reducers())
+        finally:
+            if run.pool is not None:
+                run.pool.terminate()
+        return run
+
+    def test_groups_hosts_by_key(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        run = self.run(1)
+        assert run.groups['check_versions'] == {'12': ['node1', 'node3'], '13': ['node2']}
+
+    def test_reduce_runs_once(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        run = self.run(1)
+        assert len(self.calls) == 1
+        assert run.errors == 1
+        assert 'EFOO1' in terminal.get_output()
+        assert '13: node2' in terminal.get_output()
+
+    def test_maps_in_workers(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        run = self.run(2)
+        assert run.groups['check_versions'] == {'12': ['node1', 'node3'], '13': ['node2']}
+
+    def test_ignored_reducers_do_not_map(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        run = runner.Runner(workers=1)
+        run.ignore = ['EFOO1']
+        run.run_daemons('osds')
+        assert run.groups == {}
+
+
+class TestStream(object):
+
+    def setup(self):
+        runner.metadata = {
+            'nodes': {'osds': [{'host': 'node1'}]},
+            'osds': {'node1': {}},
+        }
+
+    def teardown(self):
+        runner.metadata = base_metadata
+
+    def test_streams_every_result(self, terminal, monkeypatch):
+        monkeypatch.setattr(registry, 'checks', registry.OrderedDict())
+        registry.register('WOSD1', scope='osds')(lambda h, d: ('WOSD1', 'bad'))
+        registry.register('WOSD2', scope='osds')(lambda h, d: None)
+        stream = StringIO()
+        run = runner.Runner(workers=1)
+        run.stream = stream
+        run.run_daemons('osds')
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert [r['status'] for r in records] == ['failed', 'passed']
+        assert records[0]['daemon_type'] == 'osds'
+
+    def test_summary(self):
+        run = runner.Runner(workers=1)
+        run.errors = 2
+        run.passed = 3
+        result = runner.summary(run)
+        assert result['type'] == 'summary'
+        assert result['errors'] == 2
+        assert result['passed'] == 3
+        assert result['hosts'] == 1
+        json.dumps(result)
+
+
+class TestMakePool(object):
+
+    def test_workers_are_forked(self, monkeypatch):
+        contexts = []
+        get_context = runner.multiprocessing.get_context
+
+        def record(method=None):
+            contexts.append(method)
+            return get_context(method)
+        monkeypatch.setattr(runner.multiprocessing, 'get_context', record)
+        pool = runner.make_pool(2)
+        pool.terminate()
+        assert contexts == ['fork']
+
+
+class TestParallelChecks(object):
+
+    def setup(self):
+        hosts = ['node%s' % i for i in range(6)]
+        runner.metadata = {
+            'nodes': {'osds': [{'host': host} for host in reversed(hosts)]},
+            'osds': dict((host, {'fail': i % 2}) for i, host in enumerate(hosts)),
+        }
+
+    def teardown(self):
+        runner.metadata = base_metadata
+
+    def register(self, monkeypatch):
+        monkeypatch.setattr(registry, 'checks', registry.OrderedDict())
+
+        def check_fails(host, data):
+            if data['fail']:
+                return 'WOSD1', 'failed on %s' % host
+        registry.register('WOSD1', scope='osds')(check_fails)
+
+        def check_errors(host, data):
+            raise ValueError(host)
+        registry.register('WOSD2', scope='osds')(check_errors)
+
+    def run(self, workers):
+        run = runner.Runner(workers=workers)
+        if workers > 1:
+            run.pool = runner.make_pool(workers)
+        try:
+            run.run_daemons('osds')
+        finally:
+            if run.pool is not None:
+                run.pool.terminate()
+        return run
+
+    def test_same_output_as_serial(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        self.run(1)
+        serial = terminal.calls[:]
+        del terminal.calls[:]
+        self.run(3)
+        assert terminal.calls == serial
+
+    def test_merges_counters(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        run = self.run(3)
+        # checks with unhandled errors don't report a failure, so they pass
+        assert run.passed == 9
+        assert run.warnings == 3
+        assert len(run.internal_errors) == 6
+
+    def test_inventory_order(self, terminal, monkeypatch):
+        self.register(monkeypatch)
+        self.run(3)
+        failed = [line for line in terminal.calls if line.strip().startswith('WOSD1')]
+        assert failed[0].strip() == 'WOSD1: failed on node5'
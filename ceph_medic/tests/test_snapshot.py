@@ -0,0 +1,95 @@
+import gzip
+import json
+import os
+import pytest
+from ceph_medic import snapshot
+
+
+def make_metadata():
+    return {
+        'cluster_name': 'ceph',
+        'failed_nodes': {'osd9': 'unreachable'},
+        'nodes': {'mons': [{'host': 'mon0'}]},
+        'mons': {'mon0': {'ceph': {'version': '14.2.0', 'sockets': {}}}},
+        'osds': {},
+        'cluster': {'status': {'fsid': '1234'}},
+    }
+
+
+class TestSave(object):
+
+    def test_writes_a_versioned_snapshot(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'snapshot.gz')
+        snapshot.save(path, make_metadata())
+        with gzip.open(path, 'rb') as f:
+            contents = json.loads(f.read().decode('utf-8'))
+        assert contents['version'] == snapshot.SNAPSHOT_VERSION
+        assert contents['metadata']['cluster_name'] == 'ceph'
+
+    def test_missing_directory(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'missing', 'snapshot.gz')
+        with pytest.raises(RuntimeError) as error:
+            snapshot.save(path, make_metadata())
+        assert 'unable to save snapshot' in str(error.value)
+
+
+class TestCheckWritable(object):
+
+    def test_new_file_is_not_created(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'snapshot.gz')
+        snapshot.check_writable(path)
+        assert not os.path.exists(path)
+
+    def test_existing_file(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'snapshot.gz')
+        snapshot.save(path, make_metadata())
+        snapshot.check_writable(path)
+
+    def test_missing_directory(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'missing', 'snapshot.gz')
+        with pytest.raises(RuntimeError) as error:
+            snapshot.check_writable(path)
+        assert 'does not exist' in str(error.value)
+
+    def test_directory(self, tmpdir):
+        with pytest.raises(RuntimeError) as error:
+            snapshot.check_writable(str(tmpdir))
+        assert 'is a directory' in str(error.value)
+
+
+class TestLoad(object):
+
+    def test_round_trip(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'snapshot.gz')
+        snapshot.save(path, make_metadata())
+        assert snapshot.load(path) == make_metadata()
+
+    def test_missing_file(self, tmpdir):
+        with pytest.raises(RuntimeError):
+            snapshot.load(os.path.join(str(tmpdir), 'missing.gz'))
+
+    def test_invalid_file(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'snapshot.gz')
+        with open(path, 'w') as f:
+            f.write('not a snapshot')
+        with pytest.raises(RuntimeError):
+            snapshot.load(path)
+
+    def test_unsupported_version(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'snapshot.gz')
+        with gzip.open(path, 'wb') as f:
+            f.write(json.dumps({'version': 0, 'metadata': {}}).encode('utf-8'))
+        with pytest.raises(RuntimeError) as error:
+            snapshot.load(path)
+        assert 'unsupported snapshot version' in str(error.value)
+
+
+class TestRestore(object):
+
+    def test_replaces_metadata_in_place(self, tmpdir, monkeypatch):
+        current = {'cluster_name': 'other', 'rgws': {'rgw0': {}}}
+        monkeypatch.setattr(snapshot, 'metadata', current)
+        path = os.path.join(str(tmpdir), 'snapshot.gz')
+        snapshot.save(path, make_metadata())
+        snapshot.restore(path)
+        assert current == make_metadata()
@@ -0,0 +1,52 @@
+import pytest
+import ceph_medic
+from ceph_medic import runner, checks
+from ceph_medic.checks import index
+from ceph_medic.tests import synthetic
+from ceph_medic.util import configuration
+
+
+@pytest.fixture
+def cluster(monkeypatch):
+    """
+    Make the generated metadata the one that the runner and every check use
+    """
+    def install(**kw):
+        generated = synthetic.make_metadata(**kw)
+        for module in [runner, index, checks.common, checks.mons, checks.osds, checks.cluster]:
+            monkeypatch.setattr(module, 'metadata', generated)
+        monkeypatch.setattr(ceph_medic.config, 'file', configuration.load_string('[global]\n'), raising=False)
+        return generated
+    return install
+
+
+class TestMakeMetadata(object):
+
+    def test_shape(self):
+        generated = synthetic.make_metadata(mons=5, osd_hosts=7, osds_per_host=3)
+        assert len(generated['mons']) == 5
+        assert len(generated['osds']) == 7
+        assert len(generated['osds']['osd6']['ceph']['sockets']) == 3
+
+    def test_nodes_match_metadata(self):
+        generated = synthetic.make_metadata(mgrs=2)
+        for daemon_type, nodes in generated['nodes'].items():
+            assert sorted(n['host'] for n in nodes) == sorted(generated[daemon_type])
+
+    def test_config_keys(self):
+        generated = synthetic.make_metadata(osd_hosts=1, config_keys=10)
+        sockets = generated['osds']['osd0']['ceph']['sockets']
+        config = list(sockets.values())[0]['config']
+        assert 'option_0009' in config
+        assert config['fsid'] == synthetic.FSID
+
+
+class TestRunner(object):
+
+    def test_healthy_cluster_has_no_errors(self, cluster, terminal):
+        cluster(mons=3, osd_hosts=6, osds_per_host=2, mgrs=1, rgws=1, config_keys=10)
+        results = runner.Runner(workers=1).run()
+        assert results.internal_errors == []
+        assert results.errors == 0
+        assert results.warnings == 0
+        assert results.passed > 0
@@ -1,3 +1,5 @@
+import threading
+import pytest
 from ceph_medic import terminal
 
 
@@ -34,3 +36,74 @@ class TestWriteClearLine(object):
     def test_long_line_adds_only_ten_chars(self):
         self.loader.write('1'*81)
         assert self.fake_writer.calls[0][82:] == ' ' * 10
+
+
+class TestBuffer(object):
+
+    def setup(self):
+        self.fake_writer = FakeWriter()
+        self.buffer = terminal._Buffer(self.fake_writer, size=10)
+
+    def test_small_writes_are_held(self):
+        self.buffer.write('123')
+        self.buffer.write('456')
+        assert self.fake_writer.calls == []
+
+    def test_writes_are_batched_when_full(self):
+        for i in range(5):
+            self.buffer.write('123')
+        assert self.fake_writer.calls == ['123123123123']
+
+    def test_flush_writes_pending(self):
+        self.buffer.write('123')
+        self.buffer.write('456')
+        self.buffer.flush()
+        assert self.fake_writer.calls == ['123456']
+
+    def test_flush_with_nothing_pending(self):
+        self.buffer.flush()
+        assert self.fake_writer.calls == []
+
+    def test_concurrent_writes_are_not_lost(self):
+        buffer = terminal._Buffer(self.fake_writer, size=100)
+
+        def write():
+            for i in range(1000):
+                buffer.write('line\n')
+        threads = [threading.Thread(target=write) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        buffer.flush()
+        assert ''.join(self.fake_writer.calls).count('line\n') == 8000
+
+    def test_loader_writes_through_buffer(self):
+        loader = terminal._Write(_writer=self.buffer, prefix='\r', clear_line=True)
+        loader.write('1234567890')
+        self.buffer.flush()
+        assert len(self.fake_writer.calls[0]) == 81
+
+
+class TestColors(object):
+
+    def test_plain_string_when_not_a_tty(self, monkeypatch):
+        monkeypatch.setattr(terminal, 'use_colors', False)
+        result = terminal.red('foo')
+        assert result == 'foo'
+        assert type(result) is str
+
+    def test_colored_when_a_tty(self, monkeypatch):
+        monkeypatch.setattr(terminal, 'use_colors', True)
+        monkeypatch.setattr(terminal, '_isatty', lambda stream: True)
+        assert terminal.red('foo') == '\033[91mfoo\033[0m'
+
+    def test_make_builds_colors_lazily(self):
+        string = terminal.colorize.make('foo')
+        assert 'red' not in string.__dict__
+        assert string.red in ('foo', '\033[91mfoo\033[0m')
+
+    def test_unknown_color(self):
+        string = terminal.colorize.make('foo')
+        with pytest.raises(AttributeError):
+            string.purple
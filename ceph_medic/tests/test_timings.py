@@ -0,0 +1,75 @@
+from ceph_medic import timings
+
+
+def make_metadata():
+    return {
+        'mons': {
+            'mon0': {'timings': {'connect': 1.0, 'paths:/etc/ceph': 0.5, 'total': 2.0}},
+        },
+        'osds': {
+            'osd0': {'timings': {'connect': 0.5, 'sockets': 4.0, 'total': 5.0}},
+            'osd1': {'timings': {}},
+        },
+        'clients': {},
+    }
+
+
+class TestPercentile(object):
+
+    def test_no_values(self):
+        assert timings.percentile([], 50) is None
+
+    def test_single_value(self):
+        assert timings.percentile([3], 99) == 3
+
+    def test_nearest_rank(self):
+        values = list(range(1, 11))
+        assert timings.percentile(values, 50) == 5
+        assert timings.percentile(values, 90) == 9
+        assert timings.percentile(values, 99) == 10
+
+    def test_unsorted(self):
+        assert timings.percentile([9, 1, 5], 50) == 5
+
+
+class TestSummarize(object):
+
+    def test_skips_hosts_without_timings(self):
+        summary = timings.summarize(make_metadata())
+        assert summary['hosts'] == 2
+
+    def test_slowest_hosts(self):
+        summary = timings.summarize(make_metadata())
+        assert summary['slowest_hosts'] == [(5.0, 'osd0'), (2.0, 'mon0')]
+
+    def test_slowest_phases_exclude_total(self):
+        summary = timings.summarize(make_metadata())
+        assert summary['slowest_phases'][0] == (4.0, 'osd0', 'sockets')
+        assert 'total' not in [p[2] for p in summary['slowest_phases']]
+
+    def test_phases_are_grouped(self):
+        summary = timings.summarize(make_metadata())
+        assert summary['phases']['connect']['count'] == 2
+        assert summary['phases']['connect']['sum'] == 1.5
+        assert 'paths' in summary['phases']
+
+    def test_limit(self):
+        summary = timings.summarize(make_metadata(), limit=1)
+        assert len(summary['slowest_hosts']) == 1
+
+    def test_totals(self):
+        summary = timings.summarize(make_metadata())
+        assert summary['total']['max'] == 5.0
+
+
+class TestReport(object):
+
+    def test_no_timings(self, terminal):
+        timings.report(timings.summarize({}))
+        assert 'no timings were recorded' in terminal.get_output()
+
+    def test_reports_hosts(self, terminal):
+        timings.report(timings.summarize(make_metadata()))
+        output = terminal.get_output()
+        assert 'osd0' in output
+        assert 'sockets' in output
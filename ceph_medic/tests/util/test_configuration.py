@@ -112,3 +112,30 @@ class TestLoadString(object):
         """)
         conf = configuration.load_string(contents)
         assert conf.get_safe('global', 'some_key_here') == 'ceph'
+
+
+class TestLoadStringCached(object):
+
+    def test_same_contents_are_parsed_once(self, monkeypatch):
+        calls = []
+        load_string = configuration.load_string
+
+        def counting(contents):
+            calls.append(contents)
+            return load_string(contents)
+        monkeypatch.setattr(configuration, 'load_string', counting)
+        first = configuration.load_string_cached('[global]\nfsid = 1234\n')
+        second = configuration.load_string_cached('[global]\nfsid = 1234\n')
+        assert first is second
+        assert len(calls) == 1
+
+    def test_different_contents(self):
+        first = configuration.load_string_cached('[global]\nfsid = 1234\n')
+        second = configuration.load_string_cached('[global]\nfsid = 5678\n')
+        assert second.get_safe('global', 'fsid') == '5678'
+        assert first is not second
+
+    def test_clear_cache(self):
+        first = configuration.load_string_cached('[global]\nfsid = 1234\n')
+        configuration.clear_cache()
+        assert configuration.load_string_cached('[global]\nfsid = 1234\n') is not first
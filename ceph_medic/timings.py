@@ -0,0 +1,119 @@
+"""
+Summarize the time spent collecting information from each node, using the
+per-phase timings the collector stores in the metadata of every host::
+
+    'timings': {
+        'connect': 0.81,
+        'paths:/etc/ceph': 0.12,
+        'paths:/var/lib/ceph': 1.5,
+        'paths:/var/run/ceph': 0.1,
+        'ceph': 0.4,
+        'sockets': 2.1,
+        'socket:/var/run/ceph/ceph-osd.0.asok': 1.9,
+        'total': 5.1,
+    }
+
+Phases that have a ``:`` in their name (like ``paths:/etc/ceph``) are also
+grouped by the part before it, so that all the paths or all the sockets can be
+compared across hosts.
+"""
+import math
+from ceph_medic import metadata, daemon_types, terminal
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a list of values, ``None`` if there are none
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def host_timings(_metadata=None):
+    """
+    Return a list of ``(host, timings)`` for every collected host that has
+    timings recorded
+    """
+    _metadata = _metadata if _metadata is not None else metadata
+    result = []
+    for daemon_type in daemon_types:
+        for host, data in _metadata.get(daemon_type, {}).items():
+            timings = data.get('timings')
+            if timings:
+                result.append((host, timings))
+    return result
+
+
+def summarize(_metadata=None, limit=10):
+    """
+    Build a summary of the collection timings with the total time percentiles,
+    the slowest hosts, the slowest single phases, and per-phase aggregates
+    """
+    hosts = host_timings(_metadata)
+    totals = [timings.get('total', 0) for _, timings in hosts]
+
+    phases = []
+    grouped = {}
+    for host, timings in hosts:
+        for phase, duration in timings.items():
+            if phase == 'total':
+                continue
+            phases.append((duration, host, phase))
+            grouped.setdefault(phase.split(':')[0], []).append(duration)
+
+    slowest_hosts = sorted(
+        ((timings.get('total', 0), host) for host, timings in hosts),
+        reverse=True)[:limit]
+    slowest_phases = sorted(phases, reverse=True)[:limit]
+    per_phase = dict(
+        (phase, {
+            'count': len(durations),
+            'sum': sum(durations),
+            'p50': percentile(durations, 50),
+            'p90': percentile(durations, 90),
+            'max': max(durations),
+        }) for phase, durations in grouped.items()
+    )
+
+    return {
+        'hosts': len(hosts),
+        'total': {
+            'p50': percentile(totals, 50),
+            'p90': percentile(totals, 90),
+            'p99': percentile(totals, 99),
+            'max': max(totals) if totals else None,
+        },
+        'slowest_hosts': slowest_hosts,
+        'slowest_phases': slowest_phases,
+        'phases': per_phase,
+    }
+
+
+def report(summary):
+    terminal.write.bold('\n{title:-^30}\n'.format(title=' collection timings '))
+    if not summary['hosts']:
+        terminal.write.raw(' no timings were recorded')
+        return
+    total = summary['total']
+    terminal.write.raw(
+        ' hosts: %s    p50: %.2fs    p90: %.2fs    p99: %.2fs    max: %.2fs' % (
+            summary['hosts'], total['p50'], total['p90'], total['p99'], total['max'])
+    )
+
+    terminal.write.raw('\n Slowest hosts:')
+    for duration, host in summary['slowest_hosts']:
+        terminal.write.raw('   %-40s %10.2fs' % (host, duration))
+
+    terminal.write.raw('\n Slowest phases:')
+    for duration, host, phase in summary['slowest_phases']:
+        terminal.write.raw('   %-30s %-40s %10.2fs' % (host, phase, duration))
+
+    terminal.write.raw('\n Per phase (all hosts):')
+    terminal.write.raw('   %-12s %6s %10s %10s %10s %10s' % ('phase', 'count', 'sum', 'p50', 'p90', 'max'))
+    ordered = sorted(summary['phases'].items(), key=lambda i: i[1]['sum'], reverse=True)
+    for phase, stats in ordered:
+        terminal.write.raw('   %-12s %6s %9.2fs %9.2fs %9.2fs %9.2fs' % (
+            phase, stats['count'], stats['sum'], stats['p50'], stats['p90'], stats['max']))
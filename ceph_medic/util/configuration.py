@@ -34,6 +34,28 @@ medic_conf_template = """
 # What type of deployment is the cluster using? Valid values are:
 # baremetal, container, openshift, kubernetes
 # deployment_type = baremetal
+#
+# Number of hosts to collect information from at the same time. Higher values
+# speed up collection on large clusters at the cost of more open connections
+# collection_workers = 10
+#
+# Maximum number of seconds to spend collecting information from a single
+# node, nodes that take longer are reported as failed. No limit when unset
+# collection_timeout = 600
+#
+# Directory to cache the contents of collected files in, so that only files
+# that changed since the previous run are transferred again. Caching is
+# disabled unless this is set
+# collection_cache = ~/.cache/ceph-medic
+#
+# Daemons report well over a thousand configuration keys through their admin
+# sockets, only the ones that checks use are collected unless this is enabled
+# (for example, to save a snapshot with the full configuration)
+# full_socket_config = false
+#
+# Number of processes to run host checks in. Checks for every host run one
+# after the other in a single process by default
+# check_workers = 1
 
 [check]
 # Overrides for some of ceph-medic's check flags, like what errors or warnings
@@ -134,6 +156,29 @@ def load_string(conf_as_string):
     return load(file=_TrimIndentFile(file_obj))
 
 
+# parsed configurations, keyed by their contents. Hosts in a cluster usually
+# share the same ceph.conf (and monitors the same keyring), so each distinct
+# file is parsed once no matter how many hosts or checks ask for it
+_parsed = {}
+
+
+def load_string_cached(conf_as_string):
+    """
+    Same as ``load_string``, but the parsed object is shared with every other
+    caller asking for the same contents, so it must not be modified. The
+    cache lasts until ``clear_cache()`` is called.
+    """
+    try:
+        return _parsed[conf_as_string]
+    except KeyError:
+        conf = _parsed[conf_as_string] = load_string(conf_as_string)
+        return conf
+
+
+def clear_cache():
+    _parsed.clear()
+
+
 def load(path=None, file=None):
     parser = Conf()
     try:
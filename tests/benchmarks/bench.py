@@ -0,0 +1,212 @@
+"""
+Time ``Runner.run``, every check scope, and memory use, against synthetic
+clusters of different shapes (see ``ceph_medic.tests.synthetic``)::
+
+    python tests/benchmarks/bench.py --shape medium
+    python tests/benchmarks/bench.py --mons 5 --osd-hosts 2000 --osds-per-host 24
+
+Results are appended as JSON lines to a history file (``--history``), and
+every run is compared with the previous one recorded for the same shape, so
+that regressions show up as the code changes.
+"""
+from __future__ import print_function
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import ceph_medic  # noqa
+from ceph_medic import daemon_types, runner, terminal  # noqa
+from ceph_medic.checks import index, registry  # noqa
+from ceph_medic.tests import synthetic  # noqa
+from ceph_medic.util import configuration  # noqa
+
+
+shapes = {
+    'small': dict(mons=3, osd_hosts=10, osds_per_host=4, mgrs=2, rgws=2),
+    'medium': dict(mons=5, osd_hosts=200, osds_per_host=12, mgrs=2, rgws=4),
+    'large': dict(mons=5, osd_hosts=2000, osds_per_host=24, mgrs=3, rgws=8),
+}
+
+default_history = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.jsonl')
+
+
+def install(generated):
+    """
+    Modules hold a reference to the global metadata, so it is replaced in place
+    """
+    ceph_medic.metadata.clear()
+    ceph_medic.metadata.update(generated)
+
+
+def silence_terminal():
+    devnull = open(os.devnull, 'w')
+    terminal.write._writer = devnull
+    terminal.loader._writer = devnull
+
+
+def timed(function, repeat):
+    """
+    Best wall time of ``repeat`` calls to ``function``
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_scope(scope):
+    """
+    Run every check of ``scope`` once for all the hosts it applies to
+    """
+    metadata = ceph_medic.metadata
+    checks = registry.get_checks(scope)
+    index.build(metadata)
+    try:
+        if scope == 'cluster':
+            for check in checks:
+                check()
+            return
+        for daemon_type in daemon_types:
+            if scope not in ('common', daemon_type):
+                continue
+            for host, data in metadata.get(daemon_type, {}).items():
+                for check in checks:
+                    check(host, data)
+    finally:
+        index.clear()
+        configuration.clear_cache()
+
+
+def peak_memory(function):
+    """
+    Peak memory allocated while running ``function`` in KiB, using
+    tracemalloc when available, or the max RSS of the process otherwise
+    """
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+    function()
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode('utf-8').strip()
+    except Exception:
+        return None
+
+
+def previous(history, shape):
+    if not os.path.exists(history):
+        return None
+    last = None
+    with open(history) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('shape') == shape:
+                last = record
+    return last
+
+
+def compare(name, value, before):
+    if not before or not before.get(name):
+        return ''
+    change = (value - before[name]) / float(before[name]) * 100
+    return '%+.1f%%' % change
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--shape', choices=sorted(shapes), default='small')
+    parser.add_argument('--mons', type=int)
+    parser.add_argument('--osd-hosts', type=int)
+    parser.add_argument('--osds-per-host', type=int)
+    parser.add_argument('--config-keys', type=int, default=1500)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history', default=default_history)
+    parser.add_argument('--no-history', action='store_true')
+    args = parser.parse_args(argv)
+
+    shape = dict(shapes[args.shape])
+    for key in ('mons', 'osd_hosts', 'osds_per_host'):
+        if getattr(args, key) is not None:
+            shape[key] = getattr(args, key)
+    shape['config_keys'] = args.config_keys
+    shape_name = ','.join('%s=%s' % (k, shape[k]) for k in sorted(shape))
+
+    ceph_medic.config.file = configuration.load_string('[global]\n')
+    silence_terminal()
+
+    start = time.time()
+    install(synthetic.make_metadata(**shape))
+    generate_time = time.time() - start
+
+    def run():
+        run = runner.Runner(workers=args.workers)
+        run.run()
+        return run
+
+    results = {'generate': generate_time}
+    results['runner'] = timed(run, args.repeat)
+    for scope in registry.checks:
+        results['scope:%s' % scope] = timed(lambda: run_scope(scope), args.repeat)
+    memory = peak_memory(run)
+
+    record = {
+        'timestamp': time.time(),
+        'commit': commit(),
+        'python': '.'.join(str(i) for i in sys.version_info[:3]),
+        'shape': shape_name,
+        'workers': args.workers,
+        'results': results,
+        'memory_kib': memory,
+    }
+
+    before = previous(args.history, shape_name)
+    before_results = before['results'] if before else None
+    print('shape: %s' % shape_name)
+    for name in sorted(results):
+        print('  %-20s %10.3fs  %s' % (name, results[name], compare(name, results[name], before_results)))
+    if memory is not None:
+        print('  %-20s %10s KiB' % ('peak memory', memory))
+
+    if not args.no_history:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()